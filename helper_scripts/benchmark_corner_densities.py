@@ -0,0 +1,95 @@
+"""Times an event's corner plots drawn by corner (NRsurResult) vs the binned density engine
+
+    python benchmark_corner_densities.py GW150914 --cache-dir .nrsur_catalog_cache
+
+Both paths draw (and save) the event page's corner plots (and its LVK-comparison
+plots, if the event's LVK posterior is in the cache) into --outdir, so they can be
+compared by eye.
+"""
+import argparse
+import os
+import time
+
+import matplotlib
+
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+from nrsur_catalog.cache import CatalogCache
+from nrsur_catalog.nrsur_result import NRsurResult
+
+from nrsur_catalog_webbuilder import corner_densities
+
+PARAM_SETS = dict(
+    mass=["mass_1_source", "mass_2_source", "mass_ratio"],
+    spin=["a_1", "a_2", "tilt_1", "tilt_2"],
+    effective_spin=["mass_ratio", "chi_eff", "chi_p"],
+    sky_localisation=["luminosity_distance", "ra", "dec"],
+    remnant=["final_mass", "final_spin", "final_kick"],
+)
+
+
+def draw_all(result, plot_corner, plot_lvk_comparison_corner, outdir, prefix, compare):
+    for name, params in PARAM_SETS.items():
+        fig = plot_corner(result, params)
+        fig.savefig(f"{outdir}/{prefix}_{name}_corner.png")
+        plt.close(fig)
+        if compare and name != "remnant":
+            fig = plot_lvk_comparison_corner(result, params)
+            fig.savefig(f"{outdir}/{prefix}_compare_{name}_corner.png")
+            plt.close(fig)
+
+
+def timed(label, func, *args):
+    t0 = time.perf_counter()
+    func(*args)
+    dt = time.perf_counter() - t0
+    print(f"{label:>30s}: {dt:.2f}s")
+    return dt
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("event_name")
+    parser.add_argument("--cache-dir", default=".nrsur_catalog_cache")
+    parser.add_argument("--outdir", default="corner_benchmark")
+    args = parser.parse_args()
+    os.makedirs(args.outdir, exist_ok=True)
+
+    result = NRsurResult.load(args.event_name, cache_dir=args.cache_dir)
+    compare = bool(CatalogCache(args.cache_dir).find(args.event_name, lvk_posteriors=True))
+    if compare:
+        result.lvk_result  # load it (once) outside of the timings
+    print(f"{args.event_name}: {len(result.posterior)} samples, comparison plots: {compare}")
+
+    corner_time = timed(
+        "corner (NRsurResult)",
+        draw_all,
+        result,
+        lambda r, p: r.plot_corner(p),
+        lambda r, p: r.plot_lvk_comparison_corner(p),
+        args.outdir,
+        "corner",
+        compare,
+    )
+    prepare_time = timed(
+        "densities (one pass)",
+        corner_densities.prepare_densities,
+        result,
+        list(PARAM_SETS.values()),
+        [p for n, p in PARAM_SETS.items() if n != "remnant"] if compare else [],
+    )
+    draw_time = timed(
+        "binned engine (drawing)",
+        draw_all,
+        result,
+        corner_densities.plot_corner,
+        corner_densities.plot_lvk_comparison_corner,
+        args.outdir,
+        "binned",
+        compare,
+    )
+    print(f"{'speedup':>30s}: {corner_time / (prepare_time + draw_time):.1f}x")
+
+
+if __name__ == "__main__":
+    main()
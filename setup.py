@@ -10,6 +10,7 @@ INSTALL_REQUIRES = [
     "nrsur_catalog",
     "jupyter-book>=0.13.2",
     "ploomber-engine>=0.0.23",
+    "psutil",  # for ploomber's memory profiling + the build's memory budget
     "tabulate",
     "jupytext",  # for converting py-ipynb
     "ghp-import",  # for publishing to github pages
@@ -38,6 +39,7 @@ setup(
         "console_scripts": [
             f"build_nrsur_website={NAME}.build_website:main",
             f"build_gwpage={NAME}.build_website:gwpage_main",
+            f"nrsur_build_trace={NAME}.build_trace:main",
         ]
     },
 )
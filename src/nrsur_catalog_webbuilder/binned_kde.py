@@ -0,0 +1,186 @@
+"""Module with a batched, binned (FFT) Gaussian KDE engine for the catalog's violins
+
+`Catalog.violin_plot` (through `Axes.violinplot`) evaluates a direct Gaussian
+KDE of every event's samples at 100 points: O(samples x points) per event and
+parameter, for every violin figure. Its densities also leak past the physical
+bounds of eg mass_ratio (<= 1) or the spins (in [0, 1]), so the violins of
+events near a bound are flattened there.
+
+Here the densities of all the events of a parameter are computed together:
+- each event's samples are linearly binned on its own grid (of GRID_SIZE points,
+  spanning its samples and BW_CUT bandwidths on either side, or up to the
+  parameter's bound), all the events in one `np.bincount`,
+- the samples near a bound are reflected about it (their binned counts are
+  mirrored about the grid's end),
+- the binned counts of all the events are convolved with their (Scott's rule)
+  Gaussian kernels in one batched FFT (each kernel's Fourier transform is
+  analytic), and the densities are interpolated at the violins' points.
+
+`violin_stats` is a drop-in for `matplotlib.cbook.violin_stats` (the stats drawn
+by `Axes.violin`).
+"""
+
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy.fft import irfft, next_fast_len, rfft, rfftfreq
+
+Bounds = Tuple[Optional[float], Optional[float]]
+
+GRID_SIZE = 512
+# the kernel's extent (bandwidths) past the samples
+BW_CUT = 4.0
+# the violins' points (as `Axes.violinplot`)
+POINTS = 100
+
+# the parameters' physical bounds (the densities are reflected about them)
+PARAMETER_BOUNDS: Dict[str, Bounds] = dict(
+    mass_1=(0.0, None),
+    mass_2=(0.0, None),
+    mass_1_source=(0.0, None),
+    mass_2_source=(0.0, None),
+    chirp_mass=(0.0, None),
+    total_mass=(0.0, None),
+    chirp_mass_source=(0.0, None),
+    total_mass_source=(0.0, None),
+    mass_ratio=(0.0, 1.0),
+    a_1=(0.0, 1.0),
+    a_2=(0.0, 1.0),
+    tilt_1=(0.0, np.pi),
+    tilt_2=(0.0, np.pi),
+    chi_eff=(-1.0, 1.0),
+    chi_p=(0.0, 1.0),
+    dec=(-np.pi / 2, np.pi / 2),
+    luminosity_distance=(0.0, None),
+    zenith=(0.0, np.pi),
+    theta_jn=(0.0, np.pi),
+    final_mass=(0.0, None),
+    final_spin=(0.0, 1.0),
+    final_kick=(0.0, None),
+)
+
+
+def parameter_bounds(parameter: str) -> Bounds:
+    return PARAMETER_BOUNDS.get(parameter, (None, None))
+
+
+def scott_bandwidth(x: np.ndarray) -> float:
+    """The Gaussian kernel's standard deviation (as `mlab.GaussianKDE`'s 'scott')"""
+    return float(np.std(x, ddof=1) * len(x) ** (-1.0 / 5))
+
+
+def binned_kdes(
+    samples: Sequence[np.ndarray],
+    coords: np.ndarray,
+    bounds: Bounds = (None, None),
+    grid_size: int = GRID_SIZE,
+) -> np.ndarray:
+    """The KDEs of each of the samples (finite, with distinct values), evaluated at
+    its row of coords (a [len(samples), points] array)
+
+    bounds: (lower, upper), the samples' densities are reflected about them
+    """
+    lower, upper = bounds
+    n_events, m = len(samples), grid_size
+    n = np.array([len(x) for x in samples])
+    bw = np.array([scott_bandwidth(x) for x in samples])
+    x_min = np.array([np.min(x) for x in samples])
+    x_max = np.array([np.max(x) for x in samples])
+
+    # each event's grid (reflected at a bound within the kernel's reach)
+    lo, hi = x_min - BW_CUT * bw, x_max + BW_CUT * bw
+    reflect_lo = np.zeros(n_events, dtype=bool)
+    reflect_hi = np.zeros(n_events, dtype=bool)
+    if lower is not None:
+        reflect_lo = lo < lower
+        lo = np.where(reflect_lo, lower, lo)
+    if upper is not None:
+        reflect_hi = hi > upper
+        hi = np.where(reflect_hi, upper, hi)
+    dx = (hi - lo) / (m - 1)
+
+    # linear binning of all the events' samples
+    event = np.repeat(np.arange(n_events), n)
+    pos = (np.concatenate(samples) - lo[event]) / dx[event]
+    j = np.clip(np.floor(pos).astype(int), 0, m - 2)
+    w = np.clip(pos - j, 0.0, 1.0)
+    index = event * m + j
+    counts = np.bincount(index, 1 - w, minlength=n_events * m)
+    counts += np.bincount(index + 1, w, minlength=n_events * m)
+    counts = counts.reshape(n_events, m)
+
+    # [reflected counts about lo | counts | reflected counts about hi], zero padded
+    # so the kernels' tails do not wrap around onto the counts
+    sigma = bw / dx  # in grid points
+    size = next_fast_len(max(3 * m, 2 * m + int(np.ceil(BW_CUT * sigma.max())) + 1))
+    extended = np.zeros((n_events, size))
+    extended[:, m : 2 * m] = counts
+    extended[:, 1 : m + 1] += np.where(reflect_lo[:, None], counts[:, ::-1], 0.0)
+    extended[:, 2 * m - 1 : 3 * m - 1] += np.where(
+        reflect_hi[:, None], counts[:, ::-1], 0.0
+    )
+
+    freqs = rfftfreq(size)
+    kernels = np.exp(-2 * (np.pi * sigma[:, None] * freqs[None, :]) ** 2)
+    smoothed = irfft(rfft(extended, axis=1) * kernels, n=size, axis=1)[:, m : 2 * m]
+    density = np.maximum(smoothed, 0.0) / (n * dx)[:, None]
+
+    # linear interpolation at the coords
+    pos = np.clip((coords - lo[:, None]) / dx[:, None], 0, m - 1)
+    j = np.clip(np.floor(pos).astype(int), 0, m - 2)
+    w = pos - j
+    left = np.take_along_axis(density, j, axis=1)
+    right = np.take_along_axis(density, j + 1, axis=1)
+    return (1 - w) * left + w * right
+
+
+def violin_stats(
+    samples: Sequence[np.ndarray],
+    bounds: Bounds = (None, None),
+    points: int = POINTS,
+    grid_size: int = GRID_SIZE,
+) -> List[dict]:
+    """The stats of `Axes.violin` (as `matplotlib.cbook.violin_stats`), with the
+    densities of all the samples computed by `binned_kdes`"""
+    samples = [np.asarray(x, dtype=float) for x in samples]
+    samples = [x[np.isfinite(x)] for x in samples]
+    stats = []
+    for x in samples:
+        if len(x) == 0:
+            stats.append(
+                dict(
+                    vals=np.array([]),
+                    coords=np.array([]),
+                    mean=np.nan,
+                    median=np.nan,
+                    min=np.nan,
+                    max=np.nan,
+                    quantiles=np.array([]),
+                )
+            )
+            continue
+        coords = np.linspace(np.min(x), np.max(x), points)
+        stats.append(
+            dict(
+                # (a single value: as violin_stats)
+                vals=(x[0] == coords).astype(float),
+                coords=coords,
+                mean=np.mean(x),
+                median=np.median(x),
+                min=np.min(x),
+                max=np.max(x),
+                quantiles=np.array([]),
+            )
+        )
+
+    spread = [i for i, x in enumerate(samples) if len(x) > 1 and np.any(x != x[0])]
+    if spread:
+        vals = binned_kdes(
+            [samples[i] for i in spread],
+            np.array([stats[i]["coords"] for i in spread]),
+            bounds,
+            grid_size,
+        )
+        for i, v in zip(spread, vals):
+            stats[i]["vals"] = v
+    return stats
@@ -0,0 +1,215 @@
+"""Module to trace the stages of the website build [nrsur_build_trace]
+
+`build_nrsur_website --trace out.json` records a span for each build stage
+(cache symlinking, template substitution, jupytext conversion, notebook
+execution, thumbnailing, summary table, jupyter-book build) with its wall time,
+CPU time (including child processes), peak RSS and event name. Spans recorded
+in the worker processes are sent back to the main process with the task results.
+
+Summarise a trace, or compare two traces to catch regressions, with:
+    nrsur_build_trace summarize out.json
+    nrsur_build_trace compare old.json new.json
+"""
+
+import argparse
+import json
+import os
+import resource
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+TRACE_ENV_VAR = "NRSUR_BUILD_TRACE"
+
+_SPANS: List[dict] = []
+_OPEN_SPANS: List[dict] = []
+
+
+def enable_tracing() -> None:
+    """Enables tracing in this process (and the worker processes it starts)"""
+    os.environ[TRACE_ENV_VAR] = "1"
+
+
+def is_enabled() -> bool:
+    return os.environ.get(TRACE_ENV_VAR, "") not in ["", "0"]
+
+
+def _cpu_time() -> float:
+    """CPU time (user+sys) of this process and its (waited-for) children"""
+    total = 0.0
+    for who in [resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN]:
+        usage = resource.getrusage(who)
+        total += usage.ru_utime + usage.ru_stime
+    return total
+
+
+def _peak_rss_mb() -> float:
+    """Peak RSS (MB) since the last `_reset_peak_rss` (VmHWM on linux)"""
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _reset_peak_rss() -> None:
+    """Resets the peak RSS so the next span measures its own peak (linux only)"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _children_peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+
+
+def _update_open_spans_peak_rss() -> None:
+    peak = _peak_rss_mb()
+    for span in _OPEN_SPANS:
+        span["peak_rss_mb"] = max(span["peak_rss_mb"], peak)
+
+
+@contextmanager
+def trace_span(stage: str, event: Optional[str] = None, **metadata):
+    """Records the wall time, CPU time and peak RSS of the enclosed code"""
+    if not is_enabled():
+        yield
+        return
+    # the enclosing spans keep the peak reached so far before the reset
+    _update_open_spans_peak_rss()
+    _reset_peak_rss()
+    span = dict(
+        stage=stage,
+        event=event,
+        pid=os.getpid(),
+        start=time.time(),
+        peak_rss_mb=0.0,
+        **metadata,
+    )
+    cpu0 = _cpu_time()
+    _OPEN_SPANS.append(span)
+    try:
+        yield span
+    finally:
+        _update_open_spans_peak_rss()
+        _OPEN_SPANS.remove(span)
+        span["wall"] = time.time() - span["start"]
+        span["cpu"] = _cpu_time() - cpu0
+        span["children_peak_rss_mb"] = _children_peak_rss_mb()
+        _SPANS.append(span)
+
+
+def collect_spans() -> List[dict]:
+    """Returns (and clears) the spans recorded in this process"""
+    spans = list(_SPANS)
+    _SPANS.clear()
+    return spans
+
+
+def add_spans(spans: List[dict]) -> None:
+    """Adds spans recorded in another (worker) process"""
+    _SPANS.extend(spans)
+
+
+def write_trace(fname: str, spans: List[dict], **metadata) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(fname)), exist_ok=True)
+    with open(fname, "w") as f:
+        json.dump(dict(metadata=metadata, spans=spans), f, indent=1)
+
+
+def load_trace(fname: str) -> List[dict]:
+    with open(fname, "r") as f:
+        return json.load(f)["spans"]
+
+
+def _stage_totals(spans: List[dict]) -> Dict[str, dict]:
+    totals = defaultdict(lambda: dict(count=0, wall=0.0, cpu=0.0, peak_rss_mb=0.0))
+    for span in spans:
+        t = totals[span["stage"]]
+        t["count"] += 1
+        t["wall"] += span["wall"]
+        t["cpu"] += span["cpu"]
+        t["peak_rss_mb"] = max(t["peak_rss_mb"], span["peak_rss_mb"])
+    return dict(totals)
+
+
+def _event_totals(spans: List[dict]) -> Dict[str, float]:
+    """Wall time of each event's build task"""
+    totals = defaultdict(float)
+    for span in spans:
+        if span["stage"] == "task" and span.get("event"):
+            totals[span["event"]] += span["wall"]
+    return dict(totals)
+
+
+def summarize_trace(spans: List[dict], top: int = 10) -> str:
+    """Text summary of the slowest stages and events of a trace"""
+    lines = [f"{'Stage':<25} {'Count':>6} {'Wall[s]':>10} {'CPU[s]':>10} {'PeakRSS[MB]':>12}"]
+    totals = _stage_totals(spans)
+    for stage, t in sorted(totals.items(), key=lambda x: -x[1]["wall"]):
+        lines.append(
+            f"{stage:<25} {t['count']:>6} {t['wall']:>10.1f} {t['cpu']:>10.1f} "
+            f"{t['peak_rss_mb']:>12.0f}"
+        )
+    events = _event_totals(spans)
+    if events:
+        lines += ["", f"Slowest {min(top, len(events))} events:"]
+        for event, wall in sorted(events.items(), key=lambda x: -x[1])[:top]:
+            lines.append(f"  {event:<23} {wall:>10.1f}s")
+    return "\n".join(lines)
+
+
+def compare_traces(
+    old_spans: List[dict], new_spans: List[dict], threshold: float = 0.1
+) -> str:
+    """Text comparison of two traces, flagging stages/events slower by > threshold"""
+    lines = [f"{'Stage/Event':<25} {'Old[s]':>10} {'New[s]':>10} {'Change':>8}"]
+
+    def _compare(old: Dict[str, float], new: Dict[str, float]):
+        for key in sorted(set(old) | set(new)):
+            o, n = old.get(key, 0.0), new.get(key, 0.0)
+            change = (n - o) / o if o > 0 else float("inf") if n > 0 else 0.0
+            flag = "  <-- REGRESSION" if change > threshold else ""
+            lines.append(f"{key:<25} {o:>10.1f} {n:>10.1f} {change:>+8.0%}{flag}")
+
+    old_stages, new_stages = _stage_totals(old_spans), _stage_totals(new_spans)
+    _compare(
+        {k: v["wall"] for k, v in old_stages.items()},
+        {k: v["wall"] for k, v in new_stages.items()},
+    )
+    lines.append("")
+    _compare(_event_totals(old_spans), _event_totals(new_spans))
+    return "\n".join(lines)
+
+
+def main():
+    """Summarises/compares build traces [nrsur_build_trace]"""
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    summarize = subparsers.add_parser("summarize", help="Summarise a trace")
+    summarize.add_argument("trace", type=str, help="Trace file (json)")
+    summarize.add_argument("--top", type=int, default=10, help="Number of events")
+    compare = subparsers.add_parser("compare", help="Compare two traces")
+    compare.add_argument("old", type=str, help="Reference trace file (json)")
+    compare.add_argument("new", type=str, help="New trace file (json)")
+    compare.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="Relative slow-down flagged as a regression",
+    )
+    args = parser.parse_args()
+    if args.command == "summarize":
+        print(summarize_trace(load_trace(args.trace), top=args.top))
+    else:
+        print(
+            compare_traces(
+                load_trace(args.old), load_trace(args.new), threshold=args.threshold
+            )
+        )
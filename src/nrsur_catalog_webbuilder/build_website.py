@@ -3,122 +3,476 @@ Most of the code has been grabbed from dfm/tess-atlas
 """
 
 import argparse
-import glob
 import os
 import shutil
 import sys
+import time
 from multiprocessing import cpu_count
+from typing import List, Optional
 
-from tqdm.auto import tqdm
-from tqdm.contrib.concurrent import process_map
+import psutil
 
 from nrsur_catalog.cache import DEFAULT_CACHE_DIR, CatalogCache
+from nrsur_catalog.catalog import CATALOG_FN
 from nrsur_catalog.logger import logger
-from nrsur_catalog.utils import get_event_name
 from nrsur_catalog import __version__
-from .make_pages import make_catalog_page, make_events_menu_page, make_gw_page, _replace_strings_from_file
-from .utils import is_file
+from .build_trace import collect_spans, enable_tracing, trace_span, write_trace
+from .executor import TaskResult
+from .make_pages import (
+    RENDER_MODES,
+    _replace_strings_from_file,
+    catalog_page_fingerprint,
+    clean_gw_page,
+    gw_page_fingerprint,
+    make_catalog_page,
+    make_events_menu_page,
+    make_gw_page,
+    menu_page_fingerprint,
+)
+from .history import (
+    BuildHistory,
+    get_posterior_size,
+    predict_makespan,
+    read_peak_memory,
+)
+from .journal import DONE, BuildJournal
+from .manifest import BuildManifest, get_library_versions
+from .parallel_plots import PLOT_WORKERS_ENV_VAR
+from .plot_cache import PLOT_CACHE_ENV_VAR
+from .posterior_bundles import (
+    event_bundle_is_stale,
+    write_catalog_bundle,
+    write_event_bundle,
+)
+from .posterior_columns import remove_sidecars
+from .scheduler import TaskGraph, build_gw_pages
+from .shards import get_shard_events, merge_shards
+from .thumbnails import make_event_thumbnails
+from .web_images import optimize_web_images
+from .utils import copy_if_changed, is_file
+from .waveform_store import compute_event_waveforms
 
 HERE = os.path.dirname(__file__)
 WEB_TEMPLATE = os.path.join(HERE, "website_template")
 
+# a change to these needs all the pages to be re-rendered
+BOOK_CONFIG_FILES = ["_config.yml", "_toc.yml"]
+BOOK_LIBRARIES = ["jupyter-book", "sphinx", "myst-nb"]
+
+# fraction of the machine's memory the parallel notebooks may use by default
+DEFAULT_MEMORY_FRACTION = 0.8
+
 
 def build_website(
-    event_dir: str, outdir: str, clean: bool = False, parallel_build=False
-) -> None:
-    """Build the website for the catalog"""
+    event_dir: str,
+    outdir: str,
+    clean: bool = False,
+    parallel_build=False,
+    memory_budget: Optional[float] = None,
+    trace: Optional[str] = None,
+    resume: bool = False,
+    timeout: Optional[float] = None,
+    retries: int = 0,
+    shard: Optional[str] = None,
+    merge: Optional[List[str]] = None,
+    render_mode: str = "ploomber",
+    plot_cache_dir: Optional[str] = None,
+) -> List[str]:
+    """Build the website for the catalog, returns the names of the failed build tasks
+
+    memory_budget: max memory (GB) of the notebooks executing at once
+        (default: a fraction of the machine's memory when building in parallel)
+    trace: path to write a json trace of the build stages to
+    resume: skip the tasks the build journal of an interrupted build marks as done
+    timeout: wall-clock limit (s) of each build task
+    retries: number of times a failed build task is retried
+    shard: 'i/N', only execute the i-th of N subsets of the GW notebooks (into outdir)
+    merge: shard dirs whose GW pages are merged into outdir before the build
+    render_mode: how the GW notebooks are executed (see make_pages.RENDER_MODES)
+    plot_cache_dir: shared dir of the content-addressed plot cache
+        (default: $NRSUR_PLOT_CACHE or ~/.cache/nrsur_catalog_plots)
+    """
     logger.info(
         f"Building website [args: event_dir:{event_dir}, outdir:{outdir}, clean:{clean}]"
     )
 
     if clean:
         shutil.rmtree(outdir, ignore_errors=True)
+    if plot_cache_dir is not None:
+        # the notebooks (run from their outdir in the workers) read the cache dir from the env
+        os.environ[PLOT_CACHE_ENV_VAR] = os.path.abspath(plot_cache_dir)
+    if merge:
+        merge_shards(merge, outdir)
+
+    if trace is not None:
+        enable_tracing()
+    t0 = time.time()
+    with trace_span("build"):
+        failed = _build_website(
+            event_dir,
+            outdir,
+            parallel_build,
+            memory_budget,
+            resume=resume,
+            timeout=timeout,
+            retries=retries,
+            shard=shard,
+            render_mode=render_mode,
+        )
+    if trace is not None:
+        write_trace(trace, collect_spans(), outdir=outdir, event_dir=event_dir)
+        logger.info(f"Build trace written to {trace} (took {time.time() - t0:.1f}s)")
+    return failed
 
+
+def _build_website(
+    event_dir: str,
+    outdir: str,
+    parallel_build: bool,
+    memory_budget: Optional[float],
+    resume: bool = False,
+    timeout: Optional[float] = None,
+    retries: int = 0,
+    shard: Optional[str] = None,
+    render_mode: str = "ploomber",
+) -> List[str]:
     CACHE = CatalogCache(os.path.abspath(event_dir))
+    if len(CACHE.event_names) == 0:
+        raise ValueError(f"No events found in the cache directory: {event_dir}")
+
+    remove_sidecars(CACHE.dir)
 
     # make symlink to the web cache directory
     web_cache = os.path.join(outdir, f"events/{DEFAULT_CACHE_DIR}/")
 
     # make each file in the cache directory a symlink to the web cache directory
-    for file in os.listdir(CACHE.dir):
-        src = os.path.join(CACHE.dir, file)
-        dst = os.path.join(web_cache, file)
-        dst_dir = os.path.dirname(dst)
-        if not os.path.exists(dst_dir):
-            os.makedirs(dst_dir, exist_ok=True)
-        if not is_file(dst):
-            assert os.path.exists(src), f"File {src} (src) does not exist"
-            os.symlink(src, dst)
+    with trace_span("cache_symlinking"):
+        for file in os.listdir(CACHE.dir):
+            if file.startswith("."):  # hidden
+                continue
+            src = os.path.join(CACHE.dir, file)
+            dst = os.path.join(web_cache, file)
+            dst_dir = os.path.dirname(dst)
+            if not os.path.exists(dst_dir):
+                os.makedirs(dst_dir, exist_ok=True)
+            if not is_file(dst):
+                assert os.path.exists(src), f"File {src} (src) does not exist"
+                os.symlink(src, dst)
 
     event_names = CACHE.event_names
+    if shard is not None:
+        event_names = get_shard_events(event_names, shard)
+        if len(event_names) == 0:
+            # (eg more shards than events): its (empty) events dir is merged as is
+            logger.info(f"Shard {shard} has no events, nothing to build")
+            os.makedirs(os.path.join(outdir, "events"), exist_ok=True)
+            return []
+        logger.info(f"Shard {shard}: only building the GW pages of its events")
     num_events = len(event_names)
-    if num_events == 0:
-        raise ValueError(f"No events found in the cache directory: {event_dir}")
 
     logger.info(f"Building website with {num_events} events: {event_names}")
-    shutil.copytree(WEB_TEMPLATE, outdir, dirs_exist_ok=True)
-
-    _replace_strings_from_file(
-        os.path.join(outdir, "api.rst"),
-        {"{{VERSION}}": __version__},
-        os.path.join(outdir, "api.rst"),
-    )
+    with trace_span("template_substitution"):
+        # unchanged files keep their mtime, so Sphinx only re-reads the changed pages
+        shutil.copytree(
+            WEB_TEMPLATE,
+            outdir,
+            dirs_exist_ok=True,
+            copy_function=copy_if_changed,
+            ignore=lambda src, names: ["api.rst"] if src == WEB_TEMPLATE else [],
+        )
+        _replace_strings_from_file(
+            os.path.join(WEB_TEMPLATE, "api.rst"),
+            {"{{VERSION}}": __version__},
+            os.path.join(outdir, "api.rst"),
+        )
 
     event_ipynb_dir = os.path.join(outdir, "events")
-    regex = os.path.join(os.path.abspath(event_ipynb_dir), "GW*.ipynb")
-
-    logger.debug(f"Checking {regex} for processed notebooks")
-    events_processed = [get_event_name(f.split("/")[-1]) for f in glob.glob(regex)]
-    events_not_processed = list(set(event_names) - set(events_processed))
+    manifest = BuildManifest(outdir)
+    history = BuildHistory(outdir)
+    journal = BuildJournal(outdir, resume=resume)
+    if resume and journal.state("web_images") == DONE:
+        logger.info("The previous build completed, nothing to resume")
+        journal = BuildJournal(outdir)
+    graph = TaskGraph()
 
+    # only (re)build the pages whose inputs changed since the last build
+    event_fingerprints = {
+        name: gw_page_fingerprint(name, CACHE, manifest) for name in event_names
+    }
+    events_not_processed = [
+        name
+        for name, fingerprint in event_fingerprints.items()
+        if manifest.is_stale(
+            f"events/{name}",
+            fingerprint,
+            outputs=[os.path.join(event_ipynb_dir, f"{name}.ipynb")],
+        )
+    ]
     logger.debug(
         f"Events to make webpages for: {len(events_not_processed)}/{num_events}"
     )
 
-    build_commands = [
-        f"build_gwpage {name} {event_ipynb_dir} {CACHE.dir}"
-        for name in events_not_processed
-    ]
-    if parallel_build:
-        num_threads = cpu_count() // 2
-        if num_events < num_threads:
-            num_threads = num_events
-        logger.info(f"Executing GW event notebooks with {num_threads} threads")
-        process_map(
-            os.system,
-            build_commands,
-            desc="Executing GW Notebooks",
-            max_workers=num_threads,
-            total=len(events_not_processed),
+    # `Catalog.load` caches the downsampled posteriors, which go stale with the data
+    catalog_data = manifest.fingerprint(inputs={}, files=CACHE.list)
+    if shard is None and manifest.is_stale("catalog_data", catalog_data):
+        tmp_cache = os.path.join(outdir, DEFAULT_CACHE_DIR)
+        _remove_downsampled_catalogs([CACHE.dir, web_cache, tmp_cache])
+        manifest.record("catalog_data", catalog_data)
+
+    # the catalog page only needs the cache: it runs next to the event pages
+    catalog_fingerprint = catalog_page_fingerprint(CACHE, manifest)
+    catalog_fname = os.path.join(outdir, "catalog_plots.ipynb")
+    if shard is not None:
+        pass  # the catalog page is built once, when merging the shards
+    elif manifest.is_stale("catalog_plots", catalog_fingerprint, [catalog_fname]):
+        graph.add(
+            "catalog_plots",
+            make_catalog_page,
+            outdir,
+            CACHE,
+            on_done=_record_on_success(manifest, "catalog_plots", catalog_fingerprint),
+            cost=history.estimate("catalog_plots"),
+            memory=history.estimate_memory("catalog_plots"),
         )
     else:
-        for cmd in tqdm(build_commands, desc="Executing GW notebooks"):
-            os.system(cmd)
+        logger.info("Catalog notebook is up to date, skipping")
 
-    logger.info("Executing events menu notebook")
-    make_events_menu_page(outdir, CACHE)
+    posterior_sizes = {
+        f"events/{name}": get_posterior_size(name, CACHE) for name in events_not_processed
+    }
+    profiling_data_fns = {
+        f"events/{name}": os.path.join(event_ipynb_dir, f"{name}-profiling-data.csv")
+        for name in events_not_processed
+    }
+    profiling_data_fns["catalog_plots"] = os.path.join(
+        outdir, "catalog_plots-profiling-data.csv"
+    )
+    for name in events_not_processed:
+        clean_gw_page(name, event_ipynb_dir)
+        manifest.forget(f"events/{name}")
+        journal.forget(f"events/{name}")
+        journal.forget(f"thumbnails/{name}")
+        journal.forget(f"waveforms/{name}")
+        # the waveforms of the posterior-predictive plot are computed (and stored)
+        # ahead of the page, on a pool of their own (else the page computes them)
+        graph.add(
+            f"waveforms/{name}",
+            compute_event_waveforms,
+            name,
+            CACHE.dir,
+            cost=history.estimate(f"waveforms/{name}"),
+            memory=history.estimate_memory(f"waveforms/{name}"),
+        )
+        graph.add(
+            f"events/{name}",
+            make_gw_page,
+            name,
+            event_ipynb_dir,
+            cache=CACHE,
+            render_mode=render_mode,
+            after=[f"waveforms/{name}"],
+            on_done=_record_on_success(
+                manifest, f"events/{name}", event_fingerprints[name]
+            ),
+            cost=history.estimate(f"events/{name}", posterior_sizes[f"events/{name}"]),
+            memory=history.estimate_memory(
+                f"events/{name}", posterior_sizes[f"events/{name}"]
+            ),
+        )
+        # each event's thumbnails start as soon as its plots exist
+        graph.add(
+            f"thumbnails/{name}",
+            make_event_thumbnails,
+            name,
+            event_ipynb_dir,
+            deps=[f"events/{name}"],
+        )
+
+    # the slim posteriors of the notebooks' readers (published with the html)
+    if shard is None:
+        for name in event_names:
+            if event_bundle_is_stale(name, CACHE.dir, outdir):
+                graph.add(
+                    f"bundles/{name}",
+                    write_event_bundle,
+                    name,
+                    CACHE.dir,
+                    outdir,
+                    cost=history.estimate(f"bundles/{name}"),
+                )
+        # (of the catalog page's downsampled posteriors)
+        graph.add(
+            "bundles/catalog",
+            write_catalog_bundle,
+            os.path.join(outdir, DEFAULT_CACHE_DIR),
+            outdir,
+            deps=[t for t in ["catalog_plots"] if t in graph.tasks],
+            cost=history.estimate("bundles/catalog"),
+        )
 
-    if not os.path.exists(f"{outdir}/catalog_plots.ipynb"):
-        logger.info("Executing catalog notebook")
-        make_catalog_page(outdir, CACHE)
+    # the menu page is stale if it doesnt match the expected (all events built) state
+    menu_fname = os.path.join(event_ipynb_dir, "gw_menu_page.md")
+    expected_fingerprint = menu_page_fingerprint(CACHE, manifest, event_fingerprints)
+    if shard is not None:
+        pass  # the menu page is built once, when merging the shards
+    elif manifest.is_stale("events/gw_menu_page", expected_fingerprint, [menu_fname]):
+        graph.add(
+            "events/gw_menu_page",
+            make_events_menu_page,
+            outdir,
+            CACHE,
+            after=[f"thumbnails/{name}" for name in events_not_processed],
+            on_done=lambda result: _record_menu_page(result, CACHE, manifest),
+            cost=history.estimate("events/gw_menu_page"),
+            memory=history.estimate_memory("events/gw_menu_page"),
+        )
     else:
-        logger.info("Catalog notebook already exists, skipping")
+        logger.info("Events menu page is up to date, skipping")
+
+    num_workers = 1
+    if parallel_build:
+        num_workers = max(1, min(cpu_count() // 2, num_events))
+        if memory_budget is None:
+            memory_budget = DEFAULT_MEMORY_FRACTION * psutil.virtual_memory().total / 1e9
+        logger.info(f"Memory budget for parallel notebooks: {memory_budget:.1f} GB")
+    # each notebook draws its plots in parallel on the cores left per worker
+    os.environ.setdefault(PLOT_WORKERS_ENV_VAR, str(max(1, cpu_count() // num_workers)))
+    # Sphinx keeps its environment between builds and only re-renders the changed
+    # pages (and those linking to them), unless the book's config/toc changed
+    book_fingerprint = manifest.fingerprint(
+        inputs=dict(libraries=get_library_versions(BOOK_LIBRARIES)),
+        files=[os.path.join(outdir, fn) for fn in BOOK_CONFIG_FILES],
+    )
+    full_rebuild = manifest.is_stale("jupyter_book", book_fingerprint)
+    if shard is None:
+        graph.add(
+            "jupyter_book",
+            build_html,
+            outdir,
+            full=full_rebuild,
+            after=list(graph.tasks),  # (with whichever pages were built)
+            on_done=_record_on_success(manifest, "jupyter_book", book_fingerprint),
+            cost=history.estimate("jupyter_book"),
+        )
+        # the html's images are re-compressed, get web variants and lazy <picture>s
+        graph.add(
+            "web_images",
+            optimize_web_images,
+            outdir,
+            deps=["jupyter_book"],
+            cost=history.estimate("web_images"),
+        )
+    predicted = predict_makespan([t.cost for t in graph.tasks.values()], num_workers)
+    logger.info(
+        f"Running {len(graph)} build tasks with {num_workers} workers "
+        f"(predicted time: {predicted / 60:.1f} min)"
+    )
+
+    def _record_history(result: TaskResult):
+        if result.success:
+            history.record(
+                result.name,
+                result.duration,
+                size=posterior_sizes.get(result.name),
+                peak_memory=read_peak_memory(profiling_data_fns.get(result.name, "")),
+            )
+
+    t0 = time.time()
+    results = graph.run(
+        num_workers=num_workers,
+        on_done=_record_history,
+        memory_budget=memory_budget * 1e3 if memory_budget is not None else None,
+        journal=journal,
+        timeout=timeout,
+        retries=retries,
+    )
+    manifest.save()
+    history.save()
+    logger.info(f"Build journal: {journal.summary()}")
+    logger.info(
+        f"Build took {(time.time() - t0) / 60:.1f} min "
+        f"(predicted time: {predicted / 60:.1f} min)"
+    )
+
+    failed = [name for name, result in results.items() if not result.success]
+    if failed:
+        logger.warning(f"{len(failed)}/{len(results)} build tasks failed: {failed}")
+    return failed
+
 
+def build_html(outdir: str, full: bool = False) -> None:
+    """Builds the website's html with jupyter-book
+    (full: re-render all the pages, instead of only the changed ones)"""
     command = f"jupyter-book build {outdir}"
-    os.system(command)
+    if full:
+        command += " --all"
+    with trace_span("jupyter_book_build"):
+        returncode = os.system(command)
+    if returncode != 0:
+        raise RuntimeError(f"'{command}' failed with return code {returncode}")
+
+
+def _record_on_success(manifest: BuildManifest, page: str, fingerprint: str):
+    """Callback to record a page's fingerprint once it has been built"""
+
+    def _record(result: TaskResult):
+        if result.success:
+            manifest.record(page, fingerprint)
+            manifest.save()
+
+    return _record
+
+
+def _record_menu_page(
+    result: TaskResult, cache: CatalogCache, manifest: BuildManifest
+) -> None:
+    """Records the menu page's fingerprint with the event pages actually built"""
+    if not result.success:
+        return
+    built_event_pages = {
+        name: manifest.get(f"events/{name}")
+        for name in cache.event_names
+        if manifest.get(f"events/{name}") is not None
+    }
+    fingerprint = menu_page_fingerprint(cache, manifest, built_event_pages)
+    manifest.record("events/gw_menu_page", fingerprint)
+    manifest.save()
+
+
+def _remove_downsampled_catalogs(cache_dirs: List[str]) -> None:
+    """Removes the (now stale) downsampled-posterior caches made by `Catalog.load`"""
+    for cache_dir in cache_dirs:
+        fname = os.path.join(cache_dir, CATALOG_FN)
+        if is_file(fname):
+            logger.debug(f"Removing stale {fname}")
+            os.remove(fname)
 
 
 def gwpage_main():
-    """Runs one GW notebook"""
-    args = sys.argv[1:]
-    name = args[0]
-    event_ipynb_dir = args[1]
-    data_dir = args[2]
-    CACHE = CatalogCache(data_dir)
+    """Runs the GW notebooks for one or more events [build_gwpage]"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("event_names", nargs="+", help="Events to build pages for")
+    parser.add_argument("event_ipynb_dir", type=str, help="Dir to write the notebooks")
+    parser.add_argument("data_dir", type=str, help="Dir with the cached results")
+    parser.add_argument(
+        "--num-workers",
+        type=int,
+        default=1,
+        help="Number of warm worker processes to execute the notebooks with",
+    )
+    args = parser.parse_args()
     logger.debug(
-        f"Running GW notebook for {name} in {event_ipynb_dir} with data in {data_dir}"
+        f"Running GW notebooks for {args.event_names} in {args.event_ipynb_dir} "
+        f"with data in {args.data_dir}"
+    )
+    results = build_gw_pages(
+        args.event_names,
+        args.event_ipynb_dir,
+        CatalogCache(args.data_dir).dir,
+        num_workers=args.num_workers,
     )
-    make_gw_page(name, event_ipynb_dir, cache=CACHE)
+    if not all(r.success for r in results.values()):
+        sys.exit(1)
 
 
 def main():
@@ -141,5 +495,86 @@ def main():
         action="store_true",
         help="Clean the output directory",
     )
+    parser.add_argument(
+        "--parallel-build",
+        action="store_true",
+        help="Execute the GW notebooks on multiple worker processes",
+    )
+    parser.add_argument(
+        "--memory-budget",
+        type=float,
+        default=None,
+        help="Max memory (GB) of the notebooks executing at once "
+        f"(default: {DEFAULT_MEMORY_FRACTION * 100:.0f}%% of the machine's memory)",
+    )
+    parser.add_argument(
+        "--trace",
+        type=str,
+        default=None,
+        help="Write a json trace of the build stages (see `nrsur_build_trace`)",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Resume an interrupted build (skipping the tasks it already finished)",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=None,
+        help="Wall-clock limit (s) of each build task",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=0,
+        help="Number of times a failed build task is retried",
+    )
+    parser.add_argument(
+        "--shard",
+        type=str,
+        default=None,
+        help="Only execute the GW notebooks of shard i/N (0 <= i < N) into outdir",
+    )
+    parser.add_argument(
+        "--merge",
+        type=str,
+        nargs="+",
+        default=None,
+        help="Shard dirs to merge into outdir (then build the menu/catalog/html)",
+    )
+    parser.add_argument(
+        "--render-mode",
+        type=str,
+        default="ploomber",
+        choices=RENDER_MODES,
+        help="How to execute the GW notebooks: a new IPython shell per notebook, "
+        "a warm shell reused by each worker, or directly (without a shell)",
+    )
+    parser.add_argument(
+        "--plot-cache-dir",
+        type=str,
+        default=None,
+        help=f"Shared dir to cache the plots in (default: ${PLOT_CACHE_ENV_VAR} "
+        "or ~/.cache/nrsur_catalog_plots)",
+    )
     args = parser.parse_args()
-    build_website(args.event_dir, args.outdir, args.clean)
+    if args.shard is not None and args.merge:
+        parser.error("--shard and --merge can not be used together")
+    failed = build_website(
+        args.event_dir,
+        args.outdir,
+        args.clean,
+        args.parallel_build,
+        memory_budget=args.memory_budget,
+        trace=args.trace,
+        resume=args.resume,
+        timeout=args.timeout,
+        retries=args.retries,
+        shard=args.shard,
+        merge=args.merge,
+        render_mode=args.render_mode,
+        plot_cache_dir=args.plot_cache_dir,
+    )
+    if failed:
+        sys.exit(1)
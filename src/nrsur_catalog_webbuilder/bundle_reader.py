@@ -0,0 +1,127 @@
+"""Module reading the slim web bundles of the posteriors (see posterior_bundles.py)
+
+This is the only reader of the bundles: the builder uses it, and its source is
+inlined into the pages' notebooks (for the readers without the webbuilder
+installed), so it only depends on nrsur_catalog (and its requirements).
+"""
+
+import json
+import os
+import urllib.request
+from functools import cached_property
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from bilby.core.utils import decode_bilby_json
+from bilby.gw.prior import BBHPriorDict
+from bilby.gw.result import CBCResult
+
+from nrsur_catalog.cache import DEFAULT_CACHE_DIR, CatalogCache
+from nrsur_catalog.catalog import CATALOG_FN, Catalog
+from nrsur_catalog.logger import logger
+from nrsur_catalog.lvk_posterior import load_lvk_result
+from nrsur_catalog.nrsur_result import NRsurResult
+
+BUNDLE_DIR = "bundles"
+BUNDLE_URL = (
+    "https://raw.githubusercontent.com/nrsur-catalog/NRSurCat-1/gh-pages/bundles/{}"
+)
+CATALOG_BUNDLE_FN = "catalog.npz"
+# (bumped when the bundles' contents change, the older bundles are then rewritten)
+BUNDLE_FORMAT = 2
+LVK_RESULT_LABEL = "LVK [XPHM]"
+
+
+def event_bundle_fn(event_name: str) -> str:
+    return f"{event_name}.npz"
+
+
+def read_bundle(fn: str) -> Tuple[Dict[str, pd.DataFrame], dict]:
+    """The bundle's {name: posterior} and metadata"""
+    posteriors = {}
+    with np.load(fn) as bundle:
+        meta = json.loads(str(bundle["meta"]), object_hook=decode_bilby_json)
+        if meta.get("format") != BUNDLE_FORMAT:
+            raise ValueError(f"{fn} has an unknown bundle format {meta.get('format')}")
+        for name, columns in meta["columns"].items():
+            offsets = meta["offsets"][name]
+            data = {c: bundle[f"{name}/{c}"] + np.float64(offsets[c]) for c in columns}
+            posteriors[name] = pd.DataFrame(data, columns=columns)
+    return posteriors, meta
+
+
+def fetch_bundle(fn: str, cache_dir: str = DEFAULT_CACHE_DIR) -> str:
+    """The bundle's local path (downloaded from the site if not in the cache)"""
+    path = os.path.join(cache_dir, BUNDLE_DIR, fn)
+    if not os.path.isfile(path):
+        logger.info(f"Downloading the web bundle {fn}")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        urllib.request.urlretrieve(BUNDLE_URL.format(fn), f"{path}.tmp")
+        os.replace(f"{path}.tmp", path)
+    return path
+
+
+class BundleResult(NRsurResult):
+    """The NRsurResult of an event bundle, with the bundle's LVK posterior (if any)"""
+
+    def __init__(self, *args, lvk_posterior: Optional[pd.DataFrame] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lvk_posterior = lvk_posterior
+
+    @cached_property
+    def lvk_result(self) -> CBCResult:
+        """The bundled LVK result (else downloaded in full, from the GWTC)"""
+        if self.lvk_posterior is None:
+            return load_lvk_result(self.label, cache_dir=os.path.dirname(self.outdir))
+        return CBCResult(
+            label=LVK_RESULT_LABEL,
+            posterior=self.lvk_posterior,
+            search_parameter_keys=list(self.lvk_posterior.columns),
+        )
+
+
+def result_from_bundle(fn: str, cache_dir: str = DEFAULT_CACHE_DIR) -> NRsurResult:
+    """The NRsurResult (and its LVK posterior) of the event bundle"""
+    posteriors, meta = read_bundle(fn)
+    priors = BBHPriorDict(dictionary=meta["priors"])
+    result = BundleResult(
+        label=meta["event"],
+        outdir=os.path.join(cache_dir, meta["event"]),
+        posterior=posteriors["nr"],
+        priors=priors,
+        search_parameter_keys=list(priors.keys()),
+        meta_data=meta["meta_data"],
+        lvk_posterior=posteriors.get("lvk"),
+    )
+    result.path_to_result = fn
+    return result
+
+
+def load_result(event_name: str, cache_dir: str = DEFAULT_CACHE_DIR) -> NRsurResult:
+    """The event's result: the full posterior if cached, else its web bundle
+    (else the downloaded full posterior)"""
+    if not CatalogCache(cache_dir).find(event_name):
+        try:
+            return result_from_bundle(
+                fetch_bundle(event_bundle_fn(event_name), cache_dir), cache_dir
+            )
+        except (OSError, KeyError, ValueError) as e:
+            logger.warning(f"Could not load the web bundle of {event_name}: {e}")
+    return NRsurResult.load(event_name, cache_dir=cache_dir)
+
+
+def load_catalog(cache_dir: str = DEFAULT_CACHE_DIR) -> Catalog:
+    """The catalog: from the cached posteriors if any, else its web bundle
+    (else the downloaded full posteriors)"""
+    cache = CatalogCache(cache_dir)
+    if not cache.list and not os.path.isfile(os.path.join(cache.dir, CATALOG_FN)):
+        try:
+            posteriors, meta = read_bundle(fetch_bundle(CATALOG_BUNDLE_FN, cache_dir))
+            df = posteriors["catalog"]
+            event_index = np.rint(df.pop("event_index")).astype(int)
+            df["event"] = np.array(meta["events"])[event_index]
+            return Catalog(df)
+        except (OSError, KeyError, ValueError) as e:
+            logger.warning(f"Could not load the catalog's web bundle: {e}")
+    return Catalog.load(cache_dir=cache_dir)
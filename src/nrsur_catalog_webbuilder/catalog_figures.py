@@ -0,0 +1,244 @@
+"""Module with the catalog page's shared posterior view (and its figures' keys)
+
+The catalog page draws seven violin plots and three 2D posterior plots one after
+the other, and every figure re-splits the catalog's samples by event
+(`Catalog.to_dict_of_posteriors` / `get_event_posterior` filter the whole table
+once per event, `get_posterior_quantiles` re-groups it): O(events^2 x samples)
+work per figure.
+
+`CatalogView` is the catalog with its per-event posteriors, event names and
+quantiles computed once. The page's figures are independent tasks drawn by
+`cached_plots` (in forked workers, which share the view through fork's
+copy-on-write memory). Its violins' densities are computed for all the events at
+once (and reflected about the parameter's bounds) by the `binned_kde` engine, and
+its 2D posteriors are drawn as one raster image by the `density_raster` engine.
+Each figure is keyed in the plot cache by
+`figure_inputs`: the events and a hash of the view's columns it plots, so a
+figure is only redrawn when the set of events or its own inputs change (and not
+when eg only another parameter's samples do).
+"""
+
+import hashlib
+from typing import Dict, List, Optional, Union
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+from matplotlib.ticker import AutoMinorLocator
+
+from nrsur_catalog.catalog import POSTERIORS_TO_KEEP, Catalog
+from nrsur_catalog.utils import CATALOG_MAIN_COLOR, LATEX_LABELS, get_gps_time
+
+from .binned_kde import parameter_bounds, violin_stats
+from .density_raster import RESOLUTION, event_densities, rasterize
+
+
+class CatalogView(Catalog):
+    """The catalog, with its per-event posteriors split once (shared by its figures)"""
+
+    def __init__(self, posteriors: pd.DataFrame):
+        super().__init__(posteriors)
+        self._split()
+
+    @classmethod
+    def from_catalog(cls, catalog: Catalog) -> "CatalogView":
+        """The view of the catalog's (already sorted) posteriors, without a copy"""
+        view = cls.__new__(cls)
+        view._df = catalog._df
+        view._split()
+        return view
+
+    def _split(self) -> None:
+        self._posteriors = {
+            event: posterior for event, posterior in self._df.groupby("event", sort=False)
+        }
+        self._event_names = sorted(self._posteriors, key=get_gps_time)
+        self._quantiles: Dict[tuple, pd.DataFrame] = {}
+
+    @property
+    def event_names(self) -> List[str]:
+        return list(self._event_names)
+
+    def to_dict_of_posteriors(
+        self, parameters: Optional[List[str]] = None
+    ) -> Dict[str, pd.DataFrame]:
+        if parameters is None:
+            parameters = POSTERIORS_TO_KEEP
+        return {e: self._posteriors[e][parameters] for e in self._event_names}
+
+    def get_event_posterior(self, event_name: str) -> pd.DataFrame:
+        if event_name not in self._posteriors:
+            return self._df.iloc[:0]
+        return self._posteriors[event_name]
+
+    def get_posterior_quantiles(self, quantiles=[0.16, 0.5, 0.84]) -> pd.DataFrame:
+        key = tuple(quantiles)
+        if key not in self._quantiles:
+            self._quantiles[key] = super().get_posterior_quantiles(list(quantiles))
+        return self._quantiles[key].copy()
+
+    def violin_plot(self, parameter: str, sort_by="event_name") -> plt.Figure:
+        """`Catalog.violin_plot`, with the events' densities from `binned_kde`"""
+        if sort_by == "event_name":
+            ylabels = self.event_names[::-1]
+            data = [self._posteriors[e][parameter].to_numpy() for e in ylabels]
+        elif sort_by == "median":
+            data = [self._posteriors[e][parameter].to_numpy() for e in self.event_names]
+            medians = [np.mean(d) for d in data]
+            ylabels = [e for _, e in sorted(zip(medians, self.event_names))]
+            data = [d for _, d in sorted(zip(medians, data), key=lambda x: x[0])]
+        else:
+            raise ValueError(f"sort_by must be 'event_name' or 'median', not {sort_by}")
+
+        fig, ax = plt.subplots(figsize=(7, self.n * 0.8))
+        ax.tick_params(axis="x", bottom=True, top=True, labelbottom=True, labeltop=True)
+        for pos in ["right", "top", "bottom", "left"]:
+            ax.spines[pos].set_visible(False)
+        ax.set_xticks([])
+        ax.set_title(LATEX_LABELS[parameter], fontsize=22)
+        ax.set_xlabel(LATEX_LABELS[parameter], fontsize=22)
+        ax.grid(True, axis="x", alpha=0.25)
+        ax.xaxis.set_tick_params(width=0)
+        ax.yaxis.set_tick_params(width=0)
+        ax.set_yticks(range(1, self.n + 1))
+        ax.set_yticklabels(ylabels)
+        stats = violin_stats(data, parameter_bounds(parameter))
+        violin_parts = ax.violin(stats, vert=False)
+        for pc in violin_parts["bodies"]:
+            pc.set_color(CATALOG_MAIN_COLOR)
+        for partname in ("cbars", "cmins", "cmaxes"):
+            violin_parts[partname].set_edgecolor(CATALOG_MAIN_COLOR)
+        min_x = np.nanmin([s["min"] for s in stats])
+        max_x = np.nanmax([s["max"] for s in stats])
+        axes_ticks = np.linspace(min_x, max_x, 5)
+        ax.set_ylim(0.5, self.n + 0.5)
+        ax.set_xticks(axes_ticks)
+
+        # annotate a group number every 7 y ticks
+        ntics = 7
+        for i in range(6, self.n, ntics):
+            for xval in axes_ticks:
+                ax.text(
+                    xval,
+                    i + 1.5,
+                    f"{xval:.1f}",
+                    fontsize=12,
+                    ha="center",
+                    va="center",
+                    color="black",
+                    alpha=0.25,
+                )
+
+        plt.tight_layout()
+        fig.savefig(f"{parameter}_violin.png", dpi=300, bbox_inches="tight")
+        return fig
+
+    def plot_2d_posterior(
+        self,
+        parm_x: str,
+        parm_y: str,
+        scatter_medians: Optional[bool] = True,
+        event_posteriors: Optional[bool] = False,
+        event_quantiles: Optional[bool] = True,
+        contour_all_posterior_samples: Optional[bool] = True,
+        colors: Optional[Union[str, List[str]]] = CATALOG_MAIN_COLOR,
+        resolution: int = RESOLUTION,
+    ) -> plt.Figure:
+        """`Catalog.plot_2d_posterior`, with the events' regions (and outlines, if
+        event_posteriors) drawn as one image of resolution pixels a side"""
+        fig, ax = plt.subplots(figsize=(5, 5))
+        if isinstance(colors, str):
+            colors = [colors] * self.n
+        extent = (
+            np.nanmin(self._df[parm_x]),
+            np.nanmax(self._df[parm_x]),
+            np.nanmin(self._df[parm_y]),
+            np.nanmax(self._df[parm_y]),
+        )
+
+        if event_posteriors or contour_all_posterior_samples:
+            xs, ys, event_colors = [], [], []
+            for event, color in zip(self.event_names, colors):
+                data = self._posteriors[event][[parm_x, parm_y]].to_numpy(dtype=float)
+                data = data[np.isfinite(data).all(axis=1)]
+                if len(data) > 1 and np.all(np.ptp(data, axis=0) > 0):
+                    xs.append(data[:, 0])
+                    ys.append(data[:, 1])
+                    event_colors.append(color)
+            if xs:
+                image = rasterize(
+                    event_densities(xs, ys),
+                    extent,
+                    event_colors,
+                    resolution,
+                    outline=event_posteriors,
+                    background=ax.get_facecolor(),
+                )
+                ax.imshow(image, extent=extent, origin="lower", aspect="auto", zorder=-2)
+
+        if scatter_medians:
+            posterior_quantiles = self.get_posterior_quantiles()[[parm_x, parm_y]]
+            # [event, quantile, (x, y)]
+            q = np.array([posterior_quantiles.loc[e].values for e in self.event_names])
+            low, median, high = q[:, 0], q[:, 1], q[:, 2]
+            ax.scatter(median[:, 0], median[:, 1], color=colors, s=0.5)
+            if event_quantiles:
+                for color in dict.fromkeys(colors):
+                    i = np.array([c == color for c in colors])
+                    ax.errorbar(
+                        median[i, 0],
+                        median[i, 1],
+                        xerr=[median[i, 0] - low[i, 0], high[i, 0] - median[i, 0]],
+                        yerr=[median[i, 1] - low[i, 1], high[i, 1] - median[i, 1]],
+                        fmt="none",
+                        color=color,
+                        alpha=0.2,
+                        capsize=0,
+                    )
+
+        ax.set_xlim(extent[0], extent[1])
+        ax.set_ylim(extent[2], extent[3])
+        ax.tick_params(
+            axis="both",
+            which="both",
+            direction="in",
+            top=True,
+            right=True,
+            labelsize=12,
+            pad=5,
+        )
+        ax.tick_params(axis="x", pad=10)
+        # add minor ticks
+        ax.xaxis.set_minor_locator(AutoMinorLocator())
+        ax.yaxis.set_minor_locator(AutoMinorLocator())
+        ax.tick_params(axis="both", which="major", length=8)
+        ax.tick_params(axis="both", which="minor", length=4)
+        ax.set_xlabel(LATEX_LABELS[parm_x])
+        ax.set_ylabel(LATEX_LABELS[parm_y])
+        plt.tight_layout()
+        return fig
+
+    def columns_hash(self, parameters: List[str]) -> str:
+        """Hash of the events' samples of the parameters (whatever their order)"""
+        sha = hashlib.sha256()
+        for event in self._event_names:
+            sha.update(event.encode())
+            values = self._posteriors[event][parameters].to_numpy(dtype=np.float64)
+            values = values[np.lexsort(values.T[::-1])]
+            sha.update(np.ascontiguousarray(values).tobytes())
+        return sha.hexdigest()
+
+
+def catalog_view(catalog: Catalog) -> CatalogView:
+    if isinstance(catalog, CatalogView):
+        return catalog
+    return CatalogView.from_catalog(catalog)
+
+
+def figure_inputs(catalog: CatalogView, parameters: List[str]) -> dict:
+    """The plot cache params of a catalog figure of the parameters"""
+    return dict(
+        events=catalog.event_names,
+        parameters=list(parameters),
+        data=catalog.columns_hash(parameters),
+    )
@@ -0,0 +1,375 @@
+"""Module with a binned density engine for the event pages' corner plots
+
+`NRsurResult.plot_corner` and `plot_lvk_comparison_corner` go through
+`corner.corner`, which re-histograms (and re-smooths, and re-computes the
+contour levels of) every 1D and 2D marginal of every figure: eg mass_ratio's
+marginals are computed for the mass, effective-spin and both comparison plots.
+
+Here the marginals of an event's posterior are computed once: each parameter's
+samples are binned (one pass over the samples per parameter), every 2D
+histogram is a `np.bincount` of two parameters' bin indices, and the smoothing
+and contour levels of all the pairs are computed together. The densities are
+kept per result (`get_densities`), so the figures only draw them, with the
+styling of bilby's `plot_corner` defaults (same bins, smoothing, levels,
+quantiles, titles and layout as corner).
+
+`prepare_densities` computes the densities of all an event's plots before they
+are drawn by forked workers (`cached_plots(..., prepare=...)`), which then share
+them. `helper_scripts/benchmark_corner_densities.py` compares the two paths.
+"""
+
+import weakref
+from dataclasses import dataclass, field
+from itertools import combinations
+from typing import Dict, List, Optional, Tuple
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+from matplotlib.colors import LinearSegmentedColormap, to_rgba
+from matplotlib.lines import Line2D
+from matplotlib.ticker import MaxNLocator, NullLocator, ScalarFormatter
+from scipy.ndimage import gaussian_filter
+
+from nrsur_catalog.utils import CATALOG_MAIN_COLOR, LATEX_LABELS, format_qts_to_latex
+
+# bilby's `plot_corner` defaults
+BINS = 50
+SMOOTH = 0.9
+LEVELS = tuple(1 - np.exp(-0.5 * np.array([1.0, 2.0, 3.0]) ** 2))
+QUANTILES = [0.16, 0.84]
+MAX_N_TICKS = 3
+LABEL_KWARGS = dict(fontsize=16)
+TITLE_KWARGS = dict(fontsize=16)
+NR_LABEL_KWARGS = dict(font="Computer Modern", fontsize=16)
+LVK_COLOR = "tab:blue"
+
+# corner's layout (inches)
+PANEL_SIZE = 2.0
+LB_DIM = 0.5 * PANEL_SIZE
+TR_DIM = 0.2 * PANEL_SIZE
+WHSPACE = 0.05
+
+
+@dataclass
+class Density1D:
+    edges: np.ndarray
+    density: np.ndarray
+    # [lower, median, upper] for the quantile lines and title
+    quantiles: np.ndarray
+
+
+@dataclass
+class Density2D:
+    """The smoothed 2D histogram (x bins, y bins) and its contour levels,
+    extended by two bins on each side (as corner, for the contours at the edges)"""
+
+    H: np.ndarray
+    levels: np.ndarray
+    X2: np.ndarray
+    Y2: np.ndarray
+    H2: np.ndarray
+
+
+@dataclass
+class PosteriorDensities:
+    """The binned 1D/2D marginals of one posterior (computed on demand, and kept)"""
+
+    posterior: pd.DataFrame
+    bins: int = BINS
+    smooth: float = SMOOTH
+    levels: Tuple[float, ...] = LEVELS
+    ranges: Dict[str, Tuple[float, float]] = field(default_factory=dict)
+    one_d: Dict[str, Density1D] = field(default_factory=dict)
+    two_d: Dict[Tuple[str, str], Density2D] = field(default_factory=dict)
+    _bin_indices: Dict[str, np.ndarray] = field(default_factory=dict, repr=False)
+
+    def _bin(self, param: str) -> None:
+        if param in self.ranges:
+            return
+        x = np.asarray(self.posterior[param], dtype=float)
+        lo, hi = float(x.min()), float(x.max())
+        if lo == hi:
+            raise ValueError(f"{param} has no dynamic range")
+        edges = np.linspace(lo, hi, self.bins + 1)
+        idx = ((x - lo) * (self.bins / (hi - lo))).astype(np.intp)
+        np.minimum(idx, self.bins - 1, out=idx)  # the max sample is in the last bin
+        counts = np.bincount(idx, minlength=self.bins)
+        q_lo, q_mid, q_hi = np.quantile(x, [QUANTILES[0], 0.5, QUANTILES[1]])
+        self.ranges[param] = (lo, hi)
+        self._bin_indices[param] = idx
+        self.one_d[param] = Density1D(
+            edges=edges,
+            density=counts / (counts.sum() * np.diff(edges)),
+            quantiles=np.array([q_lo, q_mid, q_hi]),
+        )
+
+    def compute(self, parameters: List[str]) -> None:
+        """Computes the 1D marginals of the parameters and 2D marginals of their pairs"""
+        for p in parameters:
+            self._bin(p)
+        pairs = [
+            (x, y)
+            for x, y in combinations(parameters, 2)
+            if (x, y) not in self.two_d and (y, x) not in self.two_d
+        ]
+        if not pairs:
+            return
+        n = self.bins
+        hists = np.stack(
+            [
+                np.bincount(
+                    self._bin_indices[x] * n + self._bin_indices[y], minlength=n * n
+                ).reshape(n, n)
+                for x, y in pairs
+            ]
+        ).astype(float)
+        # smooth each pair's histogram (not across pairs)
+        hists = gaussian_filter(hists, sigma=(0, self.smooth, self.smooth))
+        levels = _contour_levels(hists, self.levels)
+        for (x, y), H, V in zip(pairs, hists, levels):
+            X2 = _extended_centers(self.one_d[x].edges)
+            Y2 = _extended_centers(self.one_d[y].edges)
+            self.two_d[(x, y)] = Density2D(H=H, levels=V, X2=X2, Y2=Y2, H2=_extend(H))
+
+    def get_2d(self, x: str, y: str) -> Density2D:
+        """The 2D marginal of (x, y), with H indexed [x bin, y bin]"""
+        if (x, y) not in self.two_d and (y, x) not in self.two_d:
+            self.compute([x, y])
+        if (x, y) in self.two_d:
+            return self.two_d[(x, y)]
+        d = self.two_d[(y, x)]
+        return Density2D(H=d.H.T, levels=d.levels, X2=d.Y2, Y2=d.X2, H2=d.H2.T)
+
+    def get_1d(self, param: str) -> Density1D:
+        self._bin(param)
+        return self.one_d[param]
+
+
+def _contour_levels(hists: np.ndarray, levels: Tuple[float, ...]) -> np.ndarray:
+    """The density values enclosing each credible level (as corner), for each histogram"""
+    flat = -np.sort(-hists.reshape(len(hists), -1), axis=1)
+    cumsum = np.cumsum(flat, axis=1)
+    cumsum /= cumsum[:, -1:]
+    V = np.empty((len(hists), len(levels)))
+    for k, (f, sm) in enumerate(zip(flat, cumsum)):
+        idx = np.searchsorted(sm, levels, side="right") - 1
+        V[k] = np.where(idx >= 0, f[np.maximum(idx, 0)], f[0])
+        V[k].sort()
+        # contour levels must be increasing
+        m = np.diff(V[k]) == 0
+        while np.any(m):
+            V[k][np.where(m)[0][0]] *= 1.0 - 1e-4
+            m = np.diff(V[k]) == 0
+        V[k].sort()
+    return V
+
+
+def _extended_centers(edges: np.ndarray) -> np.ndarray:
+    c = 0.5 * (edges[1:] + edges[:-1])
+    step_lo, step_hi = c[1] - c[0], c[-1] - c[-2]
+    return np.concatenate(
+        [c[0] + np.array([-2, -1]) * step_lo, c, c[-1] + np.array([1, 2]) * step_hi]
+    )
+
+
+def _extend(H: np.ndarray) -> np.ndarray:
+    H2 = H.min() + np.zeros((H.shape[0] + 4, H.shape[1] + 4))
+    H2[2:-2, 2:-2] = H
+    H2[2:-2, 1] = H[:, 0]
+    H2[2:-2, -2] = H[:, -1]
+    H2[1, 2:-2] = H[0]
+    H2[-2, 2:-2] = H[-1]
+    H2[1, 1] = H[0, 0]
+    H2[1, -2] = H[0, -1]
+    H2[-2, 1] = H[-1, 0]
+    H2[-2, -2] = H[-1, -1]
+    return H2
+
+
+# {result: densities} of the results plotted by this process, released with their
+# result (the workers are long-lived: they render many pages)
+_DENSITIES: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def get_densities(result) -> PosteriorDensities:
+    """The (kept, while the result is alive) densities of the result's posterior"""
+    densities = _DENSITIES.get(result)
+    if densities is None:
+        densities = PosteriorDensities(result.posterior)
+        _DENSITIES[result] = densities
+    return densities
+
+
+def prepare_densities(result, param_sets: List[List[str]], lvk_param_sets=[]) -> None:
+    """Computes the densities of all the event's corner (and comparison) plots"""
+    for params in param_sets:
+        get_densities(result).compute(params)
+    for params in lvk_param_sets:
+        get_densities(result.lvk_result).compute(params)
+
+
+def _get_axes(fig: Optional[plt.Figure], K: int):
+    """The figure and its KxK axes, and if the figure is new"""
+    if fig is None:
+        plotdim = PANEL_SIZE * K + PANEL_SIZE * (K - 1.0) * WHSPACE
+        dim = LB_DIM + plotdim + TR_DIM
+        fig, axes = plt.subplots(K, K, figsize=(dim, dim))
+        lb, tr = LB_DIM / dim, (LB_DIM + plotdim) / dim
+        fig.subplots_adjust(
+            left=lb, bottom=lb, right=tr, top=tr, wspace=WHSPACE, hspace=WHSPACE
+        )
+        return fig, np.atleast_2d(axes), True
+    return fig, np.array(fig.axes).reshape((K, K)), False
+
+
+def _set_lims(ax, xlim, ylim, new_fig: bool) -> None:
+    """Sets the limits (over an existing figure, widens them to include both, as
+    corner's `_set_xlim`/`_set_ylim`)"""
+    if not new_fig:
+        x0, x1 = ax.get_xlim()
+        y0, y1 = ax.get_ylim()
+        xlim = [min(x0, xlim[0]), max(x1, xlim[1])]
+        ylim = [min(y0, ylim[0]), max(y1, ylim[1])]
+    ax.set_xlim(xlim)
+    ax.set_ylim(ylim)
+
+
+def _format_axis(ax, K: int, i: int, j: int, labels: List[str], label_kwargs: dict):
+    # (tick_params, rather than setting each tick label, which lays out the ticks)
+    ax.xaxis.set_major_locator(MaxNLocator(MAX_N_TICKS, prune="lower"))
+    if i < K - 1:
+        ax.tick_params(axis="x", labelbottom=False)
+    else:
+        ax.tick_params(axis="x", labelrotation=45)
+        ax.set_xlabel(labels[j], **label_kwargs)
+        ax.xaxis.set_label_coords(0.5, -0.3)
+        ax.xaxis.set_major_formatter(ScalarFormatter(useMathText=False))
+    if i == j:
+        ax.yaxis.set_major_locator(NullLocator())
+        ax.tick_params(axis="y", labelleft=False)
+        return
+    ax.yaxis.set_major_locator(MaxNLocator(MAX_N_TICKS, prune="lower"))
+    if j > 0:
+        ax.tick_params(axis="y", labelleft=False)
+    else:
+        ax.tick_params(axis="y", labelrotation=45)
+        ax.set_ylabel(labels[i], **label_kwargs)
+        ax.yaxis.set_label_coords(-0.3, 0.5)
+        ax.yaxis.set_major_formatter(ScalarFormatter(useMathText=False))
+
+
+def _plot_2d(
+    ax, densities: PosteriorDensities, x: str, y: str, color: str, new_fig: bool
+) -> None:
+    d = densities.get_2d(x, y)
+    base_color = ax.get_facecolor()
+    rgba_color = to_rgba(color)
+    contour_cmap = [list(rgba_color) for _ in d.levels] + [rgba_color]
+    for k in range(len(d.levels)):
+        contour_cmap[k][-1] *= float(k) / (len(d.levels) + 1)
+    base_cmap = LinearSegmentedColormap.from_list(
+        "base_cmap", [base_color, base_color], N=2
+    )
+
+    ax.plot(
+        densities.posterior[x],
+        densities.posterior[y],
+        "o",
+        zorder=-1,
+        rasterized=True,
+        color=color,
+        ms=2.0,
+        mec="none",
+        alpha=0.1,
+    )
+    ax.contourf(
+        d.X2, d.Y2, d.H2.T, [d.levels.min(), d.H.max()], cmap=base_cmap, antialiased=False
+    )
+    ax.contourf(
+        d.X2,
+        d.Y2,
+        d.H2.T,
+        np.concatenate([[0], d.levels, [d.H.max() * (1 + 1e-4)]]),
+        colors=contour_cmap,
+        antialiased=False,
+    )
+    ax.contour(d.X2, d.Y2, d.H2.T, d.levels, colors=color)
+    _set_lims(ax, densities.ranges[x], densities.ranges[y], new_fig)
+
+
+def plot_corner_densities(
+    densities: PosteriorDensities,
+    parameters: List[str],
+    labels: Optional[List[str]] = None,
+    color: str = CATALOG_MAIN_COLOR,
+    fig: Optional[plt.Figure] = None,
+    titles: bool = True,
+    quantiles: List[float] = QUANTILES,
+    label_kwargs: dict = LABEL_KWARGS,
+) -> plt.Figure:
+    """A corner plot of the (binned) densities (or drawn over fig's corner plot)"""
+    densities.compute(parameters)
+    labels = [LATEX_LABELS.get(p, p) for p in parameters] if labels is None else labels
+    K = len(parameters)
+    fig, axes, new_fig = _get_axes(fig, K)
+    for i, py in enumerate(parameters):
+        for j, px in enumerate(parameters):
+            ax = axes[i, j]
+            if j > i:
+                ax.set_frame_on(False)
+                ax.set_xticks([])
+                ax.set_yticks([])
+                continue
+            if i == j:
+                d = densities.get_1d(px)
+                ax.stairs(d.density, d.edges, color=color)
+                if len(quantiles) > 0:
+                    for q in d.quantiles[[0, 2]]:
+                        ax.axvline(q, ls="dashed", color=color)
+                if titles and ax.title.get_text() == "":
+                    ax.set_title(format_qts_to_latex(*d.quantiles), **TITLE_KWARGS)
+                _set_lims(
+                    ax, densities.ranges[px], [0, 1.1 * np.max(d.density)], new_fig
+                )
+            else:
+                _plot_2d(ax, densities, px, py, color, new_fig)
+            _format_axis(ax, K, i, j, labels, label_kwargs)
+    return fig
+
+
+def plot_corner(result, parameters: List[str]) -> plt.Figure:
+    """`NRsurResult.plot_corner(parameters)`, drawn from the event's densities"""
+    return plot_corner_densities(
+        get_densities(result), parameters, label_kwargs=NR_LABEL_KWARGS
+    )
+
+
+def plot_lvk_comparison_corner(result, parameters: List[str]) -> plt.Figure:
+    """`NRsurResult.plot_lvk_comparison_corner(parameters)`, drawn from the densities"""
+    colors = [CATALOG_MAIN_COLOR, LVK_COLOR]
+    fig = plot_corner_densities(
+        get_densities(result), parameters, color=colors[0], label_kwargs=NR_LABEL_KWARGS
+    )
+    fig = plot_corner_densities(
+        get_densities(result.lvk_result),
+        parameters,
+        color=colors[1],
+        fig=fig,
+        titles=False,
+        quantiles=[],
+        label_kwargs=NR_LABEL_KWARGS,
+    )
+    legend_elements = [
+        Line2D([0], [0], color=c, lw=4, label=l)
+        for c, l in zip(colors, ["NRSur7dq4", "LVK [XPHM]"])
+    ]
+    fig.legend(
+        handles=legend_elements,
+        loc="upper right",
+        bbox_to_anchor=(0.95, 0.95),
+        bbox_transform=fig.transFigure,
+        frameon=False,
+        fontsize=16,
+    )
+    return fig
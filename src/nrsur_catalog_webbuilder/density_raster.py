@@ -0,0 +1,144 @@
+"""Module with a raster (density-aggregated) engine for the catalog's 2D posterior plots
+
+`Catalog.plot_2d_posterior` draws each event's 2D posterior with `corner.hist2d`:
+a histogram, an opaque base fill, a filled contour and contour lines per event,
+so a catalog of hundreds of events makes a figure of thousands of contour paths,
+slow to draw and heavy to save.
+
+Here the 2D histograms of all the events (each over its own range, as hist2d)
+are binned in one `np.bincount`, smoothed and thresholded at their contour
+level together, and the events' regions (and outlines) are composited, in
+order, into one RGBA image of the axes (`resolution` pixels a side), drawn with
+a single `imshow`. The drawing depends on the image's resolution rather than on
+the events' samples; the events' median/quantile crosses stay vector overlays
+(see `CatalogView.plot_2d_posterior`).
+"""
+
+from dataclasses import dataclass
+from typing import List, Sequence, Tuple
+
+import numpy as np
+from matplotlib.colors import to_rgba
+from scipy.ndimage import binary_erosion, gaussian_filter, map_coordinates
+
+# `Catalog.plot_2d_posterior`'s hist2d settings
+BINS = 50
+SMOOTH = 1.1
+LEVEL = 1.0 - np.exp(-0.5 * 2.1**2)
+# the opacity of the regions over the background (hist2d's fill of 2 levels)
+FILL_ALPHA = 1.0 / 3
+# the opacity of the (thin) outlines over the regions
+OUTLINE_ALPHA = 0.5
+RESOLUTION = 600
+
+
+@dataclass
+class EventDensities:
+    """The events' smoothed 2D histograms, extended by two bins on each side (as
+    hist2d, for the contours at the edges), and their contour levels"""
+
+    # [events, bins + 4, bins + 4], indexed [x bin, y bin]
+    H2: np.ndarray
+    # the extended grids' first bin centers and bin widths [events]
+    x0: np.ndarray
+    dx: np.ndarray
+    y0: np.ndarray
+    dy: np.ndarray
+    levels: np.ndarray
+
+
+def event_densities(
+    xs: Sequence[np.ndarray],
+    ys: Sequence[np.ndarray],
+    bins: int = BINS,
+    smooth: float = SMOOTH,
+    level: float = LEVEL,
+) -> EventDensities:
+    """The densities of each event's (finite, with a range) x, y samples"""
+    n_events = len(xs)
+    n = np.array([len(x) for x in xs])
+    x_min, x_max = np.array([x.min() for x in xs]), np.array([x.max() for x in xs])
+    y_min, y_max = np.array([y.min() for y in ys]), np.array([y.max() for y in ys])
+    dx, dy = (x_max - x_min) / bins, (y_max - y_min) / bins
+
+    event = np.repeat(np.arange(n_events), n)
+    ix = np.floor((np.concatenate(xs) - x_min[event]) / dx[event]).astype(int)
+    iy = np.floor((np.concatenate(ys) - y_min[event]) / dy[event]).astype(int)
+    # (the max is in the last bin, as np.histogram2d)
+    index = (event * bins + np.clip(ix, 0, bins - 1)) * bins + np.clip(iy, 0, bins - 1)
+    H = np.bincount(index, minlength=n_events * bins * bins).astype(float)
+    H = gaussian_filter(H.reshape(n_events, bins, bins), (0, smooth, smooth))
+
+    # the density above which the level's probability is contained (as hist2d)
+    Hflat = -np.sort(-H.reshape(n_events, -1), axis=1)
+    sm = np.cumsum(Hflat, axis=1)
+    sm /= sm[:, -1:]
+    inside = np.maximum((sm <= level).sum(axis=1) - 1, 0)
+    levels = Hflat[np.arange(n_events), inside]
+
+    H2 = np.repeat(H.min(axis=(1, 2)), (bins + 4) ** 2).reshape(n_events, bins + 4, -1)
+    H2[:, 2:-2, 2:-2] = H
+    H2[:, 2:-2, 1] = H[:, :, 0]
+    H2[:, 2:-2, -2] = H[:, :, -1]
+    H2[:, 1, 2:-2] = H[:, 0]
+    H2[:, -2, 2:-2] = H[:, -1]
+    H2[:, 1, 1] = H[:, 0, 0]
+    H2[:, 1, -2] = H[:, 0, -1]
+    H2[:, -2, 1] = H[:, -1, 0]
+    H2[:, -2, -2] = H[:, -1, -1]
+    return EventDensities(
+        H2=H2,
+        x0=x_min - 1.5 * dx,
+        dx=dx,
+        y0=y_min - 1.5 * dy,
+        dy=dy,
+        levels=levels,
+    )
+
+
+def _pixels(lo: float, hi: float, resolution: int) -> np.ndarray:
+    return lo + (np.arange(resolution) + 0.5) * (hi - lo) / resolution
+
+
+def rasterize(
+    densities: EventDensities,
+    extent: Tuple[float, float, float, float],
+    colors: List,
+    resolution: int = RESOLUTION,
+    outline: bool = False,
+    background="white",
+) -> np.ndarray:
+    """The [y pixel, x pixel, RGBA] image (origin at the lower left) of the events'
+    regions (each over the previous ones, as the events' fills), and their outlines
+    (over all the regions, as the contour lines), in extent (x_lo, x_hi, y_lo, y_hi)"""
+    x_pixels = _pixels(extent[0], extent[1], resolution)
+    y_pixels = _pixels(extent[2], extent[3], resolution)
+    background = np.array(to_rgba(background))
+    image = np.zeros((resolution, resolution, 4))
+    outlines = []
+    size = densities.H2.shape[1] - 1
+    for e, color in enumerate(colors):
+        # the pixels in the event's (extended) grid
+        fx = (x_pixels - densities.x0[e]) / densities.dx[e]
+        fy = (y_pixels - densities.y0[e]) / densities.dy[e]
+        cols = np.flatnonzero((fx >= 0) & (fx <= size))
+        rows = np.flatnonzero((fy >= 0) & (fy <= size))
+        if len(cols) == 0 or len(rows) == 0:
+            continue
+        gx, gy = np.meshgrid(fx[cols], fy[rows])
+        H = map_coordinates(densities.H2[e], [gx, gy], order=1, mode="nearest")
+        inside = H >= densities.levels[e]
+
+        color = np.array(to_rgba(color))
+        fill = FILL_ALPHA * color + (1 - FILL_ALPHA) * background
+        fill[3] = 1.0
+        region = (slice(rows[0], rows[-1] + 1), slice(cols[0], cols[-1] + 1))
+        image[region][inside] = fill
+        if outline:
+            outlines.append((region, inside & ~binary_erosion(inside), color))
+
+    for region, edge, color in outlines:
+        pixels = image[region]
+        pixels[edge] = OUTLINE_ALPHA * color + (1 - OUTLINE_ALPHA) * pixels[edge]
+        pixels[edge, 3] = 1.0
+    return image
@@ -0,0 +1,154 @@
+"""Module to execute a page's notebook directly in the (warm) worker process
+
+The GW page notebook only loads the result, makes its plots and prints its
+configs, so starting an IPython shell and messaging each cell through it (as
+ploomber_engine does) is pure overhead. Here the code cells are exec'd one after
+the other in a fresh namespace, and their stdout/stderr, last-expression value
+and the matplotlib figures they open are captured into the cells' outputs, so the
+written ipynb looks like the one executed by ploomber_engine.
+
+IPython-only lines (`%magics` and `!shell` commands) are skipped: the worker
+already uses the Agg backend and has the catalog installed.
+"""
+
+import ast
+import base64
+import contextlib
+import csv
+import io
+import os
+import time
+from typing import List, Set
+
+import nbformat
+import psutil
+
+# outputs of cells with these tags are not published (so their figures are not rendered)
+HIDDEN_OUTPUT_TAGS = {"remove-output", "remove-cell"}
+REPR_METHODS = [
+    ("text/html", "_repr_html_"),
+    ("text/markdown", "_repr_markdown_"),
+    ("text/latex", "_repr_latex_"),
+]
+
+
+class DirectExecutionError(Exception):
+    pass
+
+
+def _strip_ipython_lines(source: str) -> str:
+    """Drops the `%magic` and `!shell` lines (kept in the written notebook)"""
+    lines = source.splitlines()
+    return "\n".join(
+        "" if line.lstrip().startswith(("%", "!")) else line for line in lines
+    )
+
+
+def _format_value(value) -> dict:
+    """Mime bundle of a cell's last-expression value"""
+    data = {"text/plain": repr(value)}
+    for mime, method in REPR_METHODS:
+        repr_method = getattr(value, method, None)
+        if callable(repr_method):
+            rep = repr_method()
+            if rep is not None:
+                data[mime] = rep
+    return data
+
+
+def _open_figures() -> Set[int]:
+    import matplotlib.pyplot as plt
+
+    return set(plt.get_fignums())
+
+
+def _figure_outputs(capture: bool, before: Set[int]) -> List[dict]:
+    """Outputs of the figures the cell opened (not in before, the figures open
+    before the cell, eg left by an earlier page); the figures are closed"""
+    import matplotlib.pyplot as plt
+
+    outputs = []
+    for num in sorted(_open_figures() - before):
+        fig = plt.figure(num)
+        if capture:
+            buf = io.BytesIO()
+            fig.savefig(buf, format="png", bbox_inches="tight")
+            outputs.append(
+                nbformat.v4.new_output(
+                    "display_data",
+                    data={
+                        "image/png": base64.b64encode(buf.getvalue()).decode(),
+                        "text/plain": repr(fig),
+                    },
+                )
+            )
+        plt.close(fig)
+    return outputs
+
+
+def _run_cell(source: str, namespace: dict, filename: str) -> tuple:
+    """Runs the cell's code, returns (stdout, stderr, last expression value)"""
+    tree = ast.parse(_strip_ipython_lines(source), filename=filename)
+    last_expr = None
+    if tree.body and isinstance(tree.body[-1], ast.Expr):
+        last_expr = ast.Expression(tree.body.pop().value)
+    stdout, stderr = io.StringIO(), io.StringIO()
+    value = None
+    with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+        exec(compile(tree, filename, "exec"), namespace)
+        if last_expr is not None:
+            value = eval(compile(last_expr, filename, "eval"), namespace)
+    return stdout.getvalue(), stderr.getvalue(), value
+
+
+def execute_notebook_directly(
+    input_path: str, output_path: str, cwd: str, profiling_data_fn: str = None
+) -> nbformat.NotebookNode:
+    """Executes the notebook's code cells in this process, writing the outputs to
+    output_path (and the per-cell runtime/memory in ploomber's profiling csv format)"""
+    nb = nbformat.read(input_path, as_version=4)
+    namespace = {"__name__": "__main__"}
+    process = psutil.Process()
+    profiling = []
+    prev_cwd = os.getcwd()
+    os.chdir(cwd)
+    try:
+        code_cells = [c for c in nb.cells if c.cell_type == "code"]
+        for i, cell in enumerate(code_cells, start=1):
+            t0 = time.time()
+            figures = _open_figures()
+            try:
+                out, err, value = _run_cell(cell.source, namespace, f"<cell {i}>")
+            except Exception as e:
+                raise DirectExecutionError(
+                    f"Error in cell {i} of {input_path}:\n{cell.source}"
+                ) from e
+            tags = set(cell.metadata.get("tags", []))
+            outputs = []
+            for name, text in [("stdout", out), ("stderr", err)]:
+                if text:
+                    outputs.append(nbformat.v4.new_output("stream", name=name, text=text))
+            if value is not None:
+                outputs.append(
+                    nbformat.v4.new_output(
+                        "execute_result", data=_format_value(value), execution_count=i
+                    )
+                )
+            outputs += _figure_outputs(
+                capture=not tags & HIDDEN_OUTPUT_TAGS, before=figures
+            )
+            cell.outputs = outputs
+            cell.execution_count = i
+            profiling.append(
+                [i, time.time() - t0, process.memory_full_info().uss / 1048576]
+            )
+    finally:
+        os.chdir(prev_cwd)
+
+    nbformat.write(nb, output_path)
+    if profiling_data_fn is not None:
+        with open(profiling_data_fn, "w") as f:
+            writer = csv.writer(f)
+            writer.writerow(["cell", "runtime", "memory"])
+            writer.writerows(profiling)
+    return nb
@@ -0,0 +1,162 @@
+"""Module with the data of the events menu page's interactive table
+
+Inlining the whole summary table (thumbnails included) in the menu page's
+markdown makes the page heavy (and slow for Sphinx to parse) with hundreds of
+events. Instead, the menu page ships a paginated, sortable DataTables table
+(from the `itables` bundle) that loads a compact JSON of the rows on demand:
+only the visible page's rows are rendered (`deferRender`), so only their
+thumbnails are loaded. A slim markdown table (without the thumbnails) stays on
+the page as the fallback for readers without javascript.
+
+The page also has a parameter-range search (eg `chi_eff > 0.2, final_mass > 80`),
+run in the browser over a static index of the events' quantiles (QUANTILES of
+the summary store) of every parameter in LATEX_LABELS. The index is assembled
+from a (hidden) record of its rows in outdir, keyed by the stat of each event's
+posterior file: only the rows of new or changed events are read from the
+summary store.
+
+The JSONs, thumbnails and DataTables bundle are published with the html (in
+`events_table/`, via the book's `html_extra_path`).
+"""
+
+import json
+import os
+import re
+from glob import glob
+from typing import List
+
+import itables
+import numpy as np
+
+from nrsur_catalog.cache import CatalogCache
+from nrsur_catalog.utils import LATEX_LABELS
+
+from .posterior_bundles import EXTRA_DIR
+from .summary_store import QUANTILES, get_event_summary, get_latex_summary
+from .thumbnails import thumbnail_fn
+from .utils import copy_if_changed
+
+EVENTS_TABLE_DIR = "events_table"
+EVENTS_TABLE_FN = "events_summary.json"
+DT_BUNDLE_FILES = ["dt_bundle.js", "dt_bundle.css"]
+THUMBNAILS_DIR = "thumbnails"
+SEARCH_INDEX_FN = "search_index.json"
+SEARCH_RECORD_FN = ".search_index.json"
+# significant digits of the index's quantiles
+SEARCH_INDEX_DIGITS = 4
+
+
+def events_table_dir(outdir: str) -> str:
+    return os.path.join(outdir, EXTRA_DIR, EVENTS_TABLE_DIR)
+
+
+def _inline_math(latex: str) -> str:
+    """$x$ -> \\(x\\) (MathJax's default inline delimiters, typeset after each draw)"""
+    return re.sub(r"\$([^$]+)\$", r"\\(\1\\)", latex)
+
+
+def get_events_table(
+    event_names: List[str], events_dir: str, cache_dir: str, columns: List[str]
+) -> dict:
+    """The table's {columns, data} (one [event, thumbnail, *values] row per event)"""
+    latex = get_latex_summary(event_names, cache_dir, columns)
+    data = []
+    for event in sorted(event_names):
+        thumbnail = thumbnail_fn(event, events_dir)
+        thumbnail = os.path.basename(thumbnail) if os.path.isfile(thumbnail) else ""
+        values = [_inline_math(latex.loc[event, p]) for p in columns]
+        data.append([event, thumbnail] + values)
+    titles = [_inline_math(LATEX_LABELS.get(p, p)) for p in columns]
+    return dict(columns=["Event", "Waveform"] + titles, data=data)
+
+
+def _write_if_changed(fn: str, txt: str) -> None:
+    """Writes the file atomically, unless it is unchanged (keeping its mtime)"""
+    if os.path.isfile(fn):
+        with open(fn, "r") as f:
+            if f.read() == txt:
+                return
+    with open(f"{fn}.tmp", "w") as f:
+        f.write(txt)
+    os.replace(f"{fn}.tmp", fn)
+
+
+def _search_row(event_name: str, cache_dir: str, parameters: List[str]) -> list:
+    """The event's [quantiles or None] of each parameter"""
+    stats = get_event_summary(event_name, cache_dir)["parameters"]
+    row = []
+    for p in parameters:
+        quantiles = stats[p]["quantiles"] if p in stats else [np.nan]
+        if np.all(np.isfinite(quantiles)):
+            row.append([float(f"{q:.{SEARCH_INDEX_DIGITS}g}") for q in quantiles])
+        else:
+            row.append(None)
+    return row
+
+
+def write_search_index(outdir: str, cache: CatalogCache) -> str:
+    """Writes the search index (only reading the new or changed events' summaries),
+    returns its path"""
+    parameters = list(LATEX_LABELS)
+    record_fn = os.path.join(outdir, SEARCH_RECORD_FN)
+    record = {}
+    if os.path.isfile(record_fn):
+        with open(record_fn, "r") as f:
+            record = json.load(f)
+    if record.get("parameters") != parameters or record.get("quantiles") != QUANTILES:
+        record = {}
+    rows = record.get("rows", {})
+
+    new_rows = {}
+    for event, path in zip(cache.event_names, cache.list):
+        st = os.stat(os.path.realpath(path))
+        stat = [st.st_size, st.st_mtime_ns]
+        if event in rows and rows[event]["stat"] == stat:
+            new_rows[event] = rows[event]
+        else:
+            new_rows[event] = dict(
+                stat=stat, values=_search_row(event, cache.dir, parameters)
+            )
+    record = dict(parameters=parameters, quantiles=QUANTILES, rows=new_rows)
+    os.makedirs(events_table_dir(outdir), exist_ok=True)
+    _write_if_changed(record_fn, json.dumps(record))
+
+    events = sorted(new_rows)
+    index = dict(
+        quantiles=QUANTILES,
+        parameters=parameters,
+        labels=[_inline_math(LATEX_LABELS[p]) for p in parameters],
+        events=events,
+        values=[new_rows[event]["values"] for event in events],
+    )
+    index_fn = os.path.join(events_table_dir(outdir), SEARCH_INDEX_FN)
+    _write_if_changed(index_fn, json.dumps(index, separators=(",", ":")))
+    return index_fn
+
+
+def write_events_table(outdir: str, cache: CatalogCache, columns: List[str]) -> str:
+    """Writes the table's JSON, thumbnails and DataTables bundle, returns the JSON path
+    (unchanged files are not rewritten)"""
+    events_dir = os.path.join(outdir, "events")
+    table_dir = events_table_dir(outdir)
+    thumbnails_dir = os.path.join(table_dir, THUMBNAILS_DIR)
+    os.makedirs(thumbnails_dir, exist_ok=True)
+    table = get_events_table(cache.event_names, events_dir, cache.dir, columns)
+
+    thumbnails = set()
+    for row in table["data"]:
+        if row[1]:
+            copy_if_changed(
+                os.path.join(events_dir, row[1]), os.path.join(thumbnails_dir, row[1])
+            )
+            thumbnails.add(row[1])
+    for fn in glob(os.path.join(thumbnails_dir, "*.png")):
+        if os.path.basename(fn) not in thumbnails:  # eg of a removed event
+            os.remove(fn)
+    itables_html_dir = os.path.join(os.path.dirname(itables.__file__), "html")
+    for fn in DT_BUNDLE_FILES:
+        copy_if_changed(os.path.join(itables_html_dir, fn), os.path.join(table_dir, fn))
+
+    json_fn = os.path.join(table_dir, EVENTS_TABLE_FN)
+    _write_if_changed(json_fn, json.dumps(table, separators=(",", ":")))
+    return json_fn
@@ -0,0 +1,112 @@
+"""Module with the warm worker processes that execute the website's build tasks
+
+Starting a fresh interpreter per event (the old `build_gwpage` shell-out) means
+re-importing nrsur_catalog, bilby, pandas, matplotlib, jupytext and
+ploomber_engine for every event. Here the worker processes import these once
+(in the pool initializer) and then take tasks off the pool's queue.
+"""
+
+import importlib
+import signal
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional
+
+from nrsur_catalog.logger import logger
+from nrsur_catalog.utils import get_event_name
+
+from .build_trace import collect_spans, trace_span
+
+WARM_MODULES = [
+    "matplotlib",
+    "matplotlib.pyplot",
+    "pandas",
+    "bilby",
+    "nrsur_catalog",
+    "jupytext",
+    "nbformat",
+    "ploomber_engine",
+]
+
+
+@dataclass
+class TaskResult:
+    """The outcome of running one build task"""
+
+    name: str
+    success: bool
+    duration: float
+    error: str = ""
+    spans: List[dict] = field(default_factory=list)
+    skipped: bool = False  # (not run, as a task it depends on failed)
+
+
+class TaskTimeoutError(Exception):
+    pass
+
+
+def _raise_timeout(signum, frame):
+    raise TaskTimeoutError("Task exceeded its wall-clock timeout")
+
+
+def _warm_worker() -> None:
+    """Pool initializer: import the heavy modules once per worker process"""
+    import matplotlib
+
+    matplotlib.use("Agg")
+    for module in WARM_MODULES:
+        importlib.import_module(module)
+    # drop any trace spans inherited from the parent process
+    collect_spans()
+
+
+def _run_task(
+    name: str,
+    func: Callable,
+    args: tuple,
+    kwargs: dict,
+    timeout: Optional[float] = None,
+) -> TaskResult:
+    """Runs one task inside a warm worker (raising a TaskTimeoutError after timeout s)"""
+    import matplotlib.pyplot as plt
+
+    t0 = time.time()
+    if timeout is not None:
+        signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        with trace_span("task", event=get_event_name(name), task=name):
+            func(*args, **kwargs)
+        result = TaskResult(name, True, time.time() - t0)
+    except Exception:
+        result = TaskResult(name, False, time.time() - t0, traceback.format_exc())
+    finally:
+        if timeout is not None:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+        # figures from the previous task must not leak into the next one
+        plt.close("all")
+    result.spans = collect_spans()
+    return result
+
+
+def get_worker_pool(num_workers: int) -> ProcessPoolExecutor:
+    """Returns a pool of long-lived, warm, worker processes"""
+    return ProcessPoolExecutor(max_workers=max(1, num_workers), initializer=_warm_worker)
+
+
+def kill_worker_pool(pool: ProcessPoolExecutor) -> None:
+    """Kills the pool's workers (eg one is stuck in C code, ignoring its timeout)"""
+    for process in list(getattr(pool, "_processes", {}).values()):
+        process.kill()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def log_task_result(result: TaskResult) -> None:
+    if result.success:
+        logger.debug(f"Finished {result.name} in {result.duration:.1f}s")
+    elif result.skipped:
+        logger.warning(f"Skipped {result.name}: {result.error}")
+    else:
+        logger.error(f"Failed {result.name}:\n{result.error}")
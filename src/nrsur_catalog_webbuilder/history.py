@@ -0,0 +1,143 @@
+"""Module to keep a history of how long each build task took (and its peak memory)
+
+The history (stored in the outdir) is used to predict how long each task will
+take, so that the scheduler can start the longest tasks first (instead of the
+slowest events starting last and setting the wall-clock time of the build).
+The peak memory (from the notebooks' profiling data) lets the scheduler only
+run as many notebooks at once as fit in the memory budget.
+Events without a history get an estimate based on their posterior size.
+"""
+
+import csv
+import json
+import os
+from typing import Dict, List, Optional
+
+from nrsur_catalog.cache import CatalogCache
+from nrsur_catalog.logger import logger
+
+from .posterior_columns import posterior_length
+
+HISTORY_FN = ".build_history.json"
+
+# weight of the newest duration in the (exponential) running average
+SMOOTHING = 0.5
+# used before there is any history to calibrate the cost-per-sample
+DEFAULT_SECONDS_PER_SAMPLE = 0.01
+DEFAULT_TASK_COST = 1.0
+# memory (MB) of a task without history, and the fallback cost-per-sample
+DEFAULT_TASK_MEMORY = 500.0
+DEFAULT_MB_PER_SAMPLE = 0.2
+
+
+def get_posterior_size(event_name: str, cache: CatalogCache) -> int:
+    """Number of posterior samples of the event (from the hdf5 metadata)"""
+    path = cache.find(event_name)
+    if not path:
+        return 0
+    try:
+        return posterior_length(path)
+    except (OSError, KeyError):
+        return 0
+
+
+def read_peak_memory(profiling_data_fn: str) -> Optional[float]:
+    """Peak memory (MB) from ploomber's `*-profiling-data.csv` (None if unavailable)"""
+    if not os.path.isfile(profiling_data_fn):
+        return None
+    memory = []
+    with open(profiling_data_fn, "r") as f:
+        for row in csv.DictReader(f):
+            try:
+                memory.append(float(row["memory"]))
+            except (KeyError, TypeError, ValueError):
+                continue
+    return max(memory) if memory else None
+
+
+class BuildHistory:
+    """Durations (in seconds) and peak memory (MB) of the previously run build tasks"""
+
+    def __init__(self, outdir: str):
+        self.path = os.path.join(outdir, HISTORY_FN)
+        self.durations: Dict[str, float] = {}
+        self.sizes: Dict[str, int] = {}
+        self.peak_memory: Dict[str, float] = {}
+        if os.path.isfile(self.path):
+            try:
+                with open(self.path, "r") as f:
+                    data = json.load(f)
+                self.durations = data.get("durations", {})
+                self.sizes = data.get("sizes", {})
+                self.peak_memory = data.get("peak_memory", {})
+            except (json.JSONDecodeError, OSError):
+                logger.warning(f"Corrupt build history {self.path}, ignoring it")
+
+    def record(
+        self,
+        name: str,
+        duration: float,
+        size: Optional[int] = None,
+        peak_memory: Optional[float] = None,
+    ) -> None:
+        """Updates the running average of the task's duration (and its peak memory)"""
+        previous = self.durations.get(name)
+        if previous is not None:
+            duration = SMOOTHING * duration + (1 - SMOOTHING) * previous
+        self.durations[name] = duration
+        if size:
+            self.sizes[name] = size
+        if peak_memory is not None:
+            self.peak_memory[name] = peak_memory
+
+    @property
+    def seconds_per_sample(self) -> float:
+        """Cost of a posterior sample, calibrated on the tasks with a known size"""
+        names = [n for n in self.sizes if n in self.durations]
+        total_size = sum(self.sizes[n] for n in names)
+        if total_size == 0:
+            return DEFAULT_SECONDS_PER_SAMPLE
+        return sum(self.durations[n] for n in names) / total_size
+
+    def estimate(self, name: str, size: Optional[int] = None) -> float:
+        """Expected duration of a task (from its history, or its posterior size)"""
+        if name in self.durations:
+            return self.durations[name]
+        if size:
+            return size * self.seconds_per_sample
+        return DEFAULT_TASK_COST
+
+    @property
+    def mb_per_sample(self) -> float:
+        """Memory of a posterior sample, calibrated on the tasks with a known size"""
+        names = [n for n in self.sizes if n in self.peak_memory]
+        total_size = sum(self.sizes[n] for n in names)
+        if total_size == 0:
+            return DEFAULT_MB_PER_SAMPLE
+        return sum(self.peak_memory[n] for n in names) / total_size
+
+    def estimate_memory(self, name: str, size: Optional[int] = None) -> float:
+        """Expected peak memory (MB) of a task (from its history, or its posterior size)"""
+        if name in self.peak_memory:
+            return self.peak_memory[name]
+        if size:
+            return max(DEFAULT_TASK_MEMORY, size * self.mb_per_sample)
+        return DEFAULT_TASK_MEMORY
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            data = dict(
+                durations=self.durations, sizes=self.sizes, peak_memory=self.peak_memory
+            )
+            json.dump(data, f, indent=1)
+        os.replace(tmp, self.path)
+
+
+def predict_makespan(costs: List[float], num_workers: int) -> float:
+    """Predicted wall-clock time of running the tasks longest-first on num_workers"""
+    workers = [0.0] * max(1, num_workers)
+    for cost in sorted(costs, reverse=True):
+        workers[workers.index(min(workers))] += cost
+    return max(workers)
@@ -0,0 +1,77 @@
+"""Module with the on-disk journal of the build tasks
+
+Each task's state (pending, running, done, failed, or skipped as a task it depends
+on failed) and number of attempts is written to the journal (in the outdir) as soon
+as it changes, so an interrupted build can be resumed (`build_nrsur_website
+--resume`) from where it stopped.
+"""
+
+import json
+import os
+import time
+from typing import Dict, List
+
+from nrsur_catalog.logger import logger
+
+JOURNAL_FN = ".build_journal.json"
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+
+class BuildJournal:
+    """The state of each build task"""
+
+    def __init__(self, outdir: str, resume: bool = False):
+        self.path = os.path.join(outdir, JOURNAL_FN)
+        self.tasks: Dict[str, dict] = {}
+        if resume and os.path.isfile(self.path):
+            try:
+                with open(self.path, "r") as f:
+                    self.tasks = json.load(f)
+            except (json.JSONDecodeError, OSError):
+                logger.warning(f"Corrupt build journal {self.path}, starting over")
+
+    def state(self, name: str) -> str:
+        return self.tasks.get(name, {}).get("state", PENDING)
+
+    def attempts(self, name: str) -> int:
+        return self.tasks.get(name, {}).get("attempts", 0)
+
+    @property
+    def done(self) -> List[str]:
+        return [name for name in self.tasks if self.state(name) == DONE]
+
+    def mark_pending(self, names: List[str]) -> None:
+        for name in names:
+            entry = self.tasks.setdefault(name, dict(attempts=0))
+            entry.update(state=PENDING, updated=time.time())
+        self.save()
+
+    def set_state(self, name: str, state: str, error: str = "") -> None:
+        entry = self.tasks.setdefault(name, dict(attempts=0))
+        if state == RUNNING:
+            entry["attempts"] += 1
+        entry.update(state=state, error=error, updated=time.time())
+        self.save()
+
+    def forget(self, name: str) -> None:
+        """Drops the task's entry (eg its inputs changed since it was done)"""
+        self.tasks.pop(name, None)
+
+    def summary(self) -> Dict[str, int]:
+        """{state: number of tasks}"""
+        counts = {}
+        for name in self.tasks:
+            counts[self.state(name)] = counts.get(self.state(name), 0) + 1
+        return counts
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.tasks, f, indent=1)
+        os.replace(tmp, self.path)
@@ -2,6 +2,7 @@
 
 import os
 import shutil
+from typing import Dict, List, Optional
 
 import jupytext
 import nbformat
@@ -24,13 +25,46 @@ POSTERIORS = [
     "final_spin",
 ]
 
+from .build_trace import trace_span
+from .direct_render import execute_notebook_directly
+from .events_table import write_events_table, write_search_index
+from .warm_shell import execute_notebook_in_warm_shell
+from .manifest import LIBRARIES, BuildManifest, get_library_versions
+from .summary_store import summary_markdown
 from .utils import is_file, get_animation_cell
 
 HERE = os.path.dirname(__file__)
 GW_PAGE_TEMPLATE = os.path.join(HERE, "page_templates/gw_notebook_template.py")
+# (inlined into the pages' notebooks: the readers have no webbuilder)
+BUNDLE_READER = os.path.join(HERE, "bundle_reader.py")
 CATALOG_TEMPLATE = os.path.join(HERE, "page_templates/catalog_plots.py")
+# the build's cells, swapped in for the templates' cells of the same `build:` tag
+# while the pages are executed (the published notebooks keep the templates' cells)
+GW_BUILD_CELLS = os.path.join(HERE, "page_templates/gw_build_cells.py")
+CATALOG_BUILD_CELLS = os.path.join(HERE, "page_templates/catalog_build_cells.py")
+BUILD_TAG = "build:"
 TABLE_PAGE_TEMPLATE = os.path.join(HERE, "page_templates/gw_menu_page.md")
 
+GW_PAGE_PLOTS = [
+    "mass_corner",
+    "spin_corner",
+    "effective_spin_corner",
+    "sky_localisation_corner",
+    "remnant_corner",
+    "compare_mass_corner",
+    "compare_spin_corner",
+    "compare_effective_spin_corner",
+    "compare_sky_localisation_corner",
+    "waveform",
+]
+# (the plots' thumbnails are kept when a page is cleaned: they are only remade if
+# their plot's content changes, see thumbnails.py)
+# written next to the executed notebook (by ploomber_engine's memory profiling)
+PROFILING_SUFFIXES = ["-profiling-data.csv", "-memory-usage.png"]
+# ploomber: a new IPython shell per notebook, warm-shell: one shell per worker
+# reused across its notebooks, direct: exec the cells without an IPython shell
+RENDER_MODES = ["ploomber", "warm-shell", "direct"]
+
 
 def __get_param_definitions() -> str:
     """Returns a string with the parameter definitions"""
@@ -46,51 +80,64 @@ def make_events_menu_page(outdir: str, cache: CatalogCache) -> None:
     src_fname = f"{outdir}/events/gw_menu_page.md"
     os.makedirs(os.path.dirname(src_fname), exist_ok=True)
     events_dir = os.path.abspath(os.path.join(outdir, "events"))
-    summary_table = get_catalog_summary(events_dir, cache.dir, columns=POSTERIORS)
-    _replace_strings_from_file(
-        TABLE_PAGE_TEMPLATE,
-        {
-            "{{EVENTS_DIR}}": events_dir,
-            "{{CACHE_DIR}}": cache.dir,
-            "{{SUMMARY_TABLE}}": summary_table.to_markdown(index=False),
-            "{{PARAM_DEFINTIONS}}": __get_param_definitions(),
-        },
-        src_fname,
-    )
+    with trace_span("summary_table"):
+        summary_table = get_catalog_summary(events_dir, cache.dir, columns=POSTERIORS)
+        # the page's interactive table loads the rows (and thumbnails) on demand, the
+        # markdown table (without the thumbnails) is the fallback without javascript;
+        # its search filters the index of the events' quantiles
+        write_events_table(outdir, cache, columns=POSTERIORS)
+        write_search_index(outdir, cache)
+        summary_table = summary_table.drop(columns=["Waveform"])
+    with trace_span("template_substitution"):
+        _replace_strings_from_file(
+            TABLE_PAGE_TEMPLATE,
+            {
+                "{{EVENTS_DIR}}": events_dir,
+                "{{CACHE_DIR}}": cache.dir,
+                "{{SUMMARY_TABLE}}": summary_table.to_markdown(index=False),
+                "{{PARAM_DEFINTIONS}}": __get_param_definitions(),
+            },
+            src_fname,
+        )
 
 
 
-def convert_py_to_ipynb(py_fn) -> str:
+def convert_py_to_ipynb(py_fn, event_name: Optional[str] = None) -> str:
     """Converts a python file to a jupyter notebook"""
-    ipynb_fn = py_fn.replace(".py", ".ipynb")
-    template_py_pointer = jupytext.read(py_fn, fmt="py:light")
-    jupytext.write(template_py_pointer, ipynb_fn)
+    with trace_span("jupytext_conversion", event=event_name):
+        ipynb_fn = f"{os.path.splitext(py_fn)[0]}.ipynb"
+        template_py_pointer = jupytext.read(py_fn, fmt="py:light")
+        jupytext.write(template_py_pointer, ipynb_fn)
 
-    # ensure notebook is valid
-    notebook = nbformat.read(ipynb_fn, as_version=4)
-    nbformat.validate(notebook)
-    os.remove(py_fn)
+        # ensure notebook is valid
+        notebook = nbformat.read(ipynb_fn, as_version=4)
+        nbformat.validate(notebook)
+        os.remove(py_fn)
     return ipynb_fn
 
 
-def make_gw_page(event_name: str, outdir: str, cache: CatalogCache):
-    """Writes the GW event notebook and executes it"""
-    md_fn = f"{outdir}/{event_name}.py"
+def make_gw_page(
+    event_name: str, outdir: str, cache: CatalogCache, render_mode: str = "ploomber"
+):
+    """Writes the GW event notebook and executes it (render_mode: one of RENDER_MODES)"""
+    md_fn = _partial_fn(f"{outdir}/{event_name}.py")
     logger.debug(f"Making {event_name} page")
-    nrsurr_res = NRsurResult.load(event_name, cache_dir=cache.dir)
-    summary_md = nrsurr_res.summary(markdown=True)
+    with trace_span("summary_table", event=event_name):
+        summary_md = summary_markdown(event_name, cache.dir)
     animation_md = get_animation_cell(event_name)
-    _replace_strings_from_file(
-        GW_PAGE_TEMPLATE,
-        {
-            "{{GW EVENT NAME}}": event_name,
-            "{{NRSUR_CATALOG_VERSION}}": __version__,
-            "{{SUMMARY_TABLE}}": summary_md,
-            "{{ANIMATION_CELL}}": animation_md
-        },
-        md_fn,
+    replacements = {
+        "{{GW EVENT NAME}}": event_name,
+        "{{NRSUR_CATALOG_VERSION}}": __version__,
+        "{{SUMMARY_TABLE}}": summary_md,
+        "{{ANIMATION_CELL}}": animation_md,
+        "{{BUNDLE_READER}}": _bundle_reader_source(),
+    }
+    with trace_span("template_substitution", event=event_name):
+        _replace_strings_from_file(GW_PAGE_TEMPLATE, replacements, md_fn)
+    ipynb_fn = convert_py_to_ipynb(md_fn, event_name)
+    reader_cells = _swap_cells(
+        ipynb_fn, _read_build_cells(GW_BUILD_CELLS, replacements)
     )
-    ipynb_fn = convert_py_to_ipynb(md_fn)
     logger.debug(
         f"Executing GW{event_name}:\n"
         f"    - cwd: {outdir}\n"
@@ -109,52 +156,224 @@ def make_gw_page(event_name: str, outdir: str, cache: CatalogCache):
 
     # if any of the plots are missing, execute the notebook
     # if any_plots_missing:
-    execute_notebook(
-        ipynb_fn,
-        ipynb_fn,
-        cwd=outdir,
-        save_profiling_data=True,
-        profile_memory=True,
-        progress_bar=False,
-        verbose=False,
+    with trace_span("notebook_execution", event=event_name):
+        _execute_notebook_atomically(
+            ipynb_fn,
+            f"{outdir}/{event_name}.ipynb",
+            cwd=outdir,
+            render_mode=render_mode,
+            reader_cells=reader_cells,
+            progress_bar=False,
+            verbose=False,
+        )
+
+
+def get_gw_page_outputs(event_name: str, outdir: str) -> List[str]:
+    """Returns the files written when building the GW event page"""
+    outputs = [f"{outdir}/{event_name}.ipynb"]
+    outputs += [f"{outdir}/{event_name}{suffix}" for suffix in PROFILING_SUFFIXES]
+    outputs += [f"{outdir}/{event_name}_{plot}.png" for plot in GW_PAGE_PLOTS]
+    return outputs
+
+
+def clean_gw_page(event_name: str, outdir: str) -> None:
+    """Removes a (stale) GW event page and its plots"""
+    partial_fns = [_partial_fn(f"{outdir}/{event_name}{ext}") for ext in [".py", ".ipynb"]]
+    for fname in get_gw_page_outputs(event_name, outdir) + partial_fns:
+        if is_file(fname):
+            os.remove(fname)
+
+
+def gw_page_fingerprint(
+    event_name: str, cache: CatalogCache, manifest: BuildManifest
+) -> str:
+    """Fingerprint of the inputs of the GW event page"""
+    return manifest.fingerprint(
+        inputs=dict(
+            event_name=event_name,
+            version=__version__,
+            animation=get_animation_cell(event_name),
+            libraries=get_library_versions(),
+        ),
+        files=[
+            GW_PAGE_TEMPLATE,
+            GW_BUILD_CELLS,
+            BUNDLE_READER,
+            cache.find(event_name),
+            cache.find(event_name, lvk_posteriors=True),
+        ],
+    )
+
+
+def menu_page_fingerprint(
+    cache: CatalogCache, manifest: BuildManifest, event_pages: Dict[str, str]
+) -> str:
+    """Fingerprint of the inputs of the events menu page
+    (event_pages: the {event_name: fingerprint} of the built event pages)"""
+    return manifest.fingerprint(
+        inputs=dict(
+            version=__version__,
+            columns=POSTERIORS,
+            event_pages=event_pages,
+            libraries=get_library_versions(LIBRARIES + ["itables"]),
+        ),
+        files=[TABLE_PAGE_TEMPLATE] + cache.list,
+    )
+
+
+def catalog_page_fingerprint(cache: CatalogCache, manifest: BuildManifest) -> str:
+    """Fingerprint of the inputs of the catalog plots page"""
+    return manifest.fingerprint(
+        inputs=dict(version=__version__, libraries=get_library_versions()),
+        files=[CATALOG_TEMPLATE, CATALOG_BUILD_CELLS, BUNDLE_READER] + cache.list,
     )
 
 
+def _bundle_reader_source() -> str:
+    with open(BUNDLE_READER, "r") as f:
+        return f.read().strip()
+
+
 def _replace_strings_from_file(fname: str, replacements: dict, outfname: str) -> None:
     """Replaces strings in a file"""
     with open(fname, "r") as f:
         txt = f.read()
         for key, value in replacements.items():
             txt = txt.replace(key, value)
-    with open(outfname, "w") as f:
+    if os.path.isfile(outfname):
+        with open(outfname, "r") as f:
+            if f.read() == txt:
+                # unchanged: keep the mtime, so Sphinx does not re-read the page
+                return
+    with open(f"{outfname}.tmp", "w") as f:
         f.write(txt)
+    os.replace(f"{outfname}.tmp", outfname)
+
+
+def _build_cell_name(cell: nbformat.NotebookNode) -> Optional[str]:
+    for tag in cell.metadata.get("tags", []):
+        if tag.startswith(BUILD_TAG):
+            return tag[len(BUILD_TAG) :]
+    return None
+
+
+def _read_build_cells(fname: str, replacements: dict) -> Dict[str, nbformat.NotebookNode]:
+    """The {name: cell} of the build cells file's `build:<name>` tagged cells"""
+    with open(fname, "r") as f:
+        txt = f.read()
+        for key, value in replacements.items():
+            txt = txt.replace(key, value)
+    cells = jupytext.reads(txt, fmt="py:light").cells
+    return {_build_cell_name(c): c for c in cells if _build_cell_name(c)}
+
+
+def _swap_cells(
+    ipynb_fn: str, cells: Dict[str, nbformat.NotebookNode]
+) -> Dict[str, nbformat.NotebookNode]:
+    """Swaps the notebook's `build:<name>` tagged cells for the cells of the same name,
+    returns the swapped out {name: cell}"""
+    notebook = nbformat.read(ipynb_fn, as_version=4)
+    swapped = {}
+    for i, cell in enumerate(notebook.cells):
+        name = _build_cell_name(cell)
+        if name in cells:
+            swapped[name] = cell
+            notebook.cells[i] = cells[name]
+    missing = set(cells) - set(swapped)
+    if missing:
+        raise ValueError(f"{ipynb_fn} has no cells tagged {BUILD_TAG}{sorted(missing)}")
+    nbformat.validate(notebook)
+    nbformat.write(notebook, ipynb_fn)
+    return swapped
+
+
+def _partial_fn(fname: str) -> str:
+    """Hidden name for an output that is still being written (not globbed by the toc)"""
+    dirname, basename = os.path.split(fname)
+    stem, ext = os.path.splitext(basename)
+    return os.path.join(dirname, f".{stem}.partial{ext}")
+
+
+def _execute_notebook_atomically(
+    partial_fn: str,
+    ipynb_fn: str,
+    cwd: str,
+    render_mode: str = "ploomber",
+    reader_cells: Optional[Dict[str, nbformat.NotebookNode]] = None,
+    **kwargs,
+):
+    """Executes the partial notebook, only writing `ipynb_fn` once the execution succeeded
+    (render_mode: one of RENDER_MODES; reader_cells: the swapped out template cells,
+    swapped back in the executed notebook)"""
+    if render_mode not in RENDER_MODES:
+        raise ValueError(f"Unknown render mode {render_mode}, use one of {RENDER_MODES}")
+    partial_stem = os.path.splitext(partial_fn)[0]
+    try:
+        if render_mode == "direct":
+            execute_notebook_directly(
+                partial_fn,
+                partial_fn,
+                cwd=cwd,
+                profiling_data_fn=f"{partial_stem}-profiling-data.csv",
+            )
+        elif render_mode == "warm-shell":
+            execute_notebook_in_warm_shell(
+                partial_fn,
+                partial_fn,
+                cwd=cwd,
+                profiling_data_fn=f"{partial_stem}-profiling-data.csv",
+            )
+        else:
+            execute_notebook(
+                partial_fn,
+                partial_fn,
+                cwd=cwd,
+                save_profiling_data=True,
+                profile_memory=True,
+                **kwargs,
+            )
+    finally:
+        for suffix in PROFILING_SUFFIXES:
+            if os.path.isfile(f"{partial_stem}{suffix}"):
+                os.replace(
+                    f"{partial_stem}{suffix}",
+                    f"{os.path.splitext(ipynb_fn)[0]}{suffix}",
+                )
+    if reader_cells:
+        _swap_cells(partial_fn, reader_cells)
+    os.replace(partial_fn, ipynb_fn)
 
 
 def make_catalog_page(outdir: str, cache: CatalogCache):
     """Writes the catalog notebook and executes it"""
-    py_fname = f"{outdir}/catalog_plots.py"
-    shutil.copyfile(CATALOG_TEMPLATE, py_fname)
-    _replace_strings_from_file(
-        py_fname,
-        {
-            "{{NRSUR_CATALOG_VERSION}}": __version__,
-        },
-        py_fname,
-    )
+    py_fname = _partial_fn(f"{outdir}/catalog_plots.py")
+    replacements = {
+        "{{NRSUR_CATALOG_VERSION}}": __version__,
+        "{{BUNDLE_READER}}": _bundle_reader_source(),
+    }
+    with trace_span("template_substitution"):
+        shutil.copyfile(CATALOG_TEMPLATE, py_fname)
+        _replace_strings_from_file(py_fname, replacements, py_fname)
     ipynb_fn = convert_py_to_ipynb(py_fname)
-
-    tmp_cache = f"{outdir}/{DEFAULT_CACHE_DIR}"
-    os.makedirs(tmp_cache, exist_ok=True)
-    for fname in os.listdir(cache.dir):
-        src = os.path.join(cache.dir, fname)
-        dst = os.path.join(tmp_cache, fname)
-        if not is_file(dst):
-            os.symlink(src, dst)
-
-    execute_notebook(
-        ipynb_fn,
-        f"{outdir}/catalog_plots.ipynb",
-        cwd=outdir,
-        save_profiling_data=True,
-        profile_memory=True,
+    reader_cells = _swap_cells(
+        ipynb_fn, _read_build_cells(CATALOG_BUILD_CELLS, replacements)
     )
+
+    with trace_span("cache_symlinking"):
+        tmp_cache = f"{outdir}/{DEFAULT_CACHE_DIR}"
+        os.makedirs(tmp_cache, exist_ok=True)
+        for fname in os.listdir(cache.dir):
+            if fname.startswith("."):  # hidden (as in the build's web cache)
+                continue
+            src = os.path.join(cache.dir, fname)
+            dst = os.path.join(tmp_cache, fname)
+            if not is_file(dst):
+                os.symlink(src, dst)
+
+    with trace_span("notebook_execution"):
+        _execute_notebook_atomically(
+            ipynb_fn,
+            f"{outdir}/catalog_plots.ipynb",
+            cwd=outdir,
+            reader_cells=reader_cells,
+        )
@@ -0,0 +1,116 @@
+"""Module to track the inputs of each built page (the build manifest)
+
+The manifest (stored in the outdir) records a fingerprint of the inputs of
+each page: the data files, the template text, the substituted values and the
+library versions. A page is only rebuilt if its fingerprint changes.
+
+Hashing multi-GB HDF5 files is slow, so file hashes are cached against the
+file's (size, mtime, inode) stat -- a file is only re-hashed if its stat changes.
+"""
+
+import hashlib
+import json
+import os
+from importlib.metadata import PackageNotFoundError, version
+from typing import Dict, List, Optional
+
+from nrsur_catalog.logger import logger
+
+MANIFEST_FN = ".build_manifest.json"
+CHUNK_SIZE = 1 << 20
+
+LIBRARIES = [
+    "nrsur_catalog",
+    "bilby",
+    "corner",
+    "matplotlib",
+    "numpy",
+    "pandas",
+    "jupytext",
+    "ploomber-engine",
+]
+
+
+def get_library_versions(libraries: List[str] = LIBRARIES) -> Dict[str, str]:
+    """Returns the {library: version} of the libraries used to build the pages"""
+    versions = {}
+    for lib in libraries:
+        try:
+            versions[lib] = version(lib)
+        except PackageNotFoundError:
+            versions[lib] = ""
+    return versions
+
+
+def hash_text(txt: str) -> str:
+    return hashlib.sha256(txt.encode()).hexdigest()
+
+
+def _hash_file(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class BuildManifest:
+    """Fingerprints of the inputs used to build each page of the website"""
+
+    def __init__(self, outdir: str):
+        self.path = os.path.join(outdir, MANIFEST_FN)
+        self.pages: Dict[str, str] = {}
+        self.stat_cache: Dict[str, list] = {}
+        if os.path.isfile(self.path):
+            try:
+                with open(self.path, "r") as f:
+                    data = json.load(f)
+                self.pages = data.get("pages", {})
+                self.stat_cache = data.get("stat_cache", {})
+            except (json.JSONDecodeError, OSError):
+                logger.warning(f"Corrupt build manifest {self.path}, rebuilding all pages")
+
+    def hash_file(self, path: str) -> str:
+        """Content hash of a file (reusing the cached hash if its stat is unchanged)"""
+        path = os.path.realpath(path)
+        if not os.path.isfile(path):
+            return ""
+        st = os.stat(path)
+        stat = [st.st_size, st.st_mtime_ns, st.st_ino]
+        cached = self.stat_cache.get(path)
+        if cached is not None and cached[:3] == stat:
+            return cached[3]
+        logger.debug(f"Hashing {path}")
+        digest = _hash_file(path)
+        self.stat_cache[path] = stat + [digest]
+        return digest
+
+    def fingerprint(self, inputs: Dict[str, object], files: List[str] = []) -> str:
+        """Fingerprint of a page's inputs (values + content of the files)"""
+        data = dict(
+            inputs=inputs,
+            files={os.path.basename(f): self.hash_file(f) for f in files if f},
+        )
+        return hash_text(json.dumps(data, sort_keys=True, default=str))
+
+    def get(self, page: str) -> Optional[str]:
+        return self.pages.get(page)
+
+    def is_stale(self, page: str, fingerprint: str, outputs: List[str] = []) -> bool:
+        """True if the page's inputs changed (or any of its outputs is missing)"""
+        if self.pages.get(page) != fingerprint:
+            return True
+        return not all(os.path.exists(o) for o in outputs)
+
+    def record(self, page: str, fingerprint: str) -> None:
+        self.pages[page] = fingerprint
+
+    def forget(self, page: str) -> None:
+        self.pages.pop(page, None)
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(dict(pages=self.pages, stat_cache=self.stat_cache), f, indent=1)
+        os.replace(tmp, self.path)
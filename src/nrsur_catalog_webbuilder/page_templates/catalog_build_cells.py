@@ -0,0 +1,43 @@
+# The build's cells of the catalog notebook (catalog_plots.py): while the page is
+# executed, each replaces the template's cell of the same `build:` tag, and the
+# template's cells are restored in the published (readers') notebook.
+
+# + tags=["remove-output", "build:load"]
+# the posteriors are cached in the build; the figures are drawn in parallel (sharing
+# the catalog's per-event posteriors, split once), and reused from the
+# (content-addressed) plot cache unless the events or the figure's own inputs changed
+from nrsur_catalog_webbuilder.bundle_reader import load_catalog
+from nrsur_catalog_webbuilder.catalog_figures import catalog_view, figure_inputs
+from nrsur_catalog_webbuilder.parallel_plots import cached_plots
+
+catalog = catalog_view(load_catalog(cache_dir=".nrsur_catalog_cache"))
+
+# + tags=["remove-output", "build:violins"]
+plots = []
+for param in violin_params:
+    plots.append(
+        dict(
+            fname=f"{param}_violin.png",
+            make_plot=lambda param=param: catalog.violin_plot(param),
+            kind="binned_violin",
+            **figure_inputs(catalog, [param]),
+        )
+    )
+
+# + tags=["remove-output", "build:plots_2d"]
+for name, (params, kwargs) in plots_2d.items():
+    plots.insert(  # (the slowest first)
+        0,
+        dict(
+            fname=f"{name}.png",
+            make_plot=lambda params=params, kwargs=kwargs: catalog.plot_2d_posterior(
+                *params, **kwargs
+            ),
+            kind="raster_2d_posterior",
+            kwargs=kwargs,
+            **figure_inputs(catalog, params),
+        ),
+    )
+
+# the events' quantiles (of the 2D plots) are computed once (if any plot is drawn)
+cached_plots(plots, prepare=lambda: catalog.get_posterior_quantiles())
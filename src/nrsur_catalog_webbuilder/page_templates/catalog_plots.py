@@ -23,29 +23,41 @@
 # # Catalog plots
 #
 # Here we have some catalog plots showing the ensemble results of the catalog.
-# (it may take a few minutes to download the data the first time you run this notebook.)
 #
 
 # + tags=["hide-cell"]
 # ! pip install nrsur_catalog
 
-# + tags=["remove-output"]
-from nrsur_catalog import Catalog
+# + tags=["hide-cell"]
+{{BUNDLE_READER}}
+# -
 
-catalog = Catalog.load(cache_dir=".nrsur_catalog_cache")
+# + tags=["remove-output", "build:load"]
+# the catalog's slim web bundle (its downsampled posteriors, in float32) is read by
+# the bundle reader above (which downloads the posteriors if there is no bundle)
+catalog = load_catalog(cache_dir=".nrsur_catalog_cache")
+# (the downsampled posteriors: to download all the posteriors to `cache_dir`, use
+# from nrsur_catalog import Catalog
+# catalog = Catalog.load(cache_dir=".nrsur_catalog_cache"))
 
 # -
 
 # ## Violin Plots
 
 # + tags=["remove-output"]
-catalog.violin_plot("mass_1_source")
-catalog.violin_plot("mass_2_source")
-catalog.violin_plot("mass_ratio")
-catalog.violin_plot("chi_eff")
-catalog.violin_plot("final_mass")
-catalog.violin_plot("final_spin")
-catalog.violin_plot("final_kick")
+violin_params = [
+    "mass_1_source",
+    "mass_2_source",
+    "mass_ratio",
+    "chi_eff",
+    "final_mass",
+    "final_spin",
+    "final_kick",
+]
+
+# + tags=["remove-output", "build:violins"]
+for param in violin_params:
+    catalog.violin_plot(param)
 
 # -
 
@@ -75,17 +87,22 @@ catalog.violin_plot("final_kick")
 # ## 2D Scatter Plots
 
 # + tags=["remove-output"]
-fig = catalog.plot_2d_posterior("mass_1_source", "mass_2_source")
-fig.savefig("catalog_mass_1_mass_2.png")
-fig = catalog.plot_2d_posterior(
-    "chi_eff", "mass_ratio", event_posteriors=False, event_quantiles=False
-)
-fig.savefig("catalog_chi_eff_mass_ratio.png")
-fig = catalog.plot_2d_posterior(
-    "chi_p", "final_kick", event_posteriors=True, event_quantiles=False
+plots_2d = dict(
+    catalog_mass_1_mass_2=(["mass_1_source", "mass_2_source"], {}),
+    catalog_chi_eff_mass_ratio=(
+        ["chi_eff", "mass_ratio"],
+        dict(event_posteriors=False, event_quantiles=False),
+    ),
+    catalog_chi_p_final_kick=(
+        ["chi_p", "final_kick"],
+        dict(event_posteriors=True, event_quantiles=False),
+    ),
 )
-fig.savefig("catalog_chi_p_final_kick.png")
 
+# + tags=["remove-output", "build:plots_2d"]
+for name, (params, kwargs) in plots_2d.items():
+    fig = catalog.plot_2d_posterior(*params, **kwargs)
+    fig.savefig(f"{name}.png")
 
 # -
 
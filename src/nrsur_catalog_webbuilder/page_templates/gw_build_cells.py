@@ -0,0 +1,77 @@
+# The build's cells of the event notebook (gw_notebook_template.py): while the page
+# is executed, each replaces the template's cell of the same `build:` tag, and the
+# template's cells are restored in the published (readers') notebook.
+
+# + tags=["remove-output", "build:load"]
+# the posterior is cached in the build (so loaded in full); plots are drawn in
+# parallel (sharing the loaded posterior), and reused from the (content-addressed)
+# plot cache when their inputs are unchanged; the summary is read from the
+# per-event summary store
+from nrsur_catalog.cache import CatalogCache
+from nrsur_catalog_webbuilder.bundle_reader import load_result
+from nrsur_catalog_webbuilder.corner_densities import (
+    plot_corner,
+    plot_lvk_comparison_corner,
+    prepare_densities,
+)
+from nrsur_catalog_webbuilder.parallel_plots import cached_plots
+from nrsur_catalog_webbuilder.summary_store import summary_table
+from nrsur_catalog_webbuilder.waveform_store import plot_signal
+
+nrsur_result = load_result("{{GW EVENT NAME}}", cache_dir=".nrsur_catalog_cache")
+cache = CatalogCache(".nrsur_catalog_cache")
+posterior_files = [
+    cache.find("{{GW EVENT NAME}}"),
+    cache.find("{{GW EVENT NAME}}", lvk_posteriors=True),
+]
+
+# + tags=["remove-output", "build:summary"]
+summary_table("{{GW EVENT NAME}}", ".nrsur_catalog_cache", nrsur_result)
+
+# + tags=["hide-input", "remove-output", "build:plots"]
+# NRSurrogate corner plots (and the waveform plot, the slowest, first)
+
+plots = [
+    dict(
+        fname="{{GW EVENT NAME}}_waveform.png",
+        make_plot=lambda: plot_signal(nrsur_result, outdir="."),
+        files=posterior_files[:1],
+        kind="waveform",
+    )
+]
+for name, params in param_sets.items():
+    plots.append(
+        dict(
+            fname=f"{{GW EVENT NAME}}_{name}_corner.png",
+            make_plot=lambda params=params: plot_corner(nrsur_result, params),
+            files=posterior_files[:1],
+            kind="binned_corner",
+            params=params,
+        )
+    )
+
+    if name == "remnant":
+        continue
+
+    # LVK-Comparison plots
+    plots.append(
+        dict(
+            fname=f"{{GW EVENT NAME}}_compare_{name}_corner.png",
+            make_plot=lambda params=params: plot_lvk_comparison_corner(
+                nrsur_result, params
+            ),
+            files=posterior_files,
+            kind="binned_lvk_comparison_corner",
+            params=params,
+        )
+    )
+
+# the 1D/2D densities of all the corner plots are computed once (if any is drawn)
+cached_plots(
+    plots,
+    prepare=lambda: prepare_densities(
+        nrsur_result,
+        list(param_sets.values()),
+        [p for name, p in param_sets.items() if name != "remnant"],
+    ),
+)
@@ -32,16 +32,24 @@ pd.set_option("display.max_rows", None, "display.max_columns", None)
 #
 # Below are some plots for {{GW EVENT NAME}} from the NRSurrogate Catalog.
 
-# + tags=["remove-output"]
-from nrsur_catalog import NRsurResult
+# + tags=["hide-cell"]
+{{BUNDLE_READER}}
+# -
 
-nrsur_result = NRsurResult.load("{{GW EVENT NAME}}", cache_dir=".nrsur_catalog_cache")
-# you can specify a `cache_dir`: folder where data will be downloaded
+# + tags=["remove-output", "build:load"]
+# the event's slim web bundle (the page's parameters, in float32) is read by the
+# bundle reader above (which downloads the full posterior if there is no bundle)
+import os
+
+nrsur_result = load_result("{{GW EVENT NAME}}", cache_dir=".nrsur_catalog_cache")
+# (only the page's parameters: for the full posterior, downloaded to `cache_dir`, use
+# from nrsur_catalog import NRsurResult
+# nrsur_result = NRsurResult.load("{{GW EVENT NAME}}", cache_dir=".nrsur_catalog_cache"))
 # -
 
 # ## Summary
 
-# + tags=["remove-output"]
+# + tags=["remove-output", "build:summary"]
 nrsur_result.summary()
 # -
 
@@ -54,9 +62,7 @@ nrsur_result.summary()
 # Lets make some plots!
 
 # + tags=["hide-input", "remove-output"]
-# NRSurrogate corner plots
-
-import os
+# the parameters of the corner plots
 
 param_sets = dict(
     mass=["mass_1_source", "mass_2_source", "mass_ratio"],
@@ -65,6 +71,10 @@ param_sets = dict(
     sky_localisation=["luminosity_distance", "ra", "dec"],
     remnant=["final_mass", "final_spin", "final_kick"],
 )
+
+# + tags=["hide-input", "remove-output", "build:plots"]
+# NRSurrogate corner plots
+
 for name, params in param_sets.items():
     fname = f"{{GW EVENT NAME}}_{name}_corner.png"
     if not os.path.isfile(fname):
@@ -0,0 +1,76 @@
+"""Module to draw a page's (independent) plots in parallel
+
+The GW page draws nine corner/LVK-comparison plots and the waveform plot one
+after the other on one core. `cached_plots` fans them out to forked worker
+processes: the posterior the notebook already loaded is shared with them
+through fork's copy-on-write memory (nothing is pickled or re-loaded), and each
+worker draws one plot at a time (through the plot cache).
+
+The number of plot workers is NRSUR_PLOT_WORKERS (default: all the cores),
+`build_nrsur_website` sets it to the cores left per notebook worker.
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, List, Optional
+
+from .plot_cache import PlotCache, cached_plot, from_plot_cache
+
+PLOT_WORKERS_ENV_VAR = "NRSUR_PLOT_WORKERS"
+
+# the plots being drawn (inherited by the forked workers, which get their index)
+_PLOTS: List[dict] = []
+
+
+def get_plot_workers() -> int:
+    return int(os.environ.get(PLOT_WORKERS_ENV_VAR, multiprocessing.cpu_count()))
+
+
+def _draw_plot(index: int) -> str:
+    import matplotlib.pyplot as plt
+
+    plt.close("all")  # figures inherited from the notebook
+    fname = cached_plot(**_PLOTS[index])
+    plt.close("all")
+    return fname
+
+
+def cached_plots(
+    plots: List[dict],
+    num_workers: Optional[int] = None,
+    prepare: Optional[Callable] = None,
+) -> List[str]:
+    """Draws the plots (each a dict of `cached_plot` kwargs), in parallel
+
+    The plots are started in order, so list the slowest first (eg the waveform).
+    Plots already in the plot cache are linked in this process.
+    prepare: called (in this process) before any plot is drawn, if any has to be,
+        eg to compute data shared by the plots (see `corner_densities`)
+    """
+    num_workers = get_plot_workers() if num_workers is None else num_workers
+    cache = PlotCache()
+    plots = [dict(plot, cache=cache) for plot in plots]
+    todo = [
+        plot
+        for plot in plots
+        if not from_plot_cache(**{k: v for k, v in plot.items() if k != "make_plot"})
+    ]
+
+    if todo and prepare is not None:
+        prepare()
+
+    num_workers = min(num_workers, len(todo))
+    if num_workers <= 1 or "fork" not in multiprocessing.get_all_start_methods():
+        for plot in todo:
+            cached_plot(**plot)
+    else:
+        _PLOTS[:] = todo
+        try:
+            context = multiprocessing.get_context("fork")
+            with ProcessPoolExecutor(num_workers, mp_context=context) as pool:
+                list(pool.map(_draw_plot, range(len(todo))))
+        finally:
+            _PLOTS.clear()
+    return [plot["fname"] for plot in plots]
+
@@ -0,0 +1,229 @@
+"""Module with a content-addressed cache of the website's plots
+
+A plot is keyed by a hash of the content of its input (posterior) files, its
+parameters/kwargs, the versions of the plotting libraries and of the webbuilder,
+and the source of the webbuilder's own plotting modules (PLOTTING_MODULES), so it is only
+drawn once across outdirs, site variants and `--clean` builds. A cache hit
+hard-links (or copies) the stored png to the requested filename. The cache
+lives in a shared directory (NRSUR_PLOT_CACHE, or `--plot-cache-dir`), and the
+least recently used plots are evicted once it grows past its size limit
+(NRSUR_PLOT_CACHE_SIZE_GB). The hashes of the input files are kept next to the
+plots (keyed by the files' stat), so the build's workers and later builds don't
+re-hash the (multi-GB) posteriors.
+
+The page templates use `cached_plot`, eg:
+
+    cached_plot(
+        "GW150914_mass_corner.png",
+        lambda: nrsur_result.plot_corner(params),
+        files=[posterior_fn],
+        kind="corner",
+        params=params,
+    )
+"""
+
+import json
+import os
+import shutil
+from typing import Callable, Dict, List, Optional
+
+from nrsur_catalog.logger import logger
+
+from .manifest import LIBRARIES, _hash_file, get_library_versions, hash_text
+
+PLOT_CACHE_ENV_VAR = "NRSUR_PLOT_CACHE"
+PLOT_CACHE_SIZE_ENV_VAR = "NRSUR_PLOT_CACHE_SIZE_GB"
+DEFAULT_PLOT_CACHE_DIR = os.path.join(
+    os.path.expanduser("~"), ".cache", "nrsur_catalog_plots"
+)
+DEFAULT_PLOT_CACHE_SIZE_GB = 5.0
+WEBBUILDER = "nrsur_catalog_webbuilder"
+# the webbuilder's modules that draw (or shape) the plots
+PLOTTING_MODULES = [
+    "binned_kde",
+    "catalog_figures",
+    "corner_densities",
+    "density_raster",
+    "plot_cache",
+    "waveform_store",
+]
+HERE = os.path.dirname(os.path.abspath(__file__))
+FILE_HASHES_DIR = "file_hashes"
+
+# {realpath: [size, mtime_ns, inode, sha]} of the input files seen by this process
+_FILE_HASHES: Dict[str, list] = {}
+
+
+def get_plot_cache_dir() -> str:
+    """The shared dir of the plot cache (default: $NRSUR_PLOT_CACHE)"""
+    return os.environ.get(PLOT_CACHE_ENV_VAR) or DEFAULT_PLOT_CACHE_DIR
+
+
+def get_plotting_code_hash(cache_dir: Optional[str] = None) -> str:
+    """Hash of the source of the webbuilder's plotting modules"""
+    return hash_text(
+        "".join(
+            _file_hash(os.path.join(HERE, f"{module}.py"), cache_dir)
+            for module in PLOTTING_MODULES
+        )
+    )
+
+
+def _file_hash(path: str, cache_dir: Optional[str] = None) -> str:
+    """Content hash of the file (reusing its hash stored in the plot cache dir if
+    its stat is unchanged)"""
+    path = os.path.realpath(path)
+    st = os.stat(path)
+    stat = [st.st_size, st.st_mtime_ns, st.st_ino]
+    cached = _FILE_HASHES.get(path)
+    if cached is None or cached[:3] != stat:
+        cached = _read_file_hash(path, cache_dir)
+    if cached is None or cached[:3] != stat:
+        logger.debug(f"Hashing {path}")
+        cached = stat + [_hash_file(path)]
+        _write_file_hash(path, cached, cache_dir)
+    _FILE_HASHES[path] = cached
+    return cached[3]
+
+
+def _file_hash_fn(path: str, cache_dir: Optional[str] = None) -> str:
+    cache_dir = get_plot_cache_dir() if cache_dir is None else cache_dir
+    return os.path.join(cache_dir, FILE_HASHES_DIR, f"{hash_text(path)}.json")
+
+
+def _read_file_hash(path: str, cache_dir: Optional[str] = None) -> Optional[list]:
+    try:
+        with open(_file_hash_fn(path, cache_dir), "r") as f:
+            return json.load(f)
+    except (json.JSONDecodeError, OSError):
+        return None
+
+
+def _write_file_hash(path: str, entry: list, cache_dir: Optional[str] = None) -> None:
+    fn = _file_hash_fn(path, cache_dir)
+    tmp = f"{fn}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(fn), exist_ok=True)
+        with open(tmp, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmp, fn)
+    except OSError as e:  # (then only kept in memory)
+        logger.debug(f"Could not store the hash of {path}: {e}")
+
+
+class PlotCache:
+    """A size-bounded (LRU) directory of plots, named by the hash of their inputs"""
+
+    def __init__(self, cache_dir: Optional[str] = None, max_size: Optional[float] = None):
+        """cache_dir: where the plots are stored (default: $NRSUR_PLOT_CACHE)
+        max_size: in GB (default: $NRSUR_PLOT_CACHE_SIZE_GB)"""
+        if cache_dir is None:
+            cache_dir = get_plot_cache_dir()
+        if max_size is None:
+            max_size = float(
+                os.environ.get(PLOT_CACHE_SIZE_ENV_VAR, DEFAULT_PLOT_CACHE_SIZE_GB)
+            )
+        self.dir = cache_dir
+        self.max_size = max_size * 1e9
+        os.makedirs(self.dir, exist_ok=True)
+
+    def key(self, files: List[str] = [], **params) -> str:
+        """Hash of the plot's input files, parameters, plotting library versions and
+        plotting code"""
+        data = dict(
+            files=sorted(_file_hash(f, self.dir) for f in files if f),
+            params=params,
+            libraries=get_library_versions(LIBRARIES + [WEBBUILDER]),
+            plotting_code=get_plotting_code_hash(self.dir),
+        )
+        return hash_text(json.dumps(data, sort_keys=True, default=str))
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.dir, f"{key}.png")
+
+    def get(self, key: str, fname: str) -> bool:
+        """Links (or copies) the cached plot to fname, returns False on a cache miss"""
+        cached = self.path(key)
+        if not os.path.isfile(cached):
+            return False
+        os.utime(cached)  # mark as recently used
+        _remove(fname)
+        try:
+            os.link(cached, fname)
+        except OSError:  # eg the cache is on another filesystem
+            shutil.copyfile(cached, fname)
+        return True
+
+    def put(self, key: str, fname: str) -> None:
+        """Stores a copy of the plot (the cache never shares an inode with a new plot)"""
+        tmp = f"{self.path(key)}.{os.getpid()}.tmp"
+        shutil.copyfile(fname, tmp)
+        os.replace(tmp, self.path(key))
+        self.evict()
+
+    def evict(self) -> None:
+        """Removes the least recently used plots until the cache fits in max_size"""
+        evict_lru(self.dir, self.max_size, suffix=".png")
+
+
+def evict_lru(cache_dir: str, max_size: float, suffix: str) -> None:
+    """Removes the least recently used (by mtime) `*{suffix}` files in cache_dir
+    until they fit in max_size (bytes)"""
+    entries = []
+    for entry in os.scandir(cache_dir):
+        if entry.name.endswith(suffix):
+            st = entry.stat()
+            entries.append((st.st_mtime, st.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_size:
+            break
+        logger.debug(f"Evicting {path} from {cache_dir}")
+        _remove(path)
+        total -= size
+
+
+def _remove(fname: str) -> None:
+    if os.path.lexists(fname):
+        os.remove(fname)
+
+
+def _plot_key(cache: PlotCache, fname: str, files: List[str], params: dict) -> str:
+    return cache.key(files, fname=os.path.basename(fname), **params)
+
+
+def from_plot_cache(
+    fname: str, files: List[str] = [], cache: Optional[PlotCache] = None, **params
+) -> bool:
+    """Writes the plot to fname if it is in the cache (returns False otherwise)"""
+    cache = PlotCache() if cache is None else cache
+    if cache.get(_plot_key(cache, fname, files, params), fname):
+        logger.debug(f"Plot cache hit for {fname}")
+        return True
+    return False
+
+
+def cached_plot(
+    fname: str,
+    make_plot: Callable,
+    files: List[str] = [],
+    cache: Optional[PlotCache] = None,
+    **params,
+) -> str:
+    """Writes the plot to fname from the cache, or by calling make_plot
+
+    make_plot: draws the plot, either writing fname itself (eg `Catalog.violin_plot`)
+        or returning a figure (then saved to fname)
+    files: the plot's input files, params: anything else the plot depends on
+    """
+    cache = PlotCache() if cache is None else cache
+    if from_plot_cache(fname, files, cache, **params):
+        return fname
+    key = _plot_key(cache, fname, files, params)
+    _remove(fname)  # never draw into a file linked to the cache
+    fig = make_plot()
+    if not os.path.isfile(fname) and hasattr(fig, "savefig"):
+        fig.savefig(fname)
+    if os.path.isfile(fname):
+        cache.put(key, fname)
+    return fname
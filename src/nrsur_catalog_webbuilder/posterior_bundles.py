@@ -0,0 +1,173 @@
+"""Module with slim web bundles of the posteriors (for the notebooks' readers)
+
+A reader running an event notebook (eg "Open in Colab") waits minutes for
+`NRsurResult.load` (and `Catalog.load`) to download the full NR and LVK release
+files. The builder writes compact bundles, published with the html (in
+`bundles/`, via the book's `html_extra_path`):
+- `{event}.npz`: the columns of the parameters the page uses (the
+  summary's and the plots') of the NR and LVK posteriors, the NR priors and
+  metadata (the analysis configs, and the likelihood's waveform settings),
+- `catalog.npz`: the catalog page's downsampled posteriors.
+The columns are stored as float32 residuals about each column's median (so eg
+the GPS time keeps its precision) and zip-compressed; the priors and metadata are
+stored with bilby's json encoding.
+
+`load_result` / `load_catalog` (of bundle_reader.py, inlined into the notebooks
+for readers without the webbuilder) prefer the full posteriors if they are in the
+cache (as in the build), then the bundle (local, or downloaded from the site),
+then the full download.
+"""
+
+import json
+import os
+from typing import Dict, List, Optional
+
+import h5py
+import numpy as np
+import pandas as pd
+from bilby.core.utils import BilbyJsonEncoder
+
+from nrsur_catalog.cache import LVK_LABEL, CatalogCache
+from nrsur_catalog.catalog import CATALOG_FN, POSTERIORS_TO_KEEP, Catalog
+from nrsur_catalog.logger import logger
+from nrsur_catalog.utils.pesummary_result_to_bilby_result import (
+    pesummary_to_bilby_result,
+)
+
+from .bundle_reader import (
+    BUNDLE_DIR,
+    BUNDLE_FORMAT,
+    BUNDLE_URL,
+    CATALOG_BUNDLE_FN,
+    event_bundle_fn,
+    fetch_bundle,
+    load_catalog,
+    load_result,
+    read_bundle,
+    result_from_bundle,
+)
+from .posterior_columns import load_columns
+
+# the book's `html_extra_path`: its contents are copied to the html's root
+EXTRA_DIR = "_extra"
+# the parameters of the pages (besides the NR priors' keys, in the summary table)
+BUNDLE_PARAMETERS = POSTERIORS_TO_KEEP + ["log_likelihood"]
+
+
+def bundle_dir(outdir: str) -> str:
+    return os.path.join(outdir, EXTRA_DIR, BUNDLE_DIR)
+
+
+def _stat(path: Optional[str]) -> Optional[list]:
+    if not path:
+        return None
+    st = os.stat(os.path.realpath(path))
+    return [st.st_size, st.st_mtime_ns]
+
+
+def read_bundle_meta(fn: str) -> Optional[dict]:
+    """The bundle's (still bilby-json encoded) metadata, None if it is missing or
+    unreadable"""
+    if not os.path.isfile(fn):
+        return None
+    try:
+        with np.load(fn) as bundle:
+            return json.loads(str(bundle["meta"]))
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def write_bundle(fn: str, posteriors: Dict[str, pd.DataFrame], meta: dict) -> None:
+    """Writes the {name: posterior} columns (float32 residuals) and the metadata"""
+    arrays = {}
+    meta = dict(meta, format=BUNDLE_FORMAT, columns={}, offsets={})
+    for name, posterior in posteriors.items():
+        meta["columns"][name] = list(posterior.columns)
+        meta["offsets"][name] = {}
+        for column in posterior.columns:
+            x = np.asarray(posterior[column], dtype=np.float64)
+            offset = float(np.nanmedian(x)) if np.isfinite(x).any() else 0.0
+            arrays[f"{name}/{column}"] = (x - offset).astype(np.float32)
+            meta["offsets"][name][column] = offset
+    os.makedirs(os.path.dirname(fn), exist_ok=True)
+    tmp = f"{fn}.{os.getpid()}.tmp.npz"
+    np.savez_compressed(tmp, meta=json.dumps(meta, cls=BilbyJsonEncoder), **arrays)
+    os.replace(tmp, fn)
+
+
+def _is_current(meta: Optional[dict], source) -> bool:
+    return (
+        meta is not None
+        and meta.get("format") == BUNDLE_FORMAT
+        and meta["source"] == source
+    )
+
+
+def _read_columns(path: str, label: str, columns: List[str]) -> pd.DataFrame:
+    with h5py.File(path, "r") as f:
+        names = f[label]["posterior_samples"].dtype.names
+    return load_columns(path, [c for c in columns if c in names], label)
+
+
+def _event_source(cache: CatalogCache, event_name: str) -> dict:
+    path = cache.find(event_name, hard_fail=True)
+    return dict(nr=_stat(path), lvk=_stat(cache.find(event_name, lvk_posteriors=True)))
+
+
+def event_bundle_is_stale(event_name: str, cache_dir: str, outdir: str) -> bool:
+    """If the event's posterior files changed since its bundle was written"""
+    fn = os.path.join(bundle_dir(outdir), event_bundle_fn(event_name))
+    source = _event_source(CatalogCache(cache_dir), event_name)
+    return not _is_current(read_bundle_meta(fn), source)
+
+
+def write_event_bundle(event_name: str, cache_dir: str, outdir: str) -> str:
+    """Writes the event's bundle (if its posterior files changed), returns its path"""
+    fn = os.path.join(bundle_dir(outdir), event_bundle_fn(event_name))
+    if not event_bundle_is_stale(event_name, cache_dir, outdir):
+        return fn
+    cache = CatalogCache(cache_dir)
+    path = cache.find(event_name, hard_fail=True)
+    lvk_path = cache.find(event_name, lvk_posteriors=True)
+    source = _event_source(cache, event_name)
+
+    logger.debug(f"Writing the web bundle of {event_name}")
+    result = pesummary_to_bilby_result(path)
+    priors = dict(result.priors)
+    nr_columns = [p for p in priors if "calibration" not in p]
+    nr_columns += [p for p in BUNDLE_PARAMETERS if p not in nr_columns]
+    nr_columns = [p for p in nr_columns if p in result.posterior.columns]
+    posteriors = dict(nr=result.posterior[nr_columns])
+    if lvk_path:
+        posteriors["lvk"] = _read_columns(lvk_path, LVK_LABEL, POSTERIORS_TO_KEEP)
+    meta_data = {
+        k: v for k, v in result.meta_data.items() if k in ["config_file", "likelihood"]
+    }
+    write_bundle(
+        fn,
+        posteriors,
+        dict(event=event_name, source=source, priors=priors, meta_data=meta_data),
+    )
+    return fn
+
+
+def write_catalog_bundle(cache_dir: str, outdir: str) -> Optional[str]:
+    """Writes the bundle of the (catalog page's) downsampled catalog posteriors
+    (if it changed), returns its path"""
+    catalog_fn = os.path.join(cache_dir, CATALOG_FN)
+    if not os.path.isfile(catalog_fn):
+        logger.warning(f"No downsampled catalog {catalog_fn} to bundle")
+        return None
+    fn = os.path.join(bundle_dir(outdir), CATALOG_BUNDLE_FN)
+    source = _stat(catalog_fn)
+    if _is_current(read_bundle_meta(fn), source):
+        return fn
+
+    posteriors = Catalog.from_hdf5(catalog_fn)
+    events = posteriors.pop("event").to_numpy()
+    event_names, event_index = np.unique(events, return_inverse=True)
+    posteriors["event_index"] = event_index
+    write_bundle(
+        fn, dict(catalog=posteriors), dict(source=source, events=list(event_names))
+    )
+    return fn
@@ -0,0 +1,57 @@
+"""Module reading only the requested columns of the cached posteriors
+
+An event's `posterior_samples` is an hdf5 compound (record) dataset: `load_columns`
+only reads the requested fields of it (eg the few columns of the web bundles),
+rather than the ~100 columns of the whole records.
+"""
+
+import os
+import shutil
+from typing import List, Optional
+
+import h5py
+import pandas as pd
+
+from nrsur_catalog.cache import NR_LABEL
+from nrsur_catalog.logger import logger
+
+# where earlier builds wrote their (unused) columnar sidecars of the posteriors
+COLUMNS_DIR_ENV_VAR = "NRSUR_COLUMNS_DIR"
+DEFAULT_COLUMNS_DIR = os.path.join(
+    os.path.expanduser("~"), ".cache", "nrsur_catalog_columns"
+)
+SIDECAR_DIR = ".columns"
+
+
+def load_columns(
+    path: str, columns: Optional[List[str]] = None, label: str = NR_LABEL
+) -> pd.DataFrame:
+    """The requested posterior columns (all if None) of the cache file"""
+    with h5py.File(path, "r") as f:
+        dset = f[label]["posterior_samples"]
+        names = dset.dtype.names
+        columns = list(names) if columns is None else columns
+        missing = [c for c in columns if c not in names]
+        if missing:
+            raise KeyError(f"{path} has no posterior columns {missing}")
+        data = {c: dset.fields(c)[()] for c in columns}
+    return pd.DataFrame(data, columns=columns)
+
+
+def posterior_length(path: str, label: str = NR_LABEL) -> int:
+    """Number of posterior samples (from the hdf5 metadata)"""
+    with h5py.File(path, "r") as f:
+        return len(f[label]["posterior_samples"])
+
+
+def remove_sidecars(cache_dir: str):
+    """Evicts the columnar sidecars of earlier builds (in $NRSUR_COLUMNS_DIR, and
+    the hidden `.columns/` dir of the event dir): no page reads them"""
+    dirs = [
+        os.environ.get(COLUMNS_DIR_ENV_VAR) or DEFAULT_COLUMNS_DIR,
+        os.path.join(cache_dir, SIDECAR_DIR),
+    ]
+    for d in dirs:
+        if os.path.isdir(d):
+            logger.info(f"Removing the columnar sidecars in {d}")
+            shutil.rmtree(d, ignore_errors=True)
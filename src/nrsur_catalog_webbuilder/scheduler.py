@@ -0,0 +1,324 @@
+"""Module to run the website build as a graph of tasks with explicit dependencies
+
+Instead of running the build in strict phases (all event notebooks, then the
+menu page, then the catalog page), each unit of work is a task that only waits
+for the tasks it depends on. The scheduler keeps every worker slot busy with
+whichever tasks are ready, so eg the catalog plots run next to the event
+notebooks, and an event's menu thumbnail starts as soon as its page is built.
+Of the ready tasks, the ones expected to take the longest are started first,
+and (given a memory budget) new tasks are only admitted while their expected
+peak memory fits in what is left of the budget.
+
+Each task gets a wall-clock timeout and a bounded number of retries, and its
+state is written to the build journal (so an interrupted build can be resumed).
+The tasks depending on a failed task are skipped (and so are their dependents).
+"""
+
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+from tqdm.auto import tqdm
+
+from nrsur_catalog.cache import CatalogCache
+from nrsur_catalog.logger import logger
+
+from .build_trace import add_spans
+from .executor import (
+    TaskResult,
+    _run_task,
+    get_worker_pool,
+    kill_worker_pool,
+    log_task_result,
+)
+from .journal import DONE, FAILED, PENDING, RUNNING, SKIPPED, BuildJournal
+
+# how often (s) the scheduler checks for tasks stuck past their timeout
+POLL_INTERVAL = 5.0
+# extra time (s) a task gets to honour its timeout before its worker is killed
+HARD_KILL_GRACE = 60.0
+
+
+@dataclass
+class Task:
+    """A unit of build work.
+
+    deps: names of the tasks that must succeed before this one starts (deps that
+        are not part of the graph, eg an up-to-date page, are ignored); the task is
+        skipped if any of them failed
+    after: names of the tasks that must finish before this one starts, which
+        only order the tasks -- the task still runs if they failed
+    on_done: callback (run in the main process) with the task's TaskResult
+    cost: expected duration (seconds), the most costly ready tasks are started first
+    memory: expected peak memory (MB), used for admission against the memory budget
+    timeout: wall-clock limit (s) of the task (default: the graph's timeout)
+    """
+
+    name: str
+    func: Callable
+    args: tuple = ()
+    kwargs: dict = field(default_factory=dict)
+    deps: List[str] = field(default_factory=list)
+    after: List[str] = field(default_factory=list)
+    on_done: Optional[Callable[[TaskResult], None]] = None
+    cost: float = 0.0
+    memory: float = 0.0
+    timeout: Optional[float] = None
+
+
+class TaskGraph:
+    """A set of build tasks and their dependencies"""
+
+    def __init__(self):
+        self.tasks: Dict[str, Task] = {}
+
+    def add(
+        self,
+        name: str,
+        func: Callable,
+        *args,
+        deps: List[str] = [],
+        after: List[str] = [],
+        on_done: Optional[Callable[[TaskResult], None]] = None,
+        cost: float = 0.0,
+        memory: float = 0.0,
+        timeout: Optional[float] = None,
+        **kwargs,
+    ) -> Task:
+        if name in self.tasks:
+            raise ValueError(f"Task {name} already in the graph")
+        self.tasks[name] = Task(
+            name=name,
+            func=func,
+            args=args,
+            kwargs=kwargs,
+            deps=list(deps),
+            after=list(after),
+            on_done=on_done,
+            cost=cost,
+            memory=memory,
+            timeout=timeout,
+        )
+        return self.tasks[name]
+
+    def __len__(self):
+        return len(self.tasks)
+
+    def __contains__(self, name: str):
+        return name in self.tasks
+
+    def _deps(self, task: Task) -> List[str]:
+        return [d for d in task.deps + task.after if d in self.tasks]
+
+    def _check_acyclic(self) -> None:
+        visited, in_path = set(), set()
+
+        def visit(name):
+            if name in in_path:
+                raise ValueError(f"Cyclic dependency involving task {name}")
+            if name in visited:
+                return
+            in_path.add(name)
+            for dep in self._deps(self.tasks[name]):
+                visit(dep)
+            in_path.remove(name)
+            visited.add(name)
+
+        for name in self.tasks:
+            visit(name)
+
+    def run(
+        self,
+        num_workers: int = 1,
+        desc: str = "Building website",
+        on_done: Optional[Callable[[TaskResult], None]] = None,
+        memory_budget: Optional[float] = None,
+        journal: Optional[BuildJournal] = None,
+        timeout: Optional[float] = None,
+        retries: int = 0,
+    ) -> Dict[str, TaskResult]:
+        """Runs all the tasks (as soon as their deps are done) on a warm worker pool
+
+        on_done: callback (run in the main process) with each task's TaskResult
+        memory_budget: max total expected memory (MB) of the tasks running at once
+            (a task is always admitted when nothing else is running)
+        journal: records the state of each task, tasks already done in it are not re-run
+        timeout: wall-clock limit (s) of each task
+        retries: number of times a failed (or timed out) task is retried
+        """
+        self._check_acyclic()
+        results: Dict[str, TaskResult] = {}
+        pending: Dict[str, Task] = {}
+        for name, task in self.tasks.items():
+            if journal is not None and journal.state(name) == DONE:
+                logger.debug(f"Skipping {name} (done in the journal)")
+                results[name] = TaskResult(name, True, 0.0)
+            else:
+                pending[name] = task
+        if journal is not None:
+            journal.mark_pending(list(pending))
+        if len(pending) == 0:
+            return results
+
+        failures: Dict[str, int] = {}
+        in_flight = {}
+        t_start = {}
+        pool = get_worker_pool(num_workers)
+
+        def _timeout(task: Task) -> Optional[float]:
+            return task.timeout if task.timeout is not None else timeout
+
+        def _finish(task: Task, result: TaskResult, count_failure: bool = True):
+            if not result.success:
+                failures[task.name] = failures.get(task.name, 0) + int(count_failure)
+                if failures[task.name] <= retries:
+                    logger.warning(
+                        f"Retrying {task.name} ({failures[task.name]}/{retries})"
+                    )
+                    pending[task.name] = task
+                    if journal is not None:
+                        journal.set_state(task.name, PENDING, result.error)
+                    return
+            _record(task, result, DONE if result.success else FAILED)
+
+        def _record(task: Task, result: TaskResult, state: str):
+            log_task_result(result)
+            add_spans(result.spans)
+            results[task.name] = result
+            if journal is not None:
+                journal.set_state(task.name, state, result.error)
+            for callback in [task.on_done, on_done]:
+                if callback is not None:
+                    callback(result)
+            bar.update()
+
+        try:
+            with tqdm(total=len(pending), desc=desc) as bar:
+                while pending or in_flight:
+                    # (skipping a task can skip its own dependents in turn)
+                    skipped = True
+                    while skipped:
+                        skipped = False
+                        for task in list(pending.values()):
+                            failed_deps = [
+                                d
+                                for d in task.deps
+                                if d in results and not results[d].success
+                            ]
+                            if failed_deps:
+                                pending.pop(task.name)
+                                result = TaskResult(
+                                    task.name,
+                                    False,
+                                    0.0,
+                                    f"Skipped: its deps {failed_deps} failed",
+                                    skipped=True,
+                                )
+                                _record(task, result, SKIPPED)
+                                skipped = True
+                    ready = [
+                        t
+                        for t in pending.values()
+                        if all(d in results for d in self._deps(t))
+                    ]
+                    ready = sorted(ready, key=lambda t: t.cost, reverse=True)
+                    for task in ready:
+                        if len(in_flight) >= num_workers:
+                            break
+                        memory_in_use = sum(t.memory for t in in_flight.values())
+                        if (
+                            memory_budget is not None
+                            and len(in_flight) > 0
+                            and memory_in_use + task.memory > memory_budget
+                        ):
+                            continue
+                        logger.debug(f"Starting {task.name}")
+                        future = pool.submit(
+                            _run_task,
+                            task.name,
+                            task.func,
+                            task.args,
+                            task.kwargs,
+                            _timeout(task),
+                        )
+                        in_flight[future] = task
+                        t_start[task.name] = time.time()
+                        pending.pop(task.name)
+                        if journal is not None:
+                            journal.set_state(task.name, RUNNING)
+
+                    finished, _ = wait(
+                        in_flight, timeout=POLL_INTERVAL, return_when=FIRST_COMPLETED
+                    )
+                    pool_broken = False
+                    for future in finished:
+                        task = in_flight.pop(future)
+                        try:
+                            result = future.result()
+                        except Exception as e:
+                            # the worker itself died (eg segfault/OOM-kill)
+                            pool_broken |= isinstance(e, BrokenProcessPool)
+                            duration = time.time() - t_start[task.name]
+                            result = TaskResult(
+                                task.name, False, duration, traceback.format_exc()
+                            )
+                        _finish(task, result)
+
+                    # tasks stuck (eg in C code) long past their timeout: kill the pool
+                    now = time.time()
+                    hung = [
+                        t
+                        for t in in_flight.values()
+                        if _timeout(t) is not None
+                        and now - t_start[t.name] > _timeout(t) + HARD_KILL_GRACE
+                    ]
+                    if hung:
+                        hung = [t.name for t in hung]
+                        logger.error(f"Killing the workers of hung tasks {hung}")
+                        kill_worker_pool(pool)
+                        for task in list(in_flight.values()):
+                            result = TaskResult(
+                                task.name,
+                                False,
+                                now - t_start[task.name],
+                                f"Killed: {task.name} exceeded its timeout"
+                                if task.name in hung
+                                else "Killed alongside a hung task",
+                            )
+                            _finish(task, result, count_failure=task.name in hung)
+                        in_flight.clear()
+                        pool_broken = True
+
+                    if pool_broken:
+                        pool.shutdown(wait=False, cancel_futures=True)
+                        for future, task in list(in_flight.items()):
+                            # the remaining tasks of the broken pool are re-queued
+                            in_flight.pop(future)
+                            pending[task.name] = task
+                        pool = get_worker_pool(num_workers)
+        except BaseException:
+            # eg KeyboardInterrupt: the journal keeps the state for `--resume`
+            kill_worker_pool(pool)
+            raise
+        pool.shutdown(wait=True)
+        return results
+
+
+def build_gw_pages(
+    event_names: List[str], outdir: str, cache_dir: str, num_workers: int = 1
+) -> Dict[str, TaskResult]:
+    """Builds the GW event pages with a warm worker pool, returns {event: TaskResult}"""
+    from .make_pages import make_gw_page
+
+    cache = CatalogCache(cache_dir)
+    graph = TaskGraph()
+    for name in event_names:
+        graph.add(name, make_gw_page, name, outdir, cache=cache)
+    results = graph.run(num_workers=num_workers, desc="Executing GW notebooks")
+    failed = [name for name, r in results.items() if not r.success]
+    if failed:
+        logger.warning(f"{len(failed)}/{len(results)} GW pages failed: {failed}")
+    return results
@@ -0,0 +1,70 @@
+"""Module to split the website build across machines (shards) and merge the results
+
+Each shard executes the GW notebooks (and plots) of a deterministic subset of the
+events into its own directory. The merge step copies the shards' event pages
+into the website's outdir (with their manifest entries, so they are not rebuilt)
+and the menu page, catalog page and html are then built once. Eg on one box:
+
+    for i in 0 1 2; do
+        build_nrsur_website --event-dir cache --shard $i/3 --outdir shards/$i &
+    done; wait
+    build_nrsur_website --event-dir cache --merge shards/* --outdir website
+"""
+
+import os
+from typing import List, Tuple
+
+from nrsur_catalog.logger import logger
+
+from .history import BuildHistory
+from .manifest import BuildManifest
+from .utils import copy_if_changed
+
+
+def parse_shard(shard: str) -> Tuple[int, int]:
+    """Parses 'i/N' into (i, N), with shards numbered 0..N-1"""
+    try:
+        index, num_shards = [int(x) for x in shard.split("/")]
+    except ValueError:
+        raise ValueError(f"Shard '{shard}' should be of the form i/N (eg 0/4)")
+    if num_shards < 1 or not 0 <= index < num_shards:
+        raise ValueError(f"Shard '{shard}' should have 0 <= i < N")
+    return index, num_shards
+
+
+def get_shard_events(event_names: List[str], shard: str) -> List[str]:
+    """The events built by the shard (the same on every machine)"""
+    index, num_shards = parse_shard(shard)
+    return sorted(event_names)[index::num_shards]
+
+
+def merge_shards(shard_dirs: List[str], outdir: str) -> None:
+    """Copies the event pages built by the shards (and their manifest/history) to outdir"""
+    events_dir = os.path.join(outdir, "events")
+    os.makedirs(events_dir, exist_ok=True)
+    manifest = BuildManifest(outdir)
+    history = BuildHistory(outdir)
+    for shard_dir in shard_dirs:
+        shard_events_dir = os.path.join(shard_dir, "events")
+        if not os.path.isdir(shard_events_dir):
+            logger.warning(f"Shard {shard_dir} has no events dir, skipping")
+            continue
+        shard_manifest = BuildManifest(shard_dir)
+        pages = [p for p in shard_manifest.pages if p.startswith("events/")]
+        logger.info(f"Merging {len(pages)} event pages from {shard_dir}")
+        for fname in sorted(os.listdir(shard_events_dir)):
+            src = os.path.join(shard_events_dir, fname)
+            # skip the hidden partial notebooks and the symlinked cache
+            if fname.startswith(".") or not os.path.isfile(src):
+                continue
+            copy_if_changed(src, os.path.join(events_dir, fname))
+        for page in pages:
+            manifest.record(page, shard_manifest.get(page))
+        manifest.stat_cache.update(shard_manifest.stat_cache)
+
+        shard_history = BuildHistory(shard_dir)
+        history.durations.update(shard_history.durations)
+        history.sizes.update(shard_history.sizes)
+        history.peak_memory.update(shard_history.peak_memory)
+    manifest.save()
+    history.save()
@@ -0,0 +1,164 @@
+"""Module with an on-disk store of the events' posterior summary statistics
+
+The event page's summary table (`NRsurResult.summary`), the same table shown by
+the event notebook and the menu page's table (`Catalog.get_latex_summary`) each
+loaded the posteriors and computed their quantiles. Here the summary of an
+event is computed once, from one load of its posterior, and stored in a summary
+dir of its own (NRSUR_SUMMARY_STORE, not the user's event dir). A stored summary is keyed by the
+fingerprint (content hash) of the event's posterior file and the library
+versions, so only the events whose data changed are recomputed. The file's
+stat is stored with its hash, so an unchanged file is not re-hashed.
+
+Each summary has, for every posterior parameter, the QUANTILES below, its
+median, 68% and 90% credible intervals and its LaTeX string (median with the
+68% CI, as `format_qts_to_latex`), plus the event's summary table.
+"""
+
+import json
+import os
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from nrsur_catalog.cache import CatalogCache
+from nrsur_catalog.logger import logger
+from nrsur_catalog.nrsur_result import NRsurResult
+from nrsur_catalog.utils import format_qts_to_latex
+
+from .manifest import _hash_file, get_library_versions, hash_text
+
+SUMMARY_STORE_ENV_VAR = "NRSUR_SUMMARY_STORE"
+DEFAULT_SUMMARY_STORE_DIR = os.path.join(
+    os.path.expanduser("~"), ".cache", "nrsur_catalog_summaries"
+)
+SUMMARY_LIBRARIES = ["nrsur_catalog", "bilby", "numpy", "pandas"]
+QUANTILES = [0.05, 0.16, 0.5, 0.84, 0.95]
+
+
+def get_summary_store_dir() -> str:
+    """Where the summaries are stored (default: $NRSUR_SUMMARY_STORE)"""
+    return os.environ.get(SUMMARY_STORE_ENV_VAR) or DEFAULT_SUMMARY_STORE_DIR
+
+
+def _summary_fn(path: str) -> str:
+    path = os.path.realpath(path)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(get_summary_store_dir(), f"{stem}_{hash_text(path)[:16]}.json")
+
+
+def _stat(path: str) -> list:
+    st = os.stat(os.path.realpath(path))
+    return [st.st_size, st.st_mtime_ns, st.st_ino]
+
+
+def _read(fn: str) -> Optional[dict]:
+    if not os.path.isfile(fn):
+        return None
+    try:
+        with open(fn, "r") as f:
+            return json.load(f)
+    except (json.JSONDecodeError, OSError):
+        return None
+
+
+def _write(fn: str, summary: dict) -> None:
+    try:
+        os.makedirs(os.path.dirname(fn), exist_ok=True)
+        tmp = f"{fn}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(summary, f, indent=1)
+        os.replace(tmp, fn)
+    except OSError as e:
+        logger.warning(f"Could not store the summary {fn}: {e}")
+
+
+def compute_summary(result) -> dict:
+    """The summary statistics of the result's posterior (and its summary table)"""
+    stats = {}
+    for param in result.posterior.columns:
+        x = np.asarray(result.posterior[param])
+        if x.dtype.kind not in "biuf":
+            continue
+        q05, q16, q50, q84, q95 = np.quantile(x, QUANTILES)
+        stats[param] = dict(
+            quantiles=[q05, q16, q50, q84, q95],
+            median=q50,
+            ci_68=[q16, q84],
+            ci_90=[q05, q95],
+            latex=format_qts_to_latex(q16, q50, q84),
+        )
+    table = result.summary()
+    return dict(
+        parameters=stats,
+        table=dict(
+            index=list(table.index),
+            columns=list(table.columns),
+            data=table.values.tolist(),
+        ),
+    )
+
+
+def get_event_summary(event_name: str, cache_dir: str, result=None) -> dict:
+    """The event's stored summary (computed, from result if given, if not stored
+    or if its posterior file changed)"""
+    path = CatalogCache(cache_dir).find(event_name, hard_fail=True)
+    fn = _summary_fn(path)
+    stored = _read(fn)
+    libraries = get_library_versions(SUMMARY_LIBRARIES)
+
+    stat = _stat(path)
+    if stored is not None and stored["stat"] == stat:
+        fingerprint = stored["fingerprint"]
+    else:
+        fingerprint = hash_text(
+            json.dumps(dict(file=_hash_file(os.path.realpath(path)), quantiles=QUANTILES))
+        )
+    if (
+        stored is not None
+        and stored["fingerprint"] == fingerprint
+        and stored["libraries"] == libraries
+    ):
+        if stored["stat"] != stat:  # eg the file was touched (or re-downloaded)
+            stored["stat"] = stat
+            _write(fn, stored)
+        return stored
+
+    logger.debug(f"Computing the summary of {event_name}")
+    if result is None:
+        result = NRsurResult.load(event_name, cache_dir=cache_dir)
+    summary = compute_summary(result)
+    summary.update(
+        event=event_name, fingerprint=fingerprint, stat=stat, libraries=libraries
+    )
+    _write(fn, summary)
+    return summary
+
+
+def summary_table(event_name: str, cache_dir: str, result=None) -> pd.DataFrame:
+    """The event's summary table (as `NRsurResult.summary()`), from the store"""
+    table = get_event_summary(event_name, cache_dir, result)["table"]
+    df = pd.DataFrame(table["data"], index=table["index"], columns=table["columns"])
+    df.index.name = "Parameter"
+    return df
+
+
+def summary_markdown(event_name: str, cache_dir: str) -> str:
+    """The event's summary table (as `NRsurResult.summary(markdown=True)`), from the store"""
+    md_txt = summary_table(event_name, cache_dir).to_markdown()
+    md_txt = "\n".join([f"# {line}" for line in md_txt.splitlines()])
+    return "\n" + md_txt
+
+
+def get_latex_summary(
+    event_names: List[str], cache_dir: str, columns: List[str]
+) -> pd.DataFrame:
+    """{event: {param: LaTeX}} of the events (as `Catalog.get_latex_summary`), from the store"""
+    missing = format_qts_to_latex(np.nan, np.nan, np.nan)
+    latex: Dict[str, Dict[str, str]] = {}
+    for event in event_names:
+        stats = get_event_summary(event, cache_dir)["parameters"]
+        latex[event] = {p: stats[p]["latex"] if p in stats else missing for p in columns}
+    latex_summary = pd.DataFrame(latex, index=columns).T
+    latex_summary.index.name = "event"
+    return latex_summary
@@ -0,0 +1,123 @@
+"""Module to make the thumbnails of the event plots (shown in the events menu)
+
+A thumbnail is made with Pillow's reduced-resolution path (`Image.thumbnail`
+with a `reducing_gap`: the image is first shrunk by an integer factor with a
+cheap box reduction, then resampled) and saved once. The hash of its source
+plot is stored in the thumbnail's PNG metadata, so a thumbnail is only remade
+if its plot's content changed (eg not when a stale page re-links the same plot
+from the plot cache). The thumbnails of many events are made on a pool of
+forked worker processes.
+
+Besides the menu's waveform thumbnail (`{event}_thumbnail.png`), each of the
+THUMBNAIL_PLOTS gets a `{event}_{plot}_thumbnail.png`.
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+
+from PIL import Image, PngImagePlugin
+
+from .build_trace import trace_span
+from .parallel_plots import get_plot_workers
+from .plot_cache import _file_hash
+
+THUMBNAIL_PLOTS = [
+    "waveform",
+    "mass_corner",
+    "spin_corner",
+    "effective_spin_corner",
+    "sky_localisation_corner",
+    "remnant_corner",
+]
+THUMBNAIL_FRAC = 0.05
+THUMBNAIL_DPI = 200
+# the image is box-reduced until it is at most this factor larger than the
+# thumbnail, and then resampled (with Pillow's default filter)
+REDUCING_GAP = 3.0
+SOURCE_HASH_KEY = "nrsur:source-hash"
+
+# the thumbnails being made (inherited by the forked workers)
+_JOB: dict = {}
+
+
+def thumbnail_fn(event_name: str, events_dir: str, plot: str = "waveform") -> str:
+    if plot == "waveform":
+        return f"{events_dir}/{event_name}_thumbnail.png"
+    return f"{events_dir}/{event_name}_{plot}_thumbnail.png"
+
+
+def _stored_source_hash(thumb_image: str) -> Optional[str]:
+    """The source hash in the thumbnail's metadata (only its header is read)"""
+    if not os.path.isfile(thumb_image):
+        return None
+    try:
+        with Image.open(thumb_image) as image:
+            return image.info.get(SOURCE_HASH_KEY)
+    except OSError:
+        return None
+
+
+def resize_image(
+    orig_fname: str,
+    out_fn: str,
+    frac: float,
+    dpi: int = THUMBNAIL_DPI,
+    source_hash: str = "",
+) -> None:
+    """Resizes an image by the given fraction (storing the source hash in its metadata)"""
+    with Image.open(orig_fname) as image:
+        width, height = image.size
+        size = (max(int(width * frac), 1), max(int(height * frac), 1))
+        image.thumbnail(size, reducing_gap=REDUCING_GAP)
+        info = PngImagePlugin.PngInfo()
+        info.add_text(SOURCE_HASH_KEY, source_hash)
+        tmp = f"{out_fn}.{os.getpid()}.tmp"
+        image.save(tmp, format="PNG", dpi=(dpi, dpi), pnginfo=info)
+    os.replace(tmp, out_fn)
+
+
+def make_thumbnail(event_name: str, events_dir: str, plot: str = "waveform") -> str:
+    """Makes the thumbnail of the event's plot (if its plot changed), returns its
+    filename ('' if the event has no such plot)"""
+    fname = f"{events_dir}/{event_name}_{plot}.png"
+    thumb_image = thumbnail_fn(event_name, events_dir, plot)
+    if not os.path.isfile(fname):
+        if os.path.isfile(thumb_image):
+            os.remove(thumb_image)
+        return ""
+    source_hash = _file_hash(fname)
+    if _stored_source_hash(thumb_image) != source_hash:
+        with trace_span("thumbnailing", event=event_name):
+            resize_image(fname, thumb_image, THUMBNAIL_FRAC, source_hash=source_hash)
+    return thumb_image
+
+
+def make_event_thumbnails(event_name: str, events_dir: str) -> List[str]:
+    """Makes the thumbnails of all the event's THUMBNAIL_PLOTS"""
+    thumbs = [make_thumbnail(event_name, events_dir, plot) for plot in THUMBNAIL_PLOTS]
+    return [t for t in thumbs if t]
+
+
+def _make_job_thumbnails(index: int) -> List[str]:
+    return make_event_thumbnails(_JOB["event_names"][index], _JOB["events_dir"])
+
+
+def make_thumbnails(
+    event_names: List[str], events_dir: str, num_workers: Optional[int] = None
+) -> List[str]:
+    """Makes the thumbnails of the events, on a pool of worker processes"""
+    num_workers = get_plot_workers() if num_workers is None else num_workers
+    num_workers = min(num_workers, len(event_names))
+    if num_workers <= 1 or "fork" not in multiprocessing.get_all_start_methods():
+        thumbs = [make_event_thumbnails(e, events_dir) for e in event_names]
+    else:
+        _JOB.update(event_names=event_names, events_dir=events_dir)
+        try:
+            context = multiprocessing.get_context("fork")
+            with ProcessPoolExecutor(num_workers, mp_context=context) as pool:
+                thumbs = list(pool.map(_make_job_thumbnails, range(len(event_names))))
+        finally:
+            _JOB.clear()
+    return [t for event_thumbs in thumbs for t in event_thumbs]
@@ -1,12 +1,17 @@
+import filecmp
 import os
+import shutil
 
 import pandas as pd
 
-from nrsur_catalog import Catalog
+from nrsur_catalog.cache import CatalogCache
+from nrsur_catalog.catalog import POSTERIORS_TO_KEEP
 from nrsur_catalog.utils import LATEX_LABELS
 from nrsur_catalog import __website__
-from PIL import Image
 
+from .build_trace import trace_span
+from .summary_store import get_latex_summary
+from .thumbnails import make_thumbnails, thumbnail_fn
 from .video_links import get_video_html
 
 LINK = "[{txt}]({l})"
@@ -64,9 +69,11 @@ def get_catalog_summary(events_dir: str, cache_dir: str, columns=None) -> pd.Dat
         events_dir: Dir with the notebooks
         cache_dir: Dir with the NRSurResults
     """
-    catalog = Catalog.load(cache_dir)
-    df = __load_processed_links_dataframe(catalog, events_dir)
-    posterior_summary = __load_posterior_summary(catalog, columns=columns)
+    event_names = CatalogCache(cache_dir).event_names
+    with trace_span("thumbnailing"):
+        make_thumbnails(event_names, events_dir)
+    df = __load_processed_links_dataframe(event_names, events_dir)
+    posterior_summary = __load_posterior_summary(event_names, cache_dir, columns=columns)
 
     # merge the posterior summary ('event') with the catalog summary ('event_name') columns
     df = df.merge(posterior_summary, on="event_id")
@@ -81,57 +88,37 @@ def __check_fn(fname):
     return fname
 
 
-def resize_image(orig_fname, out_fn, frac, dpi=200):
-    """Resizes an image by the given fraction"""
-    outdir = os.path.dirname(orig_fname)
-    output_image_path = os.path.join(outdir, out_fn)
-    # Open the image using Pillow
-    image = Image.open(orig_fname)
-    # Calculate the new size (frac of the original size)
-    width, height = image.size
-    new_width = int(width * frac)
-    new_height = int(height * frac)
-    # Resize the image
-    resized_image = image.resize((new_width, new_height))
-    resized_image.info['dpi'] = (dpi, dpi)
-    # Save the resized image with the specified DPI
-    resized_image.save(output_image_path, dpi=(dpi, dpi))
-    # Save the resized image
-    resized_image.save(output_image_path)
-
-
-def __thumbnail(fname, event_link):
-    if not os.path.isfile(fname):
+def __thumbnail(event_name, events_dir, event_link):
+    thumb_image = thumbnail_fn(event_name, events_dir)
+    if not os.path.isfile(thumb_image):
         return "NA"
-    thumb_image = fname.replace("waveform", "thumbnail")
-    base_fn= os.path.basename(thumb_image)
-    resize_image(fname, thumb_image, 0.05)
+    base_fn = os.path.basename(thumb_image)
     return f"[![{base_fn}]({base_fn})]({event_link})"
 
 
-def __load_processed_links_dataframe(catalog: Catalog, events_dir: str) -> pd.DataFrame:
+def __load_processed_links_dataframe(event_names, events_dir: str) -> pd.DataFrame:
     event_data = []
-    for event in catalog.event_names:
+    for event in event_names:
         event_link = f"{event}.ipynb"
         event_url = LINK.format(l=event_link, txt=event)
         event_data.append(
             {
                 "event_id": event,
                 "Event": event_url,
-                "Waveform": __thumbnail(f"{events_dir}/{event}_waveform.png", event_link),
+                "Waveform": __thumbnail(event, events_dir, event_link),
             }
         )
     return pd.DataFrame(event_data)
 
 
-def __load_posterior_summary(catalog, columns=None):
-    posterior_summary = catalog.get_latex_summary()
+def __load_posterior_summary(event_names, cache_dir, columns=None):
+    # from the per-event summary store (only events whose data changed are recomputed)
+    if columns is None:
+        columns = POSTERIORS_TO_KEEP
+    posterior_summary = get_latex_summary(event_names, cache_dir, columns)
     posterior_summary["event_id"] = posterior_summary.index
     posterior_summary.index = range(len(posterior_summary))
-    if columns is None:
-        columns = posterior_summary.columns.values
-    else:
-        columns = ["event_id"] + columns
+    columns = ["event_id"] + columns
     posterior_summary = posterior_summary[columns]
     posterior_summary = posterior_summary.rename(
         columns={p: LATEX_LABELS.get(p, p) for p in columns}
@@ -141,3 +128,11 @@ def __load_posterior_summary(catalog, columns=None):
 
 def is_file(f):
     return os.path.exists(f) or os.path.islink(f)
+
+
+def copy_if_changed(src: str, dst: str) -> str:
+    """Copies src to dst only if their contents differ (keeping dst's mtime otherwise,
+    so Sphinx does not consider the page outdated)"""
+    if not (os.path.isfile(dst) and filecmp.cmp(src, dst, shallow=False)):
+        shutil.copy(src, dst)
+    return dst
@@ -0,0 +1,116 @@
+"""Module to execute notebooks in a warm IPython shell, reused across notebooks
+
+ploomber_engine's `execute_notebook` creates (and tears down) a new IPython
+shell for every notebook, which then re-runs the `%load_ext autoreload` and
+`%matplotlib inline` cells. Here each worker process keeps one shell and runs
+the notebooks it is given one after another in it. Between notebooks the user's
+variables are deleted, the figures closed, and the matplotlib rcParams, loaded
+extensions and event callbacks are restored to those of the fresh shell, so
+each notebook's outputs are the same as with a new shell. The names the shell
+adds to `builtins` (eg `__IPYTHON__`, which makes eg astropy look for the shell)
+are only set while a notebook runs.
+"""
+
+import builtins
+import csv
+from typing import Optional
+
+import nbformat
+from IPython.core.interactiveshell import InteractiveShell
+from ploomber_engine.ipython import PloomberShell
+from ploomber_engine.profiling import PloomberMemoryProfilerClient, get_profiling_data
+
+_SHELL: Optional[PloomberShell] = None
+_SHELL_STATE: dict = {}
+_MISSING = object()
+
+
+def get_warm_shell() -> PloomberShell:
+    """This process' shell (created on first use)"""
+    global _SHELL
+    if _SHELL is None:
+        import matplotlib
+
+        outer_builtins = dict(vars(builtins))
+        _SHELL = PloomberShell()
+        shell_builtins = {
+            k: v
+            for k, v in vars(builtins).items()
+            if outer_builtins.get(k, _MISSING) is not v
+        }
+        _SHELL_STATE.update(
+            rc_params=matplotlib.rcParams.copy(),
+            extensions=set(_SHELL.extension_manager.loaded),
+            callbacks={e: list(c) for e, c in _SHELL.events.callbacks.items()},
+            builtins=shell_builtins,
+            outer_builtins={k: outer_builtins.get(k, _MISSING) for k in shell_builtins},
+        )
+    vars(builtins).update(_SHELL_STATE["builtins"])
+    InteractiveShell._instance = PloomberShell._instance = _SHELL
+    return _SHELL
+
+
+def restore_builtins(outer_builtins: dict) -> None:
+    """Restores the {name: value (or _MISSING)} of builtins"""
+    for k, v in outer_builtins.items():
+        if v is _MISSING:
+            vars(builtins).pop(k, None)
+        else:
+            vars(builtins)[k] = v
+
+
+def reset_warm_shell() -> None:
+    """Restores the shell to its fresh state (so the next notebook is isolated)"""
+    import matplotlib
+    import matplotlib.pyplot as plt
+
+    if _SHELL is None:
+        return
+    _SHELL.delete_interactive_variables()
+    _SHELL._get_output()
+    plt.close("all")
+    matplotlib.rcParams.update(_SHELL_STATE["rc_params"])
+    # extensions loaded by the notebook (eg autoreload) are loaded afresh by the next
+    _SHELL.extension_manager.loaded = set(_SHELL_STATE["extensions"])
+    _SHELL.events.callbacks = {
+        e: list(c) for e, c in _SHELL_STATE["callbacks"].items()
+    }
+    _SHELL.clear_instance()
+    restore_builtins(_SHELL_STATE["outer_builtins"])
+
+
+class WarmShellClient(PloomberMemoryProfilerClient):
+    """ploomber_engine's memory-profiling client, run in the process' warm shell"""
+
+    def __enter__(self):
+        self._shell = get_warm_shell()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        reset_warm_shell()
+        self._shell = None
+
+
+def execute_notebook_in_warm_shell(
+    input_path: str,
+    output_path: str,
+    cwd: str,
+    profiling_data_fn: Optional[str] = None,
+    progress_bar: bool = False,
+) -> nbformat.NotebookNode:
+    """Executes the notebook (like ploomber's `execute_notebook`) in the warm shell,
+    writing the per-cell runtime/memory to profiling_data_fn"""
+    client = WarmShellClient.from_path(input_path, progress_bar=progress_bar, cwd=cwd)
+    try:
+        nb = client.execute()
+    except Exception:
+        nbformat.write(client._nb, output_path)
+        raise
+    nbformat.write(nb, output_path)
+    if profiling_data_fn is not None:
+        data = get_profiling_data(nb)
+        with open(profiling_data_fn, "w") as f:
+            writer = csv.writer(f)
+            writer.writerow(data.keys())
+            writer.writerows(zip(*data.values()))
+    return nb
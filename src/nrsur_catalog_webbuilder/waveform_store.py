@@ -0,0 +1,252 @@
+"""Module with an on-disk store of the waveforms of the posterior-predictive plot
+
+`NRsurResult.plot_signal` re-generates the waveforms of 1000 posterior samples
+every time the plot is drawn. Here the waveforms are computed once per event, in
+batches of samples fanned out to forked worker processes (which write their rows
+straight into a memory-mapped `.npy` file), and stored in a shared directory
+(NRSUR_WAVEFORM_STORE). A stored file is keyed by the content of the event's
+posterior file, the indices of the drawn samples, the polarisation, the waveform
+arguments and the library versions, so re-styling the plot (`plot_signal`
+below, drawn by `NRsurResult.plot_signal` with a waveform generator of the stored
+waveforms) only reads the memory-mapped waveforms.
+
+The samples are drawn (likelihood-weighted, without replacement) with a fixed
+seed, so the same event always plots the same samples.
+"""
+
+import contextlib
+import copy
+import hashlib
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+import matplotlib.pyplot as plt
+import numpy as np
+
+from nrsur_catalog.logger import logger
+
+from .manifest import get_library_versions, hash_text
+from .parallel_plots import get_plot_workers
+from .plot_cache import _file_hash, evict_lru
+
+WAVEFORM_STORE_ENV_VAR = "NRSUR_WAVEFORM_STORE"
+WAVEFORM_STORE_SIZE_ENV_VAR = "NRSUR_WAVEFORM_STORE_SIZE_GB"
+DEFAULT_WAVEFORM_STORE_DIR = os.path.join(
+    os.path.expanduser("~"), ".cache", "nrsur_catalog_waveforms"
+)
+DEFAULT_WAVEFORM_STORE_SIZE_GB = 20.0
+WAVEFORM_LIBRARIES = ["nrsur_catalog", "bilby", "lalsuite", "gwsurrogate", "numpy"]
+
+N_SAMPLES = 1000
+SEED = 0
+# samples per task of the worker pool
+BATCH_SIZE = 25
+# the column of the plotted posterior with the samples' rows in the stored waveforms
+WAVEFORM_ROW = "waveform_row"
+
+# the waveforms being computed (inherited by the forked workers)
+_JOB: dict = {}
+
+
+def get_sample_indices(result, n_samples: int = N_SAMPLES, seed: int = SEED) -> np.ndarray:
+    """Likelihood-weighted draws (without replacement) of the samples to plot"""
+    log_likelihood = np.asarray(result.posterior["log_likelihood"])
+    weights = np.exp(log_likelihood - np.max(log_likelihood))
+    p = weights / weights.sum()
+    if n_samples > np.count_nonzero(p):
+        n_samples = np.count_nonzero(p)
+        logger.warning("n_samples > len(posterior), using n_samples = len(posterior)")
+    rng = np.random.default_rng(seed)
+    return np.sort(rng.choice(len(p), size=n_samples, replace=False, p=p))
+
+
+def _get_waveform_generator(result):
+    """The result's waveform generator (as `NRsurResult.plot_signal`'s)"""
+    return result.waveform_generator_class(
+        duration=result.duration,
+        sampling_frequency=result.sampling_frequency,
+        start_time=result.start_time,
+        frequency_domain_source_model=result.frequency_domain_source_model,
+        parameter_conversion=result.parameter_conversion,
+        waveform_arguments=result.waveform_arguments,
+    )
+
+
+def _strain(generator, result, index: int, polarisation: str) -> np.ndarray:
+    params = dict(result.posterior.iloc[index])
+    # suppress the waveform generator's stdout
+    with open(os.devnull, "w") as f, contextlib.redirect_stdout(f):
+        return generator.time_domain_strain(params)[polarisation]
+
+
+def _compute_batch(start: int, stop: int) -> None:
+    """Writes the waveforms of rows [start, stop) (run in a forked worker)"""
+    waveforms = np.load(_JOB["path"], mmap_mode="r+")
+    generator = _get_waveform_generator(_JOB["result"])
+    for row in range(start, stop):
+        index = _JOB["indices"][row]
+        waveforms[row] = _strain(generator, _JOB["result"], index, _JOB["polarisation"])
+    waveforms.flush()
+
+
+class WaveformStore:
+    """A size-bounded (LRU) directory of the events' memory-mapped waveforms"""
+
+    def __init__(self, store_dir: Optional[str] = None, max_size: Optional[float] = None):
+        """store_dir: where the waveforms are stored (default: $NRSUR_WAVEFORM_STORE)
+        max_size: in GB (default: $NRSUR_WAVEFORM_STORE_SIZE_GB)"""
+        if store_dir is None:
+            store_dir = os.environ.get(WAVEFORM_STORE_ENV_VAR) or DEFAULT_WAVEFORM_STORE_DIR
+        if max_size is None:
+            max_size = float(
+                os.environ.get(WAVEFORM_STORE_SIZE_ENV_VAR, DEFAULT_WAVEFORM_STORE_SIZE_GB)
+            )
+        self.dir = store_dir
+        self.max_size = max_size * 1e9
+        os.makedirs(self.dir, exist_ok=True)
+
+    def path(self, result, indices: np.ndarray, polarisation: str) -> str:
+        data = dict(
+            posterior=_file_hash(result.path_to_result),
+            indices=hashlib.sha256(indices.tobytes()).hexdigest(),
+            polarisation=polarisation,
+            waveform_arguments=result.waveform_arguments,
+            libraries=get_library_versions(WAVEFORM_LIBRARIES),
+        )
+        key = hash_text(json.dumps(data, sort_keys=True, default=str))
+        return os.path.join(self.dir, f"{result.label}_{key[:16]}.npy")
+
+    def waveforms(
+        self,
+        result,
+        n_samples: int = N_SAMPLES,
+        polarisation: str = "plus",
+        num_workers: Optional[int] = None,
+    ) -> np.ndarray:
+        """The (memory-mapped) waveforms of the drawn samples, computed if not stored
+        (the last row is the maximum likelihood sample's waveform)"""
+        indices = get_sample_indices(result, n_samples)
+        path = self.path(result, indices, polarisation)
+        if not os.path.isfile(path):
+            self._compute(result, indices, polarisation, path, num_workers)
+        os.utime(path)  # mark as recently used
+        return np.load(path, mmap_mode="r")
+
+    def _compute(self, result, indices, polarisation, path, num_workers) -> None:
+        logger.info(f"Computing {len(indices)} waveforms of {result.label}")
+        generator = _get_waveform_generator(result)
+        try:
+            base_wf = _strain(generator, result, indices[0], polarisation)
+        except RuntimeError:
+            logger.warning(
+                "Unable to create a waveform: do you have NrSur7dq4 installed? "
+                "Defaulting to IMRPhenomPv2"
+            )
+            result.waveform_arguments["waveform_approximant"] = "IMRPhenomPv2"
+            result.waveform_arguments["minimum_frequency"] = 20
+            generator = _get_waveform_generator(result)
+            base_wf = _strain(generator, result, indices[0], polarisation)
+
+        partial = f"{path[:-len('.npy')]}.{os.getpid()}.partial.npy"
+        waveforms = np.lib.format.open_memmap(
+            partial, mode="w+", dtype=np.float32, shape=(len(indices) + 1, len(base_wf))
+        )
+        waveforms[0] = base_wf
+        max_idx = int(np.argmax(np.asarray(result.posterior["log_likelihood"])))
+        waveforms[-1] = _strain(generator, result, max_idx, polarisation)
+        waveforms.flush()
+        del waveforms
+
+        batches = [
+            (start, min(start + BATCH_SIZE, len(indices)))
+            for start in range(1, len(indices), BATCH_SIZE)
+        ]
+        num_workers = get_plot_workers() if num_workers is None else num_workers
+        num_workers = min(num_workers, len(batches))
+        _JOB.update(result=result, indices=indices, polarisation=polarisation, path=partial)
+        try:
+            if num_workers <= 1 or "fork" not in multiprocessing.get_all_start_methods():
+                for start, stop in batches:
+                    _compute_batch(start, stop)
+            else:
+                context = multiprocessing.get_context("fork")
+                with ProcessPoolExecutor(num_workers, mp_context=context) as pool:
+                    list(pool.map(_compute_batch, *zip(*batches)))
+            os.replace(partial, path)
+        finally:
+            _JOB.clear()
+            if os.path.isfile(partial):
+                os.remove(partial)
+        evict_lru(self.dir, self.max_size, suffix=".npy")
+
+
+def compute_event_waveforms(event_name: str, cache_dir: str) -> None:
+    """Build stage: stores the waveforms of the event's posterior-predictive plot"""
+    from nrsur_catalog import NRsurResult
+
+    result = NRsurResult.load(event_name, cache_dir=cache_dir)
+    WaveformStore().waveforms(result)
+
+
+class _StoredWaveforms:
+    """A waveform generator of the stored waveforms (of the samples' WAVEFORM_ROW)"""
+
+    def __init__(self, waveforms: np.ndarray, polarisation: str):
+        self.waveforms = waveforms
+        self.polarisation = polarisation
+
+    def time_domain_strain(self, parameters: dict) -> dict:
+        row = int(parameters[WAVEFORM_ROW])
+        return {self.polarisation: np.asarray(self.waveforms[row], dtype=np.float64)}
+
+
+def plot_signal(
+    result,
+    n_samples: Optional[int] = N_SAMPLES,
+    level: Optional[float] = None,
+    overplot_max_lnl: Optional[bool] = True,
+    polarisation: Optional[str] = "plus",
+    outdir: Optional[str] = "",
+    overplot_kwargs: Optional[dict] = {},
+    kwargs: Optional[dict] = {},
+) -> plt.Figure:
+    """`NRsurResult.plot_signal`, drawn from the waveform store: of a copy of the
+    result with a waveform generator of the stored waveforms, and the posterior of
+    the stored (already likelihood-drawn) samples with a flat log_likelihood (so
+    they are all drawn), the maximum likelihood sample first (so its argmax)"""
+    waveforms = WaveformStore().waveforms(result, n_samples, polarisation)
+    indices = get_sample_indices(result, n_samples)
+    rows = np.arange(len(indices))
+    max_idx = int(np.argmax(np.asarray(result.posterior["log_likelihood"])))
+    first = np.flatnonzero(indices == max_idx)
+    if len(first):
+        order = np.concatenate([first, np.delete(rows, first)])
+        indices, rows = indices[order], rows[order]
+    else:
+        indices = np.insert(indices, 0, max_idx)
+        rows = np.insert(rows, 0, len(waveforms) - 1)
+    posterior = result.posterior.iloc[indices].reset_index(drop=True)
+    posterior["log_likelihood"] = 0.0
+    posterior[WAVEFORM_ROW] = rows
+
+    stored = copy.copy(result)
+    stored.posterior = posterior
+    stored.meta_data = dict(
+        result.meta_data,
+        likelihood=dict(
+            result.meta_data["likelihood"],
+            waveform_generator_class=lambda **_: _StoredWaveforms(waveforms, polarisation),
+        ),
+    )
+    return stored.plot_signal(
+        n_samples=len(posterior),
+        level=level,
+        overplot_max_lnl=overplot_max_lnl,
+        polarisation=polarisation,
+        outdir=outdir,
+        overplot_kwargs=dict(overplot_kwargs),
+        kwargs=dict(kwargs),
+    )
@@ -0,0 +1,241 @@
+"""Module to optimize the website's images for the web (after the html build)
+
+The pages embed full-size PNGs straight from `savefig`, all loaded eagerly.
+After jupyter-book's build, the PNGs in `_build/html/_images` (the pages' plots
+and the notebooks' output figures) are:
+- losslessly re-compressed (kept only if smaller),
+- written as WebP (and AVIF, if Pillow supports it) at RESPONSIVE_WIDTHS,
+and every page's `<img>` of them is rewritten to a `<picture>` with a `srcset`
+per format, `loading="lazy"` and `decoding="async"` (the png stays the
+fallback). The bytes saved on each page are logged and written to a report.
+
+A record of the processed images (`.web_images.json` in the html dir) keeps
+their source hash, so the variants of an image are only re-made if it changed
+(Sphinx re-copies the original png of the pages it re-writes, which is then
+only re-compressed).
+"""
+
+import json
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from glob import glob
+from typing import Dict, List, Optional
+
+from PIL import Image, features
+
+from nrsur_catalog.logger import logger
+
+from .manifest import _hash_file
+from .parallel_plots import get_plot_workers
+
+IMAGES_DIR = "_images"
+RECORD_FN = ".web_images.json"
+REPORT_FN = "web_images_report.json"
+RESPONSIVE_WIDTHS = [480, 960, 1600]
+# the width of the pages' content column
+SIZES = "(max-width: 960px) 100vw, 960px"
+WEB_FORMATS = {"avif": dict(quality=60), "webp": dict(quality=85, method=6)}
+MIME_TYPES = {"avif": "image/avif", "webp": "image/webp"}
+
+IMG_TAG = re.compile(r"<img\b[^>]*>")
+SRC_ATTR = re.compile(r'\bsrc="([^"]+\.png)"')
+
+# the images being processed (inherited by the forked workers)
+_JOB: dict = {}
+
+
+def get_web_formats() -> List[str]:
+    """The formats this Pillow can write (AVIF needs Pillow built with libavif)"""
+    return [fmt for fmt in WEB_FORMATS if features.check(fmt)]
+
+
+def _stat(path: str) -> list:
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def variant_fn(png_fn: str, width: int, fmt: str) -> str:
+    return f"{os.path.splitext(png_fn)[0]}-{width}w.{fmt}"
+
+
+def optimize_png(png_fn: str) -> int:
+    """Losslessly re-compresses the png (if that makes it smaller),
+    returns the bytes saved"""
+    tmp = f"{png_fn}.{os.getpid()}.tmp"
+    with Image.open(png_fn) as image:
+        image.save(tmp, format="PNG", optimize=True, **_png_info(image))
+    saved = os.path.getsize(png_fn) - os.path.getsize(tmp)
+    if saved > 0:
+        os.replace(tmp, png_fn)
+        return saved
+    os.remove(tmp)
+    return 0
+
+
+def _png_info(image: Image.Image) -> dict:
+    return {k: image.info[k] for k in ["dpi", "transparency"] if k in image.info}
+
+
+def write_variants(png_fn: str, formats: List[str]) -> Dict[str, Dict[int, str]]:
+    """Writes the png's {format: {width: filename}} (at the widths below its own)"""
+    variants: Dict[str, Dict[int, str]] = {fmt: {} for fmt in formats}
+    with Image.open(png_fn) as image:
+        image.load()
+        widths = [w for w in RESPONSIVE_WIDTHS if w < image.width] + [image.width]
+        for width in widths:
+            height = max(1, round(image.height * width / image.width))
+            resized = image if width == image.width else image.resize((width, height))
+            for fmt in formats:
+                fn = variant_fn(png_fn, width, fmt)
+                resized.save(fn, format=fmt.upper(), **WEB_FORMATS[fmt])
+                variants[fmt][width] = fn
+    return variants
+
+
+def _process_image(png_fn: str, record: Optional[dict], formats: List[str]) -> dict:
+    """Optimizes the png (if it changed since `record`), returns its new record"""
+    if record is not None and record["stat"] == _stat(png_fn):
+        return record
+    source = _hash_file(png_fn)
+    original_size = os.path.getsize(png_fn)
+    if (
+        record is not None
+        and record["source"] == source
+        and record["formats"] == formats
+    ):
+        variants = record["variants"]  # the png was re-copied, its variants are valid
+    else:
+        variants = {
+            fmt: {str(w): os.path.basename(fn) for w, fn in fns.items()}
+            for fmt, fns in write_variants(png_fn, formats).items()
+        }
+    optimize_png(png_fn)
+    return dict(
+        source=source,
+        formats=formats,
+        original_size=original_size,
+        stat=_stat(png_fn),
+        variants=variants,
+    )
+
+
+def _process_job_image(index: int) -> dict:
+    png_fn = _JOB["images"][index]
+    return _process_image(png_fn, _JOB["records"].get(png_fn), _JOB["formats"])
+
+
+def _picture_tag(img_tag: str, src: str, record: dict) -> str:
+    """The <picture> (one srcset per format) with the lazy-loaded <img> fallback"""
+    src_dir = os.path.dirname(src)
+    sources = []
+    for fmt, fns in record["variants"].items():
+        widths = sorted(fns, key=int)
+        srcset = ", ".join(f"{src_dir}/{fns[w]} {w}w" for w in widths)
+        sources.append(
+            f'<source type="{MIME_TYPES[fmt]}" srcset="{srcset}" sizes="{SIZES}" />'
+        )
+    img_tag = re.sub(r"\s*/?>$", ' loading="lazy" decoding="async" />', img_tag)
+    return f"<picture>{''.join(sources)}{img_tag}</picture>"
+
+
+def rewrite_html(html_fn: str, records: Dict[str, dict], images_dir: str) -> int:
+    """Rewrites the page's <img> of the processed images, returns the bytes saved
+    (the full-width best-format variant vs the original png of each image)"""
+    with open(html_fn, "r") as f:
+        html = f.read()
+    saved = 0
+
+    def _rewrite(match: re.Match) -> str:
+        nonlocal saved
+        img_tag = match.group(0)
+        src = SRC_ATTR.search(img_tag)
+        if src is None:
+            return img_tag
+        png_fn = os.path.join(images_dir, os.path.basename(src.group(1)))
+        record = records.get(png_fn)
+        if record is None or f"/{IMAGES_DIR}/" not in f"/{src.group(1)}":
+            return img_tag
+        best = min(
+            [os.path.getsize(png_fn)]
+            + [
+                os.path.getsize(os.path.join(images_dir, fns[max(fns, key=int)]))
+                for fns in record["variants"].values()
+            ]
+        )
+        saved += record["original_size"] - best
+        if "loading=" in img_tag:  # already rewritten (page not re-written by Sphinx)
+            return img_tag
+        return _picture_tag(img_tag, src.group(1), record)
+
+    new_html = IMG_TAG.sub(_rewrite, html)
+    if new_html != html:
+        tmp = f"{html_fn}.tmp"
+        with open(tmp, "w") as f:
+            f.write(new_html)
+        os.replace(tmp, html_fn)
+    return saved
+
+
+def optimize_web_images(
+    outdir: str, num_workers: Optional[int] = None
+) -> Dict[str, int]:
+    """Optimizes the html build's images and rewrites its pages' <img> tags,
+    returns the {page: bytes saved}"""
+    html_dir = os.path.join(outdir, "_build", "html")
+    if not os.path.isdir(html_dir):
+        logger.warning(f"No html build in {outdir}, skipping the web images")
+        return {}
+    images_dir = os.path.join(html_dir, IMAGES_DIR)
+    record_fn = os.path.join(html_dir, RECORD_FN)
+    records: Dict[str, dict] = {}
+    if os.path.isfile(record_fn):
+        with open(record_fn, "r") as f:
+            records = {os.path.join(images_dir, k): v for k, v in json.load(f).items()}
+    images = sorted(glob(os.path.join(images_dir, "*.png")))
+    formats = get_web_formats()
+
+    num_workers = get_plot_workers() if num_workers is None else num_workers
+    num_workers = min(num_workers, len(images))
+    if num_workers <= 1 or "fork" not in multiprocessing.get_all_start_methods():
+        new_records = [_process_image(i, records.get(i), formats) for i in images]
+    else:
+        _JOB.update(images=images, records=records, formats=formats)
+        try:
+            context = multiprocessing.get_context("fork")
+            with ProcessPoolExecutor(num_workers, mp_context=context) as pool:
+                new_records = list(pool.map(_process_job_image, range(len(images))))
+        finally:
+            _JOB.clear()
+    records = dict(zip(images, new_records))
+    # the stale variants (of removed images, or of the old widths of changed ones)
+    variants = {
+        fn
+        for record in records.values()
+        for fns in record["variants"].values()
+        for fn in fns.values()
+    }
+    for fmt in WEB_FORMATS:
+        for fn in glob(os.path.join(images_dir, f"*-*w.{fmt}")):
+            if os.path.basename(fn) not in variants:
+                os.remove(fn)
+
+    report = {}
+    for html_fn in sorted(glob(os.path.join(html_dir, "**", "*.html"), recursive=True)):
+        saved = rewrite_html(html_fn, records, images_dir)
+        if saved:
+            report[os.path.relpath(html_fn, html_dir)] = saved
+
+    tmp = f"{record_fn}.tmp"
+    with open(tmp, "w") as f:
+        json.dump({os.path.basename(k): v for k, v in records.items()}, f, indent=1)
+    os.replace(tmp, record_fn)
+    report_fn = os.path.join(outdir, REPORT_FN)
+    with open(report_fn, "w") as f:
+        json.dump(report, f, indent=1)
+    logger.info(
+        f"Web images: {len(images)} images, {sum(report.values()) / 1e6:.1f} MB saved "
+        f"over {len(report)} pages (see {report_fn})"
+    )
+    return report
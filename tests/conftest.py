@@ -23,3 +23,16 @@ def mock_nrsur_result(tmpdir):
 @pytest.fixture
 def mock_cache_dir(tmpdir):
     return get_mock_cache_dir(test_dir=tmpdir, num_events=3)
+
+
+@pytest.fixture
+def isolated_builtins():
+    """Restores the builtins after the test (eg the `__IPYTHON__` an IPython shell
+    adds, after which eg astropy looks for the shell)"""
+    import builtins
+
+    before = dict(vars(builtins))
+    yield
+    for name in set(vars(builtins)) - set(before):
+        del vars(builtins)[name]
+    vars(builtins).update(before)
@@ -0,0 +1,49 @@
+import numpy as np
+from matplotlib import cbook, mlab
+
+from nrsur_catalog_webbuilder.binned_kde import scott_bandwidth, violin_stats
+
+
+def _reflected_kde(x, coords, bounds):
+    """The direct Gaussian KDE of x and its reflections about the bounds"""
+    bw = scott_bandwidth(x)
+
+    def kde(y):
+        z = (coords[:, None] - y[None, :]) / bw
+        return np.exp(-0.5 * z**2).sum(axis=1) / (len(x) * bw * np.sqrt(2 * np.pi))
+
+    return kde(x) + sum(kde(2 * b - x) for b in bounds if b is not None)
+
+
+def test_densities_match_direct_kde():
+    rng = np.random.default_rng(0)
+    # (events of different scales and shapes are binned together)
+    samples = [rng.normal(i, 1 + 10 * i, size=3000) for i in range(3)]
+    samples.append(rng.gamma(2.0, size=2000))
+    expected = cbook.violin_stats(samples)
+    for x, stats, ref in zip(samples, violin_stats(samples), expected):
+        np.testing.assert_allclose(stats["coords"], ref["coords"])
+        kde = mlab.GaussianKDE(x, "scott").evaluate(stats["coords"])
+        np.testing.assert_allclose(stats["vals"], kde, atol=1e-3 * kde.max())
+        assert stats["median"] == ref["median"] and stats["max"] == ref["max"]
+
+
+def test_densities_are_reflected_about_bounds():
+    rng = np.random.default_rng(1)
+    samples = [
+        1 - np.abs(rng.normal(0, 0.1, size=4000)),  # eg mass_ratio, piled up at 1
+        rng.uniform(0, 1, size=500),  # eg a spin
+        rng.normal(0.5, 0.05, size=1000),  # away from the bounds
+    ]
+    for x, stats in zip(samples, violin_stats(samples, bounds=(0.0, 1.0))):
+        expected = _reflected_kde(x, stats["coords"], (0.0, 1.0))
+        np.testing.assert_allclose(stats["vals"], expected, atol=1e-3 * expected.max())
+        dx = stats["coords"][1] - stats["coords"][0]
+        assert abs(stats["vals"].sum() * dx - 1) < 0.05
+
+
+def test_degenerate_samples():
+    stats = violin_stats([[], [2.0, 2.0], [np.nan, 1.0, 3.0, 2.0]])
+    assert len(stats[0]["vals"]) == 0 and np.isnan(stats[0]["median"])
+    assert np.all(stats[1]["coords"] == 2) and np.all(stats[1]["vals"] == 1)
+    assert stats[2]["min"] == 1.0 and np.all(np.isfinite(stats[2]["vals"]))
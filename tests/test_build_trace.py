@@ -0,0 +1,47 @@
+import time
+
+from nrsur_catalog_webbuilder.build_trace import (
+    TRACE_ENV_VAR,
+    collect_spans,
+    compare_traces,
+    load_trace,
+    summarize_trace,
+    trace_span,
+    write_trace,
+)
+from nrsur_catalog_webbuilder.scheduler import TaskGraph
+
+
+def _mock_notebook(event_name, seconds):
+    with trace_span("notebook_execution", event=event_name):
+        data = bytearray(20 * 1024 * 1024)  # peak RSS of the span
+        time.sleep(seconds)
+        del data
+
+
+def test_trace_spans_from_workers(monkeypatch, tmpdir):
+    monkeypatch.setenv(TRACE_ENV_VAR, "1")
+    collect_spans()
+    graph = TaskGraph()
+    graph.add("events/GW150914", _mock_notebook, "GW150914", 0.3)
+    graph.add("events/GW170817", _mock_notebook, "GW170817", 0.1)
+    with trace_span("build"):
+        graph.run(num_workers=2)
+    spans = collect_spans()
+    stages = sorted(s["stage"] for s in spans)
+    assert stages == ["build", "notebook_execution", "notebook_execution", "task", "task"]
+    nb_spans = [s for s in spans if s["stage"] == "notebook_execution"]
+    assert {s["event"] for s in nb_spans} == {"GW150914", "GW170817"}
+    assert all(s["peak_rss_mb"] >= 20 for s in nb_spans)
+    assert all(s["wall"] >= 0.1 and s["cpu"] >= 0 for s in spans)
+
+    write_trace(f"{tmpdir}/trace.json", spans)
+    spans = load_trace(f"{tmpdir}/trace.json")
+    summary = summarize_trace(spans)
+    assert "notebook_execution" in summary
+    assert summary.index("GW150914") < summary.index("GW170817")  # slowest first
+
+    slower = [dict(s, wall=s["wall"] * 2) for s in spans]
+    comparison = compare_traces(spans, slower)
+    assert "REGRESSION" in comparison
+    assert "REGRESSION" not in compare_traces(spans, spans)
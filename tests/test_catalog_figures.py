@@ -0,0 +1,73 @@
+import os
+
+import matplotlib
+
+matplotlib.use("Agg")
+import numpy as np
+import pandas as pd
+
+from nrsur_catalog.catalog import POSTERIORS_TO_KEEP, Catalog
+from nrsur_catalog_webbuilder.catalog_figures import catalog_view, figure_inputs
+from nrsur_catalog_webbuilder.parallel_plots import cached_plots
+
+EVENTS = ["GW150914_095045", "GW151012_095443", "GW151226_033853"]
+
+
+def _catalog(seed=0):
+    rng = np.random.default_rng(seed)
+    posteriors = pd.DataFrame({p: rng.normal(size=300) for p in POSTERIORS_TO_KEEP})
+    posteriors["event"] = rng.permutation(np.repeat(EVENTS, 100))
+    return Catalog(posteriors)
+
+
+def test_catalog_view_matches_catalog():
+    catalog = _catalog()
+    view = catalog_view(catalog)
+    assert catalog_view(view) is view
+    assert view.event_names == catalog.event_names == EVENTS
+    expected = catalog.to_dict_of_posteriors(["chi_eff"])
+    for event, posterior in view.to_dict_of_posteriors(["chi_eff"]).items():
+        pd.testing.assert_frame_equal(posterior, expected[event])
+    pd.testing.assert_frame_equal(
+        view.get_event_posterior(EVENTS[1]), catalog.get_event_posterior(EVENTS[1])
+    )
+    pd.testing.assert_frame_equal(
+        view.get_posterior_quantiles(), catalog.get_posterior_quantiles()
+    )
+
+
+def test_figures_are_invalidated_on_their_own(tmpdir, monkeypatch):
+    monkeypatch.chdir(tmpdir)  # (the violin plots are saved in the working dir)
+    monkeypatch.setenv("NRSUR_PLOT_CACHE", f"{tmpdir}/plot_cache")
+    view = catalog_view(_catalog())
+    inputs = figure_inputs(view, ["chi_eff"])
+    assert inputs == figure_inputs(catalog_view(_catalog()), ["chi_eff"])
+
+    # only the figures of the changed parameter (or of a changed set of events) change
+    df = view.get_all_posteriors()
+    df["final_kick"] += 1
+    changed = catalog_view(Catalog(df))
+    assert figure_inputs(changed, ["chi_eff"]) == inputs
+    assert figure_inputs(changed, ["final_kick"]) != figure_inputs(view, ["final_kick"])
+    fewer = catalog_view(Catalog(df[df["event"] != EVENTS[0]]))
+    assert figure_inputs(fewer, ["chi_eff"]) != inputs
+
+    plots = [
+        dict(
+            fname="catalog_chi_eff_mass_ratio.png",
+            make_plot=lambda: view.plot_2d_posterior("chi_eff", "mass_ratio"),
+            kind="raster_2d_posterior",
+            **figure_inputs(view, ["chi_eff", "mass_ratio"]),
+        )
+    ]
+    for param in ["chi_eff", "final_kick"]:
+        plots.append(
+            dict(
+                fname=f"{param}_violin.png",
+                make_plot=lambda param=param: view.violin_plot(param),
+                kind="binned_violin",
+                **figure_inputs(view, [param]),
+            )
+        )
+    cached_plots(plots, num_workers=3, prepare=view.get_posterior_quantiles)
+    assert all(os.path.isfile(plot["fname"]) for plot in plots)
@@ -0,0 +1,120 @@
+import gc
+import weakref
+
+import matplotlib
+
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+from scipy.ndimage import gaussian_filter
+
+from nrsur_catalog_webbuilder import corner_densities
+from nrsur_catalog_webbuilder.corner_densities import (
+    LEVELS,
+    PosteriorDensities,
+    plot_corner_densities,
+)
+from nrsur_catalog_webbuilder.parallel_plots import cached_plots
+
+
+def _posterior(n=5000):
+    rng = np.random.default_rng(0)
+    return pd.DataFrame(rng.normal(size=(n, 4)), columns=["a", "b", "c", "d"])
+
+
+def test_densities_match_corner():
+    posterior = _posterior()
+    densities = PosteriorDensities(posterior)
+    densities.compute(["a", "b", "c"])
+    densities.compute(["c", "b", "d"])  # (b, c) is reused
+    assert len(densities.two_d) == 5
+
+    # as corner.hist2d
+    x, y = posterior["c"].values, posterior["b"].values
+    edges = [np.linspace(v.min(), v.max(), 51) for v in [x, y]]
+    H, _, _ = np.histogram2d(x, y, bins=edges)
+    H = gaussian_filter(H, 0.9)
+    d = densities.get_2d("c", "b")
+    np.testing.assert_allclose(d.H, H, atol=1e-9)
+    Hflat = np.sort(H.flatten())[::-1]
+    sm = np.cumsum(Hflat)
+    sm /= sm[-1]
+    np.testing.assert_allclose(d.levels, sorted(Hflat[sm <= v0][-1] for v0 in LEVELS))
+
+    counts, _ = np.histogram(x, bins=edges[0], density=True)
+    np.testing.assert_allclose(densities.get_1d("c").density, counts)
+
+
+def test_plots_share_prepared_densities(tmpdir, monkeypatch):
+    computed = []
+    compute = PosteriorDensities.compute
+    monkeypatch.setattr(
+        PosteriorDensities,
+        "compute",
+        lambda self, params: computed.append(params) or compute(self, params),
+    )
+
+    class _Result:
+        posterior = _posterior()
+
+    result = _Result()
+    param_sets = [["a", "b"], ["b", "c", "d"]]
+    plots = [
+        dict(
+            fname=f"{tmpdir}/{i}_corner.png",
+            make_plot=lambda params=params: corner_densities.plot_corner(result, params),
+            kind="binned_corner",
+            params=params,
+        )
+        for i, params in enumerate(param_sets)
+    ]
+    prepare = lambda: corner_densities.prepare_densities(result, param_sets)
+    monkeypatch.setenv("NRSUR_PLOT_CACHE", f"{tmpdir}/plot_cache")
+    cached_plots(plots, num_workers=1, prepare=prepare)
+    plt.close("all")
+    # computed by prepare; the figures found all their densities
+    assert len(computed) == 4
+    assert len(corner_densities.get_densities(result).two_d) == 4
+    fig = plot_corner_densities(corner_densities.get_densities(result), ["b", "c", "d"])
+    assert len(fig.axes) == 9
+    plt.close(fig)
+
+    # plot cache hits: nothing to prepare
+    computed.clear()
+    cached_plots(plots, num_workers=1, prepare=prepare)
+    assert computed == []
+
+
+def test_rendered_results_are_released():
+    class _Result:
+        def __init__(self, posterior):
+            self.posterior = posterior
+
+    # two events rendered, one after the other, by the same (long-lived) process
+    first = _Result(_posterior())
+    plt.close(corner_densities.plot_corner(first, ["a", "b"]))
+    released = weakref.ref(first)
+    del first
+    second = _Result(_posterior() + 1)
+    plt.close(corner_densities.plot_corner(second, ["a", "b"]))
+    gc.collect()
+    assert released() is None
+    assert list(corner_densities._DENSITIES.keys()) == [second]
+
+
+def test_overlay_widens_the_limits():
+    nr = PosteriorDensities(_posterior())
+    lvk = PosteriorDensities(_posterior() + 100)  # a disjoint range
+    fig = plot_corner_densities(nr, ["a", "b"])
+    nr_lims = [(ax.get_xlim(), ax.get_ylim()) for ax in fig.axes]
+    fig = plot_corner_densities(lvk, ["a", "b"], fig=fig, titles=False, quantiles=[])
+    for i, j in [(0, 0), (1, 0), (1, 1)]:
+        ax = fig.axes[2 * i + j]
+        (x0, x1), (y0, y1) = nr_lims[2 * i + j]
+        assert ax.get_xlim()[0] <= x0 and ax.get_xlim()[1] >= lvk.ranges["ab"[j]][1]
+        if i != j:
+            assert ax.get_ylim()[0] <= y0 and ax.get_ylim()[1] >= lvk.ranges["ab"[i]][1]
+        else:
+            assert ax.get_ylim()[1] >= y1
+    plt.close(fig)
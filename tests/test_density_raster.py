@@ -0,0 +1,72 @@
+import matplotlib
+
+matplotlib.use("Agg")
+import numpy as np
+import pandas as pd
+from matplotlib.colors import to_rgba
+from matplotlib.image import AxesImage
+from scipy.ndimage import gaussian_filter
+
+from nrsur_catalog.catalog import POSTERIORS_TO_KEEP, Catalog
+from nrsur_catalog_webbuilder.catalog_figures import catalog_view
+from nrsur_catalog_webbuilder.density_raster import (
+    FILL_ALPHA,
+    LEVEL,
+    event_densities,
+    rasterize,
+)
+
+
+def _samples(rng, center, scale, n=4000):
+    return rng.normal(center, scale, size=n), rng.normal(center, 2 * scale, size=n)
+
+
+def test_densities_match_hist2d():
+    rng = np.random.default_rng(0)
+    samples = [_samples(rng, 0, 1), _samples(rng, 10, 0.1, n=500)]
+    densities = event_densities([s[0] for s in samples], [s[1] for s in samples])
+    for e, (x, y) in enumerate(samples):
+        # as corner.hist2d
+        H, _, _ = np.histogram2d(x, y, bins=50)
+        H = gaussian_filter(H, 1.1)
+        np.testing.assert_allclose(densities.H2[e, 2:-2, 2:-2], H, atol=1e-9)
+        Hflat = np.sort(H.flatten())[::-1]
+        sm = np.cumsum(Hflat) / Hflat.sum()
+        assert densities.levels[e] == Hflat[sm <= LEVEL][-1]
+        assert np.isclose(densities.x0[e] + 1.5 * densities.dx[e], x.min())
+
+
+def test_rasterize():
+    rng = np.random.default_rng(1)
+    samples = [_samples(rng, 0, 1), _samples(rng, 1, 1)]
+    densities = event_densities([s[0] for s in samples], [s[1] for s in samples])
+    image = rasterize(densities, (-10, 10, -10, 10), ["red", "blue"], resolution=200)
+    assert image.shape == (200, 200, 4)
+    # the second event is over the first, the corners are left transparent
+    blue = FILL_ALPHA * np.array(to_rgba("blue")) + (1 - FILL_ALPHA)
+    np.testing.assert_allclose(image[110, 110, :3], blue[:3])
+    assert image[0, 0, 3] == 0 and image[-1, -1, 3] == 0
+    # the regions contain ~the level's probability of the samples
+    x, y = samples[0]
+    inside = image[:, :, 3] > 0
+    px = np.clip(((x + 10) / 20 * 200).astype(int), 0, 199)
+    py = np.clip(((y + 10) / 20 * 200).astype(int), 0, 199)
+    assert np.mean(inside[py, px]) > LEVEL
+
+    outlined = rasterize(densities, (-10, 10, -10, 10), ["red", "blue"], 200, True)
+    edges = np.any(outlined != image, axis=2)
+    assert edges.any() and not edges[0, 0] and not edges[100, 100]
+
+
+def test_plot_2d_posterior_is_one_image():
+    rng = np.random.default_rng(2)
+    events = ["GW150914_095045", "GW151012_095443", "GW151226_033853"]
+    posteriors = pd.DataFrame({p: rng.normal(size=3000) for p in POSTERIORS_TO_KEEP})
+    posteriors["event"] = np.repeat(events, 1000)
+    view = catalog_view(Catalog(posteriors))
+    fig = view.plot_2d_posterior("chi_p", "final_kick", event_posteriors=True)
+    ax = fig.axes[0]
+    assert [type(a) for a in ax.get_images()] == [AxesImage]
+    assert ax.get_xlim() == (posteriors["chi_p"].min(), posteriors["chi_p"].max())
+    # the medians (and their quantile crosses) stay vector overlays
+    assert len(ax.collections[0].get_offsets()) == len(events)
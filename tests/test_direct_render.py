@@ -0,0 +1,81 @@
+import os
+
+import jupytext
+import matplotlib.pyplot as plt
+import pytest
+from ploomber_engine import execute_notebook
+
+from nrsur_catalog_webbuilder.direct_render import (
+    DirectExecutionError,
+    execute_notebook_directly,
+)
+from nrsur_catalog_webbuilder.history import read_peak_memory
+
+NOTEBOOK = """
+# # Title
+
+# + tags=["remove-input"]
+# %matplotlib inline
+import matplotlib.pyplot as plt
+
+x = 21
+# -
+
+print(f"x is {x}")
+x * 2
+
+# + tags=["remove-output"]
+fig = plt.figure()
+plt.plot([1, 2])
+fig.savefig("line.png")
+# -
+
+fig = plt.figure()
+plt.plot([1, 2]);
+"""
+
+
+def _write_notebook(path, txt=NOTEBOOK):
+    jupytext.write(jupytext.reads(txt, fmt="py:light"), path)
+
+
+def _output_types(nb):
+    return [[o.output_type for o in c.outputs] for c in nb.cells if c.cell_type == "code"]
+
+
+def test_direct_render_matches_ploomber(tmpdir, isolated_builtins):
+    nb_fn = f"{tmpdir}/page.ipynb"
+    _write_notebook(nb_fn)
+    csv_fn = f"{tmpdir}/page-profiling-data.csv"
+    plt.figure()  # eg left open by an earlier page: not a cell's output
+    open_figures = plt.get_fignums()
+    nb = execute_notebook_directly(nb_fn, f"{tmpdir}/direct.ipynb", str(tmpdir), csv_fn)
+    assert plt.get_fignums() == open_figures
+    plt.close("all")  # (ploomber's inline backend would show them in its first cell)
+    expected = execute_notebook(
+        nb_fn, f"{tmpdir}/ploomber.ipynb", cwd=str(tmpdir), progress_bar=False
+    )
+    assert os.path.isfile(f"{tmpdir}/line.png")
+    assert read_peak_memory(csv_fn) > 0
+
+    # the same outputs as the executed notebook (bar the removed figure)
+    types = _output_types(nb)
+    assert types[2] == ["stream", "execute_result"]
+    assert types[3] == []
+    assert types[4] == ["execute_result", "display_data"]
+    assert [t for i, t in enumerate(_output_types(expected)) if i != 3] == [
+        t for i, t in enumerate(types) if i != 3
+    ]
+    cells = [c for c in nb.cells if c.cell_type == "code"]
+    assert cells[2].outputs[0].text == "x is 21\n"
+    assert cells[2].outputs[1].data["text/plain"] == "42"
+    assert "image/png" in cells[4].outputs[1].data
+    assert "%matplotlib inline" in cells[1].source
+
+
+def test_direct_render_errors(tmpdir):
+    nb_fn = f"{tmpdir}/page.ipynb"
+    _write_notebook(nb_fn, "x = 1\n\n# +\nraise ValueError('bad cell')\n")
+    with pytest.raises(DirectExecutionError, match="cell 2"):
+        execute_notebook_directly(nb_fn, nb_fn, str(tmpdir))
+    assert os.getcwd() != str(tmpdir)
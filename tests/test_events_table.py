@@ -0,0 +1,78 @@
+import json
+import os
+
+import numpy as np
+from PIL import Image
+
+from nrsur_catalog.cache import CatalogCache
+from nrsur_catalog.utils import LATEX_LABELS
+from nrsur_catalog_webbuilder import events_table
+from nrsur_catalog_webbuilder.events_table import (
+    DT_BUNDLE_FILES,
+    events_table_dir,
+    write_events_table,
+    write_search_index,
+)
+from nrsur_catalog_webbuilder.summary_store import get_event_summary
+from nrsur_catalog_webbuilder.thumbnails import thumbnail_fn
+
+
+def test_events_table(mock_cache_dir, tmpdir):
+    cache = CatalogCache(mock_cache_dir)
+    outdir = str(tmpdir.join("website"))
+    events_dir = os.path.join(outdir, "events")
+    os.makedirs(events_dir)
+    name = cache.event_names[0]
+    pixels = np.full((20, 30, 3), 100, dtype=np.uint8)
+    Image.fromarray(pixels).save(thumbnail_fn(name, events_dir))
+
+    json_fn = write_events_table(outdir, cache, columns=["chi_eff", "not_a_param"])
+    with open(json_fn) as f:
+        table = json.load(f)
+    assert table["columns"][:2] == ["Event", "Waveform"]
+    assert table["columns"][2] == f"\\({LATEX_LABELS['chi_eff'].strip('$')}\\)"
+    assert [row[0] for row in table["data"]] == sorted(cache.event_names)
+    row = {row[0]: row for row in table["data"]}
+    assert row[name][1] == f"{name}_thumbnail.png"
+    assert row[name][2].startswith("\\(") and "nan" in row[name][3]
+    assert all(row[event][1] == "" for event in cache.event_names if event != name)
+
+    table_dir = events_table_dir(outdir)
+    assert os.listdir(os.path.join(table_dir, "thumbnails")) == [f"{name}_thumbnail.png"]
+    assert all(os.path.isfile(os.path.join(table_dir, fn)) for fn in DT_BUNDLE_FILES)
+
+    # an unchanged table is not rewritten, a removed thumbnail is removed
+    os.utime(json_fn, ns=(0, 0))
+    write_events_table(outdir, cache, columns=["chi_eff", "not_a_param"])
+    assert os.stat(json_fn).st_mtime_ns == 0
+    os.remove(thumbnail_fn(name, events_dir))
+    write_events_table(outdir, cache, columns=["chi_eff", "not_a_param"])
+    assert os.listdir(os.path.join(table_dir, "thumbnails")) == []
+    assert os.stat(json_fn).st_mtime_ns != 0
+
+
+def test_search_index(mock_cache_dir, tmpdir, monkeypatch):
+    cache = CatalogCache(mock_cache_dir)
+    outdir = str(tmpdir.join("website"))
+    index_fn = write_search_index(outdir, cache)
+    with open(index_fn) as f:
+        index = json.load(f)
+    assert index["parameters"] == list(LATEX_LABELS)
+    assert index["events"] == sorted(cache.event_names)
+    name = cache.event_names[0]
+    e, p = index["events"].index(name), index["parameters"].index("chi_eff")
+    stats = get_event_summary(name, cache.dir)["parameters"]["chi_eff"]
+    np.testing.assert_allclose(index["values"][e][p], stats["quantiles"], rtol=1e-3)
+    assert index["values"][e][index["parameters"].index("chirp_mass")] is not None
+
+    # only the rows of the changed events are re-read
+    read = []
+    search_row = events_table._search_row
+    monkeypatch.setattr(
+        events_table, "_search_row", lambda *args: read.append(args[0]) or search_row(*args)
+    )
+    write_search_index(outdir, cache)
+    assert read == []
+    os.utime(cache.find(name))
+    write_search_index(outdir, cache)
+    assert read == [name]
@@ -0,0 +1,60 @@
+import os
+
+from nrsur_catalog_webbuilder import manifest as manifest_module
+from nrsur_catalog_webbuilder.manifest import BuildManifest
+
+
+def test_manifest_fingerprints(tmpdir, monkeypatch):
+    data = f"{tmpdir}/GW150914_NRSur7dq4.h5"
+    with open(data, "w") as f:
+        f.write("posterior v1")
+
+    hash_calls = []
+    _hash_file = manifest_module._hash_file
+    monkeypatch.setattr(
+        manifest_module, "_hash_file", lambda p: hash_calls.append(p) or _hash_file(p)
+    )
+
+    manifest = BuildManifest(f"{tmpdir}/out")
+    fp = manifest.fingerprint(dict(version="1.0"), files=[data])
+    assert manifest.is_stale("events/GW150914", fp)
+    manifest.record("events/GW150914", fp)
+    manifest.save()
+
+    # reloaded manifest: same inputs -> not stale, and the data file is not re-hashed
+    manifest = BuildManifest(f"{tmpdir}/out")
+    assert manifest.fingerprint(dict(version="1.0"), files=[data]) == fp
+    assert not manifest.is_stale("events/GW150914", fp)
+    assert len(hash_calls) == 1
+    assert manifest.fingerprint(dict(version="1.1"), files=[data]) != fp
+
+    # missing outputs -> stale
+    assert manifest.is_stale("events/GW150914", fp, outputs=[f"{tmpdir}/nope.ipynb"])
+
+    # changed data -> new fingerprint
+    with open(data, "w") as f:
+        f.write("posterior v2 (new samples)")
+    assert manifest.fingerprint(dict(version="1.0"), files=[data]) != fp
+    assert len(hash_calls) == 2
+
+
+def test_unchanged_files_keep_their_mtime(tmpdir):
+    from nrsur_catalog_webbuilder.make_pages import _replace_strings_from_file
+    from nrsur_catalog_webbuilder.utils import copy_if_changed
+
+    src, dst, page = f"{tmpdir}/src.md", f"{tmpdir}/dst.md", f"{tmpdir}/page.md"
+    with open(src, "w") as f:
+        f.write("version {{VERSION}}")
+    copy_if_changed(src, dst)
+    _replace_strings_from_file(src, {"{{VERSION}}": "1"}, page)
+    os.utime(dst, ns=(0, 0))
+    os.utime(page, ns=(0, 0))
+
+    copy_if_changed(src, dst)
+    _replace_strings_from_file(src, {"{{VERSION}}": "1"}, page)
+    assert os.stat(dst).st_mtime_ns == 0
+    assert os.stat(page).st_mtime_ns == 0
+
+    _replace_strings_from_file(src, {"{{VERSION}}": "2"}, page)
+    assert open(page).read() == "version 2"
+    assert os.stat(page).st_mtime_ns > 0
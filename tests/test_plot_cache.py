@@ -0,0 +1,147 @@
+import os
+
+import matplotlib
+
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+
+from nrsur_catalog_webbuilder.plot_cache import PlotCache, cached_plot
+
+
+def _make_plot(calls):
+    def make_plot():
+        calls.append(1)
+        fig, ax = plt.subplots()
+        ax.plot([1, 2, 3])
+        return fig
+
+    return make_plot
+
+
+def test_cached_plot(tmpdir):
+    posterior = f"{tmpdir}/GW150914_NRSur7dq4.h5"
+    with open(posterior, "w") as f:
+        f.write("posterior v1")
+    cache = PlotCache(f"{tmpdir}/plot_cache")
+    calls = []
+    for outdir in ["site_a", "site_b"]:
+        os.makedirs(f"{tmpdir}/{outdir}")
+        fname = f"{tmpdir}/{outdir}/GW150914_mass_corner.png"
+        cached_plot(fname, _make_plot(calls), [posterior], cache=cache, params=["q"])
+        assert os.path.isfile(fname)
+    # the second outdir reuses the first's plot
+    assert len(calls) == 1
+
+    # new plotting kwargs or posterior content are a cache miss
+    cached_plot(fname, _make_plot(calls), [posterior], cache=cache, params=["chi_eff"])
+    assert len(calls) == 2
+    with open(posterior, "w") as f:
+        f.write("posterior v2")
+    cached_plot(fname, _make_plot(calls), [posterior], cache=cache, params=["q"])
+    assert len(calls) == 3
+    assert len([f for f in os.listdir(cache.dir) if f.endswith(".png")]) == 3
+
+
+def test_file_hashes_are_stored(tmpdir, monkeypatch):
+    from nrsur_catalog_webbuilder import plot_cache
+
+    posterior = f"{tmpdir}/GW150914_NRSur7dq4.h5"
+    with open(posterior, "w") as f:
+        f.write("posterior v1")
+    cache = PlotCache(f"{tmpdir}/plot_cache")
+    monkeypatch.setattr(plot_cache, "_FILE_HASHES", {})
+    key = cache.key([posterior], params=["q"])
+
+    # a new process (eg a build worker, or a later build) reuses the stored hashes
+    monkeypatch.setattr(plot_cache, "_FILE_HASHES", {})
+    hashed = []
+    hash_file = plot_cache._hash_file
+    monkeypatch.setattr(
+        plot_cache, "_hash_file", lambda path: hashed.append(path) or hash_file(path)
+    )
+    assert cache.key([posterior], params=["q"]) == key
+    assert hashed == []
+
+    # (unless the file changed)
+    with open(posterior, "w") as f:
+        f.write("posterior v2, longer")
+    monkeypatch.setattr(plot_cache, "_FILE_HASHES", {})
+    assert cache.key([posterior], params=["q"]) != key
+    assert hashed == [os.path.realpath(posterior)]
+
+
+def test_plotting_code_change_is_a_cache_miss(tmpdir, monkeypatch):
+    import shutil
+
+    from nrsur_catalog_webbuilder import plot_cache
+
+    code_dir = f"{tmpdir}/code"
+    os.makedirs(code_dir)
+    for module in plot_cache.PLOTTING_MODULES:
+        shutil.copy(os.path.join(plot_cache.HERE, f"{module}.py"), code_dir)
+    monkeypatch.setattr(plot_cache, "HERE", code_dir)
+    cache = PlotCache(f"{tmpdir}/plot_cache")
+    calls = []
+    fname = f"{tmpdir}/catalog_mass_1_mass_2.png"
+    cached_plot(fname, _make_plot(calls), cache=cache, kind="raster_2d_posterior")
+    cached_plot(fname, _make_plot(calls), cache=cache, kind="raster_2d_posterior")
+    assert len(calls) == 1
+
+    # eg a fix of the raster engine redraws the plots it drew
+    with open(f"{code_dir}/density_raster.py", "a") as f:
+        f.write("\n# a change of the plotting code\n")
+    cached_plot(fname, _make_plot(calls), cache=cache, kind="raster_2d_posterior")
+    assert len(calls) == 2
+
+
+def test_plot_cache_evicts_least_recently_used(tmpdir):
+    cache = PlotCache(f"{tmpdir}/plot_cache", max_size=2.5e-9)  # 2.5 bytes
+    for i, key in enumerate(["a", "b", "c"]):
+        fname = f"{tmpdir}/{key}.png"
+        with open(fname, "w") as f:
+            f.write("1")
+        cache.put(key, fname)
+        os.utime(cache.path(key), (i, i))
+        if key == "b":
+            os.utime(cache.path("a"), (10, 10))  # 'a' was used after 'b' was added
+    assert sorted(os.listdir(cache.dir)) == ["a.png", "c.png"]
+    assert cache.get("a", f"{tmpdir}/out.png")
+    assert not cache.get("b", f"{tmpdir}/out.png")
+
+
+def test_cached_plots_fan_out(tmpdir, monkeypatch):
+    import numpy as np
+
+    from nrsur_catalog_webbuilder.parallel_plots import cached_plots
+
+    posterior = np.random.normal(size=1000)  # loaded once, shared with the workers
+    cache_dir = f"{tmpdir}/plot_cache"
+
+    def make_plot(bins):
+        with open(f"{tmpdir}/pid_{bins}", "w") as f:
+            f.write(str(os.getpid()))
+        fig, ax = plt.subplots()
+        ax.hist(posterior, bins=bins)
+        return fig
+
+    plots = [
+        dict(
+            fname=f"{tmpdir}/hist_{bins}.png",
+            make_plot=lambda bins=bins: make_plot(bins),
+            bins=bins,
+        )
+        for bins in [10, 20, 30]
+    ]
+    monkeypatch.setenv("NRSUR_PLOT_CACHE", cache_dir)
+    cached_plots(plots, num_workers=3)
+    assert all(os.path.isfile(p["fname"]) for p in plots)
+    pids = {open(f"{tmpdir}/pid_{bins}").read() for bins in [10, 20, 30]}
+    assert str(os.getpid()) not in pids
+
+    # a second page (eg another outdir) only links the cached plots
+    for p in plots:
+        os.remove(p["fname"])
+        os.remove(f"{tmpdir}/pid_{p['bins']}")
+    cached_plots(plots, num_workers=3)
+    assert all(os.path.isfile(p["fname"]) for p in plots)
+    assert not any(os.path.exists(f"{tmpdir}/pid_{b}") for b in [10, 20, 30])
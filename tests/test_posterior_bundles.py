@@ -0,0 +1,105 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from nrsur_catalog import NRsurResult
+from nrsur_catalog.cache import CatalogCache
+from nrsur_catalog.catalog import CATALOG_FN, Catalog
+from nrsur_catalog_webbuilder import bundle_reader, posterior_bundles
+from nrsur_catalog_webbuilder.posterior_bundles import (
+    bundle_dir,
+    event_bundle_is_stale,
+    load_catalog,
+    load_result,
+    write_catalog_bundle,
+    write_event_bundle,
+)
+
+
+def test_event_bundle(mock_cache_dir, tmpdir, monkeypatch):
+    cache = CatalogCache(mock_cache_dir)
+    name = cache.event_names[0]
+    outdir = str(tmpdir.join("website"))
+    monkeypatch.setattr(
+        bundle_reader, "BUNDLE_URL", f"file://{bundle_dir(outdir)}/{{}}"
+    )
+
+    assert event_bundle_is_stale(name, cache.dir, outdir)
+    fn = write_event_bundle(name, cache.dir, outdir)
+    assert not event_bundle_is_stale(name, cache.dir, outdir)
+    assert os.path.getsize(fn) < os.path.getsize(cache.find(name))
+
+    # a reader without the posteriors gets the bundle (downloaded to their cache)
+    reader_cache = str(tmpdir.join("reader_cache"))
+    result = load_result(name, reader_cache)
+    assert os.path.isfile(os.path.join(reader_cache, "bundles", f"{name}.npz"))
+    full = NRsurResult.load(name, cache_dir=cache.dir)
+    pd.testing.assert_frame_equal(result.summary(), full.summary())
+    np.testing.assert_allclose(
+        result.posterior["geocent_time"], full.posterior["geocent_time"], atol=1e-6
+    )
+    assert result.meta_data["config_file"] == full.meta_data["config_file"]
+    # (the priors, and the waveform settings of `plot_signal`)
+    assert result.priors == full.priors
+    assert result.waveform_generator_class == full.waveform_generator_class
+    assert result.waveform_arguments == full.waveform_arguments
+    assert list(result.lvk_result.posterior.columns) == [
+        c for c in posterior_bundles.POSTERIORS_TO_KEEP
+        if c in full.lvk_result.posterior.columns
+    ]
+
+    # with the posterior cached, the full result is loaded
+    assert load_result(name, cache.dir).posterior.shape == full.posterior.shape
+
+    # a changed posterior file (or bundle format) makes the bundle stale
+    with monkeypatch.context() as m:
+        m.setattr(posterior_bundles, "BUNDLE_FORMAT", 0)
+        assert event_bundle_is_stale(name, cache.dir, outdir)
+    os.utime(cache.find(name, lvk_posteriors=True), ns=(0, 0))
+    assert event_bundle_is_stale(name, cache.dir, outdir)
+
+
+def test_catalog_bundle(tmpdir, monkeypatch):
+    outdir = str(tmpdir.join("website"))
+    cache_dir = str(tmpdir.join("cache"))
+    os.makedirs(cache_dir)
+    monkeypatch.setattr(
+        bundle_reader, "BUNDLE_URL", f"file://{bundle_dir(outdir)}/{{}}"
+    )
+    rng = np.random.default_rng(0)
+    posteriors = pd.DataFrame(
+        {p: rng.normal(size=30) for p in posterior_bundles.POSTERIORS_TO_KEEP}
+    )
+    events = ["GW150914_095045", "GW151012_095443", "GW151226_033853"]
+    posteriors["event"] = np.repeat(events, 10)
+    Catalog(posteriors).save(os.path.join(cache_dir, CATALOG_FN))
+
+    assert write_catalog_bundle(str(tmpdir.join("empty")), outdir) is None
+    write_catalog_bundle(cache_dir, outdir)
+    catalog = load_catalog(str(tmpdir.join("reader_cache")))
+    assert catalog.event_names == events
+    expected = Catalog(posteriors).to_dict_of_posteriors()
+    for event, posterior in catalog.to_dict_of_posteriors().items():
+        # (the catalog's sort by event does not keep the order of the samples)
+        np.testing.assert_allclose(
+            np.sort(posterior, axis=0), np.sort(expected[event], axis=0), atol=1e-6
+        )
+
+
+def test_missing_lvk_posterior_is_loaded_when_needed(tmpdir, monkeypatch):
+    calls = []
+    monkeypatch.setattr(
+        bundle_reader,
+        "load_lvk_result",
+        lambda label, cache_dir: calls.append((label, cache_dir)) or "lvk",
+    )
+    result = bundle_reader.BundleResult(
+        label="GW150914_095045",
+        outdir=str(tmpdir.join("GW150914_095045")),
+        posterior=pd.DataFrame(dict(chi_eff=[0.0, 0.1])),
+        search_parameter_keys=["chi_eff"],
+    )
+    assert calls == []
+    assert result.lvk_result == "lvk" and result.lvk_result == "lvk"
+    assert calls == [("GW150914_095045", str(tmpdir))]
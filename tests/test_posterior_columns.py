@@ -0,0 +1,43 @@
+import os
+
+import h5py
+import numpy as np
+import pytest
+
+from nrsur_catalog.cache import NR_LABEL
+from nrsur_catalog_webbuilder.posterior_columns import (
+    load_columns,
+    posterior_length,
+    remove_sidecars,
+)
+
+
+def test_posterior_columns(mock_nrsur_result):
+    path = mock_nrsur_result
+    with h5py.File(path, "r") as f:
+        samples = f[NR_LABEL]["posterior_samples"][()]
+    columns = ["mass_1", "chi_eff"]
+
+    df = load_columns(path, columns)
+    assert list(df.columns) == columns
+    for c in columns:
+        np.testing.assert_array_equal(df[c], samples[c])
+    assert len(load_columns(path).columns) == len(samples.dtype.names)
+    assert posterior_length(path) == len(samples)
+    with pytest.raises(KeyError):
+        load_columns(path, ["not_a_column"])
+
+
+def test_sidecars_are_removed(tmpdir, monkeypatch):
+    columns_dir = f"{tmpdir}/columns"
+    monkeypatch.setenv("NRSUR_COLUMNS_DIR", columns_dir)
+    event_dir = f"{tmpdir}/events"
+    for d in [f"{columns_dir}/GW150914_0123", f"{event_dir}/.columns/GW150914"]:
+        os.makedirs(d)
+        np.save(f"{d}/mass_1.npy", np.zeros(3))
+    open(f"{event_dir}/GW150914.h5", "w").close()
+
+    remove_sidecars(event_dir)
+    assert not os.path.exists(columns_dir)
+    assert os.listdir(event_dir) == ["GW150914.h5"]
+    remove_sidecars(event_dir)  # (nothing left to remove)
@@ -0,0 +1,174 @@
+import pytest
+import glob
+import os
+
+from nrsur_catalog_webbuilder import make_pages
+from nrsur_catalog_webbuilder.scheduler import build_gw_pages
+
+
+def _mock_make_gw_page(event_name, outdir, cache):
+    if event_name == "GW000000":
+        raise RuntimeError("notebook failed")
+    with open(os.path.join(outdir, f"{event_name}.ipynb"), "w") as f:
+        f.write(str(os.getpid()))
+
+
+def test_build_gw_pages_reports_each_event(monkeypatch, tmpdir):
+    monkeypatch.setattr(make_pages, "make_gw_page", _mock_make_gw_page)
+    events = ["GW150914", "GW000000", "GW170817", "GW190521"]
+    results = build_gw_pages(events, str(tmpdir), str(tmpdir), num_workers=2)
+    assert set(results) == set(events)
+    assert not results["GW000000"].success
+    assert "notebook failed" in results["GW000000"].error
+    assert all(results[e].success for e in events if e != "GW000000")
+
+    # the pages are built on (at most) 2 long-lived worker processes
+    pids = {open(f"{tmpdir}/{e}.ipynb").read() for e in events if e != "GW000000"}
+    assert len(pids) <= 2
+
+
+def _write_marker(fname, after=None):
+    import time
+
+    if after is not None:
+        assert os.path.exists(after), f"{after} must be written before {fname}"
+    time.sleep(0.1)
+    with open(fname, "w") as f:
+        f.write("done")
+
+
+def _fail():
+    raise ValueError("task failed")
+
+
+def test_task_graph_runs_deps_first(tmpdir):
+    from nrsur_catalog_webbuilder.scheduler import TaskGraph
+
+    graph = TaskGraph()
+    done = []
+    graph.add("menu", _write_marker, f"{tmpdir}/menu", after=f"{tmpdir}/thumb")
+    graph.add("thumb", _write_marker, f"{tmpdir}/thumb", after=f"{tmpdir}/page", deps=["page"])
+    graph.add("page", _write_marker, f"{tmpdir}/page", on_done=done.append)
+    graph.add("broken", _fail)
+    graph.tasks["menu"].deps = ["thumb", "not-in-graph"]
+    results = graph.run(num_workers=3)
+    assert all(results[t].success for t in ["menu", "thumb", "page"])
+    assert not results["broken"].success
+    assert [r.name for r in done] == ["page"]
+
+    graph.add("cycle", _fail, deps=["menu"])
+    graph.tasks["menu"].deps.append("cycle")
+    with pytest.raises(ValueError):
+        graph.run()
+
+
+def test_longest_tasks_start_first(tmpdir):
+    from nrsur_catalog_webbuilder.history import BuildHistory, predict_makespan
+    from nrsur_catalog_webbuilder.scheduler import TaskGraph
+
+    history = BuildHistory(str(tmpdir))
+    history.record("events/GW150914", 100.0, size=1000)
+    history.save()
+    history = BuildHistory(str(tmpdir))
+    # no history: estimated from the posterior size
+    assert history.estimate("events/GW170817", 3000) == pytest.approx(300.0)
+    assert history.estimate("events/GW150914", 3000) == pytest.approx(100.0)
+    assert predict_makespan([4, 3, 2, 2, 1], num_workers=2) == 6
+
+    graph = TaskGraph()
+    started = []
+    for name, cost in [("short", 1), ("long", 10), ("medium", 5)]:
+        graph.add(name, _write_marker, f"{tmpdir}/{name}", cost=cost)
+    graph.run(num_workers=1, on_done=lambda r: started.append(r.name))
+    assert started == ["long", "medium", "short"]
+
+
+def _record_concurrency(fname, marker_dir):
+    import time
+
+    open(f"{marker_dir}/{os.path.basename(fname)}.running", "w").close()
+    time.sleep(0.2)
+    running = len(glob.glob(f"{marker_dir}/*.running"))
+    with open(fname, "w") as f:
+        f.write(str(running))
+    os.remove(f"{marker_dir}/{os.path.basename(fname)}.running")
+
+
+def test_memory_budget_limits_concurrency(tmpdir):
+    from nrsur_catalog_webbuilder.history import read_peak_memory
+    from nrsur_catalog_webbuilder.scheduler import TaskGraph
+
+    graph = TaskGraph()
+    for i in range(4):
+        graph.add(f"big{i}", _record_concurrency, f"{tmpdir}/big{i}", str(tmpdir), memory=600)
+    results = graph.run(num_workers=4, memory_budget=1000)
+    assert all(r.success for r in results.values())
+    # only one 600MB task fits in the 1GB budget at once
+    assert all(open(f"{tmpdir}/big{i}").read() == "1" for i in range(4))
+
+    with open(f"{tmpdir}/GW150914-profiling-data.csv", "w") as f:
+        f.write("cell,runtime,memory\n1,0.1,150.5\n2,3.0,812.25\n3,0.2,NA\n")
+    assert read_peak_memory(f"{tmpdir}/GW150914-profiling-data.csv") == 812.25
+    assert read_peak_memory(f"{tmpdir}/missing.csv") is None
+
+
+def _fail_once(marker):
+    if not os.path.exists(marker):
+        with open(marker, "w") as f:
+            f.write("failed")
+        raise RuntimeError("flaky task")
+
+
+def _sleep(seconds):
+    import time
+
+    time.sleep(seconds)
+
+
+def test_retries_timeouts_and_resume(tmpdir):
+    from nrsur_catalog_webbuilder.journal import DONE, FAILED, BuildJournal
+    from nrsur_catalog_webbuilder.scheduler import TaskGraph
+
+    graph = TaskGraph()
+    graph.add("flaky", _fail_once, f"{tmpdir}/flaky")
+    graph.add("slow", _sleep, 10, timeout=0.5)
+    graph.add("page", _write_marker, f"{tmpdir}/page")
+    journal = BuildJournal(str(tmpdir))
+    results = graph.run(num_workers=2, journal=journal, retries=1)
+    assert results["flaky"].success
+    assert not results["slow"].success
+    assert "TaskTimeoutError" in results["slow"].error
+    assert journal.attempts("flaky") == 2
+    assert journal.attempts("slow") == 2
+    assert journal.state("slow") == FAILED
+
+    # a resumed build only re-runs the tasks that didn't finish
+    os.remove(f"{tmpdir}/page")
+    journal = BuildJournal(str(tmpdir), resume=True)
+    assert journal.state("page") == DONE
+    results = graph.run(journal=journal)
+    assert results["page"].success and not os.path.exists(f"{tmpdir}/page")
+    assert not results["slow"].success
+
+
+def test_dependents_of_failed_tasks_are_skipped(tmpdir):
+    from nrsur_catalog_webbuilder.journal import DONE, FAILED, SKIPPED, BuildJournal
+    from nrsur_catalog_webbuilder.scheduler import TaskGraph
+
+    graph = TaskGraph()
+    graph.add("page", _fail)
+    graph.add("thumb", _write_marker, f"{tmpdir}/thumb", deps=["page"])
+    graph.add("menu", _write_marker, f"{tmpdir}/menu", deps=["thumb"])
+    graph.add("book", _write_marker, f"{tmpdir}/book", after=["page", "menu"])
+    journal = BuildJournal(str(tmpdir))
+    results = graph.run(num_workers=2, journal=journal)
+    assert not results["page"].success and not results["page"].skipped
+    for name in ["thumb", "menu"]:
+        assert results[name].skipped and not results[name].success
+        assert not os.path.exists(f"{tmpdir}/{name}")
+    # (ordering-only deps still run)
+    assert results["book"].success
+    assert journal.state("page") == FAILED
+    assert journal.state("thumb") == journal.state("menu") == SKIPPED
+    assert journal.state("book") == DONE
+    assert journal.attempts("thumb") == 0
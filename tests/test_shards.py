@@ -0,0 +1,73 @@
+import os
+
+import pytest
+
+from nrsur_catalog_webbuilder import build_website
+from nrsur_catalog_webbuilder.history import BuildHistory
+from nrsur_catalog_webbuilder.manifest import BuildManifest
+from nrsur_catalog_webbuilder.shards import get_shard_events, merge_shards
+
+
+def test_shards_partition_the_events():
+    events = [f"GW1509{i:02d}" for i in range(10)]
+    shards = [get_shard_events(events[::-1], f"{i}/3") for i in range(3)]
+    assert sorted(sum(shards, [])) == events
+    assert shards[0] == get_shard_events(events, "0/3")
+    for bad_shard in ["3/3", "1", "a/b", "0/0"]:
+        with pytest.raises(ValueError):
+            get_shard_events(events, bad_shard)
+
+
+def _mock_shard(shard_dir, event):
+    os.makedirs(f"{shard_dir}/events/.nrsur_catalog_cache", exist_ok=True)
+    for fname in [f"{event}.ipynb", f"{event}_waveform.png", f".{event}.partial.py"]:
+        with open(f"{shard_dir}/events/{fname}", "w") as f:
+            f.write(event)
+    manifest = BuildManifest(shard_dir)
+    manifest.record(f"events/{event}", f"fingerprint-{event}")
+    manifest.save()
+    history = BuildHistory(shard_dir)
+    history.record(f"events/{event}", 10.0, size=100)
+    history.save()
+
+
+def test_merge_shards(tmpdir):
+    shard_dirs = [f"{tmpdir}/shards/0", f"{tmpdir}/shards/1"]
+    _mock_shard(shard_dirs[0], "GW150914")
+    _mock_shard(shard_dirs[1], "GW170817")
+    outdir = f"{tmpdir}/website"
+    merge_shards(shard_dirs, outdir)
+
+    files = sorted(os.listdir(f"{outdir}/events"))
+    assert files == [
+        "GW150914.ipynb",
+        "GW150914_waveform.png",
+        "GW170817.ipynb",
+        "GW170817_waveform.png",
+    ]
+    manifest = BuildManifest(outdir)
+    assert manifest.get("events/GW170817") == "fingerprint-GW170817"
+    assert set(BuildHistory(outdir).durations) == {"events/GW150914", "events/GW170817"}
+
+    # merging again keeps the (unchanged) pages' mtime for the incremental html build
+    os.utime(f"{outdir}/events/GW150914.ipynb", ns=(0, 0))
+    merge_shards(shard_dirs, outdir)
+    assert os.stat(f"{outdir}/events/GW150914.ipynb").st_mtime_ns == 0
+
+
+def test_empty_shard_is_merged(mock_cache_dir, tmpdir):
+    shard_dirs = [f"{tmpdir}/shards/0", f"{tmpdir}/shards/1"]
+    _mock_shard(shard_dirs[0], "GW150914")
+    # (more shards than the 3 events)
+    assert build_website(mock_cache_dir, shard_dirs[1], shard="3/4") == []
+    outdir = f"{tmpdir}/website"
+    merge_shards(shard_dirs, outdir)
+    assert sorted(os.listdir(f"{outdir}/events")) == [
+        "GW150914.ipynb",
+        "GW150914_waveform.png",
+    ]
+
+
+def test_empty_cache(tmpdir):
+    with pytest.raises(ValueError, match="No events found in the cache directory"):
+        build_website(f"{tmpdir}", f"{tmpdir}/website", shard="0/2")
@@ -0,0 +1,60 @@
+import os
+
+import pandas as pd
+
+from nrsur_catalog import NRsurResult
+from nrsur_catalog.cache import CatalogCache
+from nrsur_catalog_webbuilder import summary_store
+from nrsur_catalog_webbuilder.summary_store import (
+    get_event_summary,
+    get_latex_summary,
+    summary_markdown,
+    summary_table,
+)
+
+
+def test_summary_store(mock_cache_dir, tmpdir, monkeypatch):
+    monkeypatch.setenv("NRSUR_SUMMARY_STORE", f"{tmpdir}/summaries")
+    cache = CatalogCache(mock_cache_dir)
+    name = cache.event_names[0]
+    result = NRsurResult.load(name, cache_dir=cache.dir)
+
+    summary = get_event_summary(name, cache.dir)
+    pd.testing.assert_frame_equal(summary_table(name, cache.dir), result.summary())
+    assert summary_markdown(name, cache.dir) == result.summary(markdown=True)
+    stats = summary["parameters"]["chi_eff"]
+    assert stats["median"] == stats["quantiles"][2]
+    assert stats["ci_90"][0] < stats["ci_68"][0] < stats["median"] < stats["ci_68"][1]
+
+    latex = get_latex_summary(cache.event_names, cache.dir, ["chi_eff", "not_a_param"])
+    assert list(latex.index) == cache.event_names
+    assert latex.loc[name, "chi_eff"] == stats["latex"]
+    assert "nan" in latex.loc[name, "not_a_param"]
+    # (stored in the summary store, not the event dir)
+    assert len(os.listdir(f"{tmpdir}/summaries")) == len(cache.event_names)
+    assert not [f for f in os.listdir(cache.dir) if f.startswith(".")]
+
+    # stored summaries are reused (without re-hashing) until the data changes
+    computed, hashed = [], []
+    compute_summary = summary_store.compute_summary
+    hash_file = summary_store._hash_file
+    monkeypatch.setattr(
+        summary_store, "compute_summary", lambda r: computed.append(r) or compute_summary(r)
+    )
+    monkeypatch.setattr(
+        summary_store, "_hash_file", lambda p: hashed.append(p) or hash_file(p)
+    )
+    get_latex_summary(cache.event_names, cache.dir, ["chi_eff"])
+    assert computed == [] and hashed == []
+
+    path = cache.find(name)
+    os.utime(path)  # touched: re-hashed, not recomputed
+    get_event_summary(name, cache.dir)
+    assert computed == [] and len(hashed) == 1
+    get_event_summary(name, cache.dir)
+    assert len(hashed) == 1
+
+    with open(path, "ab") as f:  # changed data: recomputed
+        f.write(b"\0")
+    get_event_summary(name, cache.dir, result=result)
+    assert len(computed) == 1
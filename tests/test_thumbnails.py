@@ -0,0 +1,54 @@
+import os
+
+import numpy as np
+from PIL import Image
+
+from nrsur_catalog_webbuilder import thumbnails
+from nrsur_catalog_webbuilder.thumbnails import (
+    THUMBNAIL_PLOTS,
+    make_thumbnails,
+    thumbnail_fn,
+)
+
+
+def _write_plot(fname, value):
+    pixels = np.full((400, 600, 3), value, dtype=np.uint8)
+    Image.fromarray(pixels).save(fname)
+
+
+def test_thumbnails(tmpdir, monkeypatch):
+    events_dir = str(tmpdir)
+    events = ["GW150914", "GW151012", "GW151226"]
+    for event in events:
+        for plot in THUMBNAIL_PLOTS:
+            _write_plot(f"{events_dir}/{event}_{plot}.png", 100)
+    # GW151226 has no remnant plot
+    os.remove(f"{events_dir}/GW151226_remnant_corner.png")
+
+    thumbs = make_thumbnails(events, events_dir, num_workers=3)
+    assert len(thumbs) == len(events) * len(THUMBNAIL_PLOTS) - 1
+    assert thumbnail_fn("GW150914", events_dir) == f"{events_dir}/GW150914_thumbnail.png"
+    with Image.open(thumbnail_fn("GW150914", events_dir, "mass_corner")) as image:
+        assert image.size == (30, 20)
+
+    resized = []
+    resize_image = thumbnails.resize_image
+    monkeypatch.setattr(
+        thumbnails,
+        "resize_image",
+        lambda *args, **kwargs: resized.append(args[0]) or resize_image(*args, **kwargs),
+    )
+
+    # unchanged plots (even if re-written) are not re-thumbnailed
+    _write_plot(f"{events_dir}/GW150914_waveform.png", 100)
+    make_thumbnails(events, events_dir, num_workers=1)
+    assert resized == []
+
+    # a changed plot is, and a removed plot's thumbnail is removed
+    _write_plot(f"{events_dir}/GW150914_waveform.png", 200)
+    os.remove(f"{events_dir}/GW151012_spin_corner.png")
+    make_thumbnails(events, events_dir, num_workers=1)
+    assert resized == [f"{events_dir}/GW150914_waveform.png"]
+    assert not os.path.exists(thumbnail_fn("GW151012", events_dir, "spin_corner"))
+    with Image.open(thumbnail_fn("GW150914", events_dir)) as image:
+        assert image.getpixel((0, 0)) == (200, 200, 200)
@@ -0,0 +1,49 @@
+import builtins
+
+import jupytext
+
+from nrsur_catalog_webbuilder import warm_shell
+from nrsur_catalog_webbuilder.history import read_peak_memory
+
+NOTEBOOK = """
+# %load_ext autoreload
+# %autoreload 2
+import matplotlib
+
+print("leak" in globals(), matplotlib.rcParams["lines.linewidth"])
+
+leak = 1
+matplotlib.rcParams["lines.linewidth"] = 10
+"""
+
+
+def _stdout(nb):
+    return "".join(
+        o.get("text", "") for c in nb.cells if c.cell_type == "code" for o in c.outputs
+    )
+
+
+def test_warm_shell_isolates_notebooks(tmpdir):
+    nb_fn = f"{tmpdir}/page.ipynb"
+    jupytext.write(jupytext.reads(NOTEBOOK, fmt="py:light"), nb_fn)
+
+    outer_builtins = dict(vars(builtins))
+    outputs, shells, callbacks = [], [], []
+    for i in range(2):
+        csv_fn = f"{tmpdir}/page{i}-profiling-data.csv"
+        nb = warm_shell.execute_notebook_in_warm_shell(
+            nb_fn, f"{tmpdir}/page{i}.ipynb", cwd=str(tmpdir), profiling_data_fn=csv_fn
+        )
+        assert read_peak_memory(csv_fn) > 0
+        outputs.append(_stdout(nb))
+        shells.append(id(warm_shell.get_warm_shell()))
+        callbacks.append(sum(map(len, warm_shell._SHELL.events.callbacks.values())))
+        warm_shell.reset_warm_shell()
+        # (the shell's builtins, eg __IPYTHON__, do not outlive the notebook)
+        assert vars(builtins) == outer_builtins
+
+    # the second notebook runs in the same shell, but sees none of the first's state
+    assert shells[0] == shells[1]
+    assert outputs[0] == outputs[1]
+    assert "False" in outputs[0] and "already loaded" not in outputs[1]
+    assert callbacks[0] == callbacks[1]
@@ -0,0 +1,89 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from nrsur_catalog import NRsurResult
+from nrsur_catalog_webbuilder import waveform_store
+from nrsur_catalog_webbuilder.waveform_store import WaveformStore, plot_signal
+
+
+class _MockGenerator:
+    def __init__(self, log):
+        self.log = log
+
+    def time_domain_strain(self, params):
+        with open(self.log, "a") as f:
+            f.write(f"{os.getpid()}\n")
+        t = np.linspace(0, 1, 64)
+        return dict(plus=params["amplitude"] * np.sin(2 * np.pi * 5 * t))
+
+
+def _mock_result(path, n=300):
+    outdir = os.path.dirname(path)
+    log = f"{outdir}/calls.log"
+    result = NRsurResult(
+        label="GW150914",
+        outdir=outdir,
+        posterior=pd.DataFrame(
+            dict(amplitude=np.linspace(1, 2, n), log_likelihood=np.linspace(0, 3, n))
+        ),
+        meta_data=dict(
+            likelihood=dict(
+                waveform_generator_class=lambda **kwargs: _MockGenerator(log),
+                duration=1,
+                sampling_frequency=64,
+                start_time=0,
+                frequency_domain_source_model=None,
+                parameter_conversion=None,
+                waveform_arguments=dict(waveform_approximant="NRSur7dq4"),
+            )
+        ),
+    )
+    result.path_to_result = path
+    return result
+
+
+def _calls(result):
+    log = f"{result.outdir}/calls.log"
+    if not os.path.isfile(log):
+        return []
+    return open(log).read().split()
+
+
+def test_waveform_store(tmpdir, monkeypatch):
+    monkeypatch.setattr(waveform_store, "BATCH_SIZE", 10)
+    path = f"{tmpdir}/GW150914_NRSur7dq4.h5"
+    with open(path, "w") as f:
+        f.write("posterior")
+    result = _mock_result(path)
+    store = WaveformStore(f"{tmpdir}/store")
+
+    waveforms = store.waveforms(result, n_samples=100, num_workers=4)
+    assert isinstance(waveforms, np.memmap)
+    assert waveforms.shape == (101, 64)
+    indices = waveform_store.get_sample_indices(result, 100)
+    expected = result.posterior["amplitude"].values[indices[:, None]] * np.sin(
+        2 * np.pi * 5 * np.linspace(0, 1, 64)
+    )
+    np.testing.assert_allclose(waveforms[:-1], expected, rtol=1e-5, atol=1e-6)
+    np.testing.assert_allclose(waveforms[-1].max(), 2, rtol=1e-2)
+    # the batches were computed on the worker pool
+    assert len(set(_calls(result))) > 1
+
+    # re-plotting (eg a new style) reads the stored waveforms
+    os.remove(f"{result.outdir}/calls.log")
+    monkeypatch.setenv("NRSUR_WAVEFORM_STORE", store.dir)
+    fig = plot_signal(
+        result, n_samples=100, outdir=str(tmpdir), kwargs=dict(color="red")
+    )
+    assert os.path.isfile(f"{tmpdir}/GW150914_waveform.png")
+    assert _calls(result) == []
+    # (the stored samples' waveforms, and the maximum likelihood waveform over them)
+    lines = fig.axes[0].get_lines()
+    peaks = np.array([line.get_ydata().max() for line in lines])
+    assert len(lines) in [101, 102]
+    stored_peaks = waveforms[:-1].max(axis=1)
+    assert np.abs(stored_peaks[:, None] - peaks[None, :]).min(axis=1).max() < 1e-6
+    np.testing.assert_allclose(peaks[-1], waveforms[-1].max())
+    assert len(os.listdir(store.dir)) == 1
@@ -0,0 +1,92 @@
+import json
+import os
+
+import numpy as np
+from PIL import Image
+
+from nrsur_catalog_webbuilder import web_images
+from nrsur_catalog_webbuilder.web_images import (
+    RECORD_FN,
+    REPORT_FN,
+    get_web_formats,
+    optimize_web_images,
+    variant_fn,
+)
+
+PAGE = """<html><body>
+<div class="sd-tab-content"><img alt="mass" src="../_images/mass.png" /></div>
+<img src="https://example.com/logo.png" />
+</body></html>"""
+
+
+def _write_plot(fname, width=1200, height=200):
+    rng = np.random.default_rng(0)
+    pixels = np.full((height, width, 3), 255, dtype=np.uint8)
+    pixels[::7, :, :] = rng.integers(0, 255, size=(len(pixels[::7]), width, 3))
+    Image.fromarray(pixels).save(fname, compress_level=1)
+
+
+def test_web_images(tmpdir, monkeypatch):
+    outdir = str(tmpdir)
+    html_dir = os.path.join(outdir, "_build", "html")
+    images_dir = os.path.join(html_dir, "_images")
+    os.makedirs(os.path.join(html_dir, "events"))
+    os.makedirs(images_dir)
+    png_fn = os.path.join(images_dir, "mass.png")
+    _write_plot(png_fn)
+    page_fn = os.path.join(html_dir, "events", "GW150914.html")
+    with open(page_fn, "w") as f:
+        f.write(PAGE)
+    original_size = os.path.getsize(png_fn)
+
+    report = optimize_web_images(outdir, num_workers=1)
+    formats = get_web_formats()
+    assert "webp" in formats
+    for fmt in formats:
+        for width in [480, 960, 1200]:
+            assert os.path.isfile(variant_fn(png_fn, width, fmt))
+        assert not os.path.exists(variant_fn(png_fn, 1600, fmt))
+    assert os.path.getsize(png_fn) < original_size
+    with open(page_fn) as f:
+        html = f.read()
+    assert html.count("<picture>") == 1
+    assert 'srcset="../_images/mass-480w.webp 480w, ../_images/mass-960w.webp 960w' in html
+    assert 'src="../_images/mass.png" loading="lazy" decoding="async" />' in html
+    assert '<img src="https://example.com/logo.png" />' in html
+    assert list(report) == ["events/GW150914.html"] and report["events/GW150914.html"] > 0
+    with open(os.path.join(outdir, REPORT_FN)) as f:
+        assert json.load(f) == report
+    assert os.path.isfile(os.path.join(html_dir, RECORD_FN))
+
+    written = []
+    write_variants = web_images.write_variants
+    monkeypatch.setattr(
+        web_images,
+        "write_variants",
+        lambda *args: written.append(args[0]) or write_variants(*args),
+    )
+
+    # a second run leaves the pages as they are (and reports the same savings)
+    assert optimize_web_images(outdir, num_workers=1) == report
+    with open(page_fn) as f:
+        assert f.read() == html
+    assert written == []
+
+    # a re-copied (unchanged) png is only re-compressed, a changed one is re-made
+    _write_plot(png_fn)
+    optimize_web_images(outdir, num_workers=1)
+    assert written == []
+    _write_plot(png_fn, width=800)
+    optimize_web_images(outdir, num_workers=1)
+    assert written == [png_fn]
+    assert not os.path.exists(variant_fn(png_fn, 960, "webp"))
+
+    # the variants of a removed image are removed
+    os.remove(png_fn)
+    optimize_web_images(outdir, num_workers=1)
+    assert [fn for fn in os.listdir(images_dir)] == []
+
+
+def test_web_images_without_html_build(tmpdir):
+    assert optimize_web_images(str(tmpdir), num_workers=1) == {}
+    assert os.listdir(tmpdir) == []
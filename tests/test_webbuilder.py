@@ -1,5 +1,5 @@
 import unittest
-from nrsur_catalog_webbuilder import build_website
+from nrsur_catalog_webbuilder import build_website, bundle_reader
 from nrsur_catalog_webbuilder.make_pages import make_gw_page, make_events_menu_page
 from nrsur_catalog_webbuilder.utils import get_catalog_summary
 import nrsur_catalog
@@ -7,8 +7,12 @@ import nrsur_catalog
 nrsur_catalog.catalog.DEFAULT_CLEAN_CATALOG = False
 from nrsur_catalog.cache import CatalogCache
 
+import json
 import os
+import sys
 import glob
+import nbformat
+import pytest
 from unittest.mock import patch, PropertyMock
 
 DIR = os.path.dirname(os.path.abspath(__file__))
@@ -43,6 +47,18 @@ def test_gw_page(mock_cache_dir, tmpdir):
     make_gw_page(name, event_ipynb_dir, cache=cache)
     fpath = f"{event_ipynb_dir}/{name}.ipynb"
     assert os.path.exists(fpath)
+    # the build's cells drew the plots, the published notebook has the readers' cells
+    assert os.path.exists(f"{event_ipynb_dir}/{name}_mass_corner.png")
+    notebook = nbformat.read(fpath, as_version=4)
+    sources = "".join(cell.source for cell in notebook.cells)
+    # (with the bundle reader inlined: no webbuilder, nor downloaded code)
+    with open(bundle_reader.__file__) as f:
+        reader = f.read().strip()
+    assert reader in sources
+    assert "nrsur_catalog_webbuilder" not in sources
+    # (only the bundle is downloaded)
+    assert sources.count("urlretrieve(") == reader.count("urlretrieve(")
+    assert "nrsur_result.plot_signal(" in sources
     print(f"ACCESS GWPAGE HERE:\n {fpath}")
 
 
@@ -54,7 +70,55 @@ def test_menu_page(mock_cache_dir, tmpdir):
 
     event_ipynb_dir = tmpdir
     make_events_menu_page(outdir=event_ipynb_dir, cache=cache)
-    assert os.path.exists(f"{event_ipynb_dir}/events/gw_menu_page.ipynb")
+    assert os.path.exists(f"{event_ipynb_dir}/events/gw_menu_page.md")
+
+
+def _mock_compute_event_waveforms(event_name, cache_dir):
+    pass
+
+
+def _mock_make_gw_page(event_name, outdir, **kwargs):
+    # (module-level, so the stubs can be pickled to the build's workers)
+    if os.path.exists(os.path.join(outdir, f"{event_name}.fail")):
+        raise RuntimeError(f"{event_name} failed")
+    with open(os.path.join(outdir, f"{event_name}.ipynb"), "w") as f:
+        f.write("{}")
+
+
+def _mock_make_event_thumbnails(event_name, events_dir):
+    assert os.path.exists(os.path.join(events_dir, f"{event_name}.ipynb"))
+    open(os.path.join(events_dir, f"{event_name}_thumbnail.png"), "w").close()
+
+
+def test_failed_event_exits_nonzero(mock_cache_dir, tmpdir, monkeypatch):
+    from nrsur_catalog_webbuilder.journal import JOURNAL_FN
+
+    module = sys.modules["nrsur_catalog_webbuilder.build_website"]
+    events = CatalogCache(mock_cache_dir).event_names
+    failing = events[0]
+    events_dir = f"{tmpdir}/events"
+    os.makedirs(events_dir)
+    open(f"{events_dir}/{failing}.fail", "w").close()
+
+    monkeypatch.setattr(module, "make_gw_page", _mock_make_gw_page)
+    monkeypatch.setattr(module, "compute_event_waveforms", _mock_compute_event_waveforms)
+    monkeypatch.setattr(module, "make_event_thumbnails", _mock_make_event_thumbnails)
+    argv = ["--event-dir", mock_cache_dir, "--outdir", str(tmpdir), "--shard", "0/1"]
+    monkeypatch.setattr(sys, "argv", ["build_nrsur_website"] + argv)
+    with pytest.raises(SystemExit) as exit_info:
+        module.main()
+    assert exit_info.value.code == 1
+
+    # only the failed page (and its thumbnails) are marked, the other pages finish
+    with open(f"{tmpdir}/{JOURNAL_FN}") as f:
+        journal = {name: task["state"] for name, task in json.load(f).items()}
+    assert journal.pop(f"events/{failing}") == "failed"
+    assert journal.pop(f"thumbnails/{failing}") == "skipped"
+    assert set(journal.values()) == {"done"}
+    for name in events[1:]:
+        assert journal[f"events/{name}"] == journal[f"thumbnails/{name}"] == "done"
+        assert os.path.exists(f"{events_dir}/{name}_thumbnail.png")
+    assert not os.path.exists(f"{events_dir}/{failing}_thumbnail.png")
 
 
 if __name__ == "__main__":